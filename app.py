@@ -1,11 +1,25 @@
+import time
+
+# Taken before anything else is imported, so the startup gauge covers the whole import
+STARTED = time.perf_counter()
+
+import argparse
 import os
+import sys
 import json
 import logging
+from functools import partial
 from quart import Quart, request, Response
 from botbuilder.core import BotFrameworkAdapterSettings, BotFrameworkAdapter
-from botbuilder.schema import Activity
+from botbuilder.schema import Activity, ActivityTypes
+from botframework.connector.auth import JwtTokenValidation
 from dotenv import load_dotenv
 from bot import IngramMicroBot
+from capture import CAPTURE
+from config import CONFIG
+from metrics import REGISTRY, stats_families, track
+from turn_queue import TurnQueue
+from warmup import WarmUp
 
 # Load environment variables
 load_dotenv()
@@ -19,14 +33,44 @@ logger = logging.getLogger(__name__)
 APP_ID = os.getenv("MicrosoftAppId", "")
 APP_PASSWORD = os.getenv("MicrosoftAppPassword", "")
 
+class InstrumentedAdapter(BotFrameworkAdapter):
+    async def send_activities(self, context, activities):
+        with track("send_activity"):
+            return await super().send_activities(context, activities)
+
 # Set up the adapter
 SETTINGS = BotFrameworkAdapterSettings(APP_ID, APP_PASSWORD)
-ADAPTER = BotFrameworkAdapter(SETTINGS)
+ADAPTER = InstrumentedAdapter(SETTINGS)
 
 # Create the bot
 BOT = IngramMicroBot()
+REGISTRY.register_collector(BOT.collect_metrics)
+
+# With ASYNC_TURNS, messages are acknowledged once authenticated and processed by this queue
+TURN_QUEUE = TurnQueue()
+REGISTRY.register_collector(
+    lambda: stats_families("apollobot_turn_queue", "queue", {"turns": TURN_QUEUE.stats()}, "Asynchronous turn queue"))
+REGISTRY.register_collector(
+    lambda: stats_families("apollobot_capture", "capture", {"traffic": CAPTURE.stats()}, "Traffic capture for replay"))
+
+WARMUP = WarmUp({
+    "ingram_token": BOT.ensure_access_token,
+    # Authenticates the Graph session, then downloads (or maps) the workbook and builds the index
+    "excel_catalog": BOT.excel_catalog.load,
+    # openai is imported lazily; get it loaded before the first question
+    "openai_client": BOT.get_openai_client,
+}, timeout=CONFIG.WARMUP_TIMEOUT, on_ready=lambda: record_startup("ready"))
+
+STARTUP_SECONDS = REGISTRY.gauge("apollobot_startup_seconds",
+                                 "Seconds from the start of `import app` to each startup phase", ("phase",))
+
+def record_startup(phase):
+    seconds = time.perf_counter() - STARTED
+    STARTUP_SECONDS.set(seconds, phase=phase)
+    logger.info(f"Startup phase {phase} reached after {seconds:.3f}s")
 
 app = Quart(__name__)
+record_startup("imported")
 
 @app.route("/", methods=["GET"])
 async def root():
@@ -40,25 +84,105 @@ async def messages():
     body = await request.get_data()
     
     try:
-        activity = Activity().deserialize(json.loads(body))
+        with track("deserialize_activity"):
+            activity = Activity().deserialize(json.loads(body))
     except Exception as e:
         logger.error(f"Failed to deserialize activity: {e}")
         return Response(status=400)
 
     auth_header = request.headers.get("Authorization", "")
 
+    if CONFIG.ASYNC_TURNS and activity.type == ActivityTypes.message:
+        return await enqueue_turn(activity, auth_header)
+
     try:
-        response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
+        with CAPTURE.turn(activity), track("process_activity"):
+            response = await ADAPTER.process_activity(activity, auth_header, BOT.on_turn)
         if response:
-            return Response(json.dumps(response), status=200, mimetype='application/json')
+            # Invoke activities (such as a Teams file consent answer) get the handler's status and body
+            body = json.dumps(response.body) if response.body is not None else ""
+            return Response(body, status=response.status, mimetype='application/json')
         return Response(status=200)
     except Exception as e:
         logger.error(f"Error processing activity: {e}")
         return Response(status=500)
 
+async def authenticate(activity, auth_header):
+    claims = await JwtTokenValidation.authenticate_request(
+        activity,
+        auth_header,
+        SETTINGS.credential_provider,
+        await SETTINGS.channel_provider.get_channel_service(),
+        SETTINGS.auth_configuration,
+    )
+    if not claims.is_authenticated:
+        raise PermissionError("Unauthorized Access. Request is not authorized")
+    return claims
+
+async def enqueue_turn(activity, auth_header):
+    try:
+        identity = await authenticate(activity, auth_header)
+    except Exception as e:
+        logger.warning(f"Rejected unauthenticated activity: {e}")
+        return Response(status=401)
+
+    # Replies are sent to the activity's serviceUrl once a worker runs the turn;
+    # a conversation's turns run in order, so "next" follows its search
+    conversation_id = activity.conversation.id if activity.conversation else None
+    if not TURN_QUEUE.submit(partial(process_queued_turn, activity, identity), key=conversation_id):
+        logger.warning("Turn queue is full, rejecting activity")
+        return Response(response="Bot is busy, please retry", status=503, headers={"Retry-After": "1"})
+    return Response(status=202)
+
+async def process_queued_turn(activity, identity):
+    with CAPTURE.turn(activity), track("process_activity"):
+        await ADAPTER.process_activity_with_identity(activity, identity, BOT.on_turn)
+
 @app.route("/health", methods=["GET"])
 async def health_check():
     return Response(status=200)
 
+# /health is liveness only; this tells whether the instance is warm enough for traffic
+@app.route("/ready", methods=["GET"])
+async def readiness_check():
+    ready = WARMUP.ready or not CONFIG.WARMUP
+    return Response(json.dumps(WARMUP.status()), status=200 if ready else 503, mimetype="application/json")
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    return Response(REGISTRY.render(), status=200, mimetype="text/plain; version=0.0.4")
+
+@app.before_serving
+async def startup():
+    record_startup("serving")
+    if not CONFIG.WARMUP:
+        return
+    if CONFIG.WARMUP_BLOCKING:
+        await WARMUP.run()
+    else:
+        WARMUP.start()
+
+@app.after_serving
+async def shutdown():
+    WARMUP.stop()
+    await TURN_QUEUE.stop()
+    BOT.excel_catalog.stop()
+    BOT.token_manager.close()
+    BOT.ingram.close()
+    BOT.excel_api.graph.close()
+    BOT.conversation_state.close()
+    CAPTURE.close()
+
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the bot with Quart's development server")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="Report where `import app` spends its time (-X importtime) and exit")
+    parser.add_argument("--top", type=int, default=20, help="Packages and imports listed by --profile-startup")
+    parser.add_argument("--json", help="Also write the startup profile to this file")
+    parser.add_argument("--fail-seconds", type=float, help="Exit non-zero if `import app` takes longer than this")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        import startup_profile
+        sys.exit(startup_profile.main("app", args.top, args.json, args.fail_seconds))
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
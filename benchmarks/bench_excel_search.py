@@ -0,0 +1,85 @@
+"""Compare Excel catalog search strategies on a synthetic sheet.
+
+    python benchmarks/bench_excel_search.py --rows 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from excel_search import ExcelSearchIndex, VectorizedExcelSearch, apply_search  # noqa: E402
+
+WORDS = [
+    "laptop", "notebook", "cable", "usb-c", "hdmi", "monitor", "docking", "station", "adapter", "keyboard",
+    "mouse", "wireless", "ethernet", "switch", "router", "ssd", "nvme", "1tb", "512gb", "ddr5", "memory",
+    "server", "rack", "ups", "battery", "charger", "65w", "headset", "webcam", "printer", "toner", "black",
+    "i5", "i7", "ryzen", "thinkpad", "latitude", "elitebook", "surface", "macbook", "ipad", "tablet",
+]
+CATEGORIES = ["Computers", "Accessories", "Networking", "Storage", "Power", "Printing", "Audio/Video"]
+SUB_CATEGORIES = ["Notebooks", "Cables", "Docks", "Drives", "Switches", "Batteries", "Toner", "Headsets"]
+
+QUERIES = ["cable", "usb-c cable", "laptop i7 16gb", "dock", "thinkpad 512gb ssd", "ups battery", "zzz-no-match", "a"]
+
+
+def synthetic_sheet(rows, seed=7):
+    rng = random.Random(seed)
+    descriptions = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12))) + f" {rng.randint(4, 64)}GB"
+        for _ in range(rows)
+    ]
+    return pd.DataFrame({
+        "Part Number": [f"SKU{i:07d}" for i in range(rows)],
+        "Description": descriptions,
+        "Category": [rng.choice(CATEGORIES) for _ in range(rows)],
+        "Sub Category": [rng.choice(SUB_CATEGORIES) for _ in range(rows)],
+        "Price": np.round(np.random.default_rng(seed).uniform(5, 3000, rows), 2),
+    })
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def index_search(df, index, query):
+    index.rows_for_keyword.cache_clear()  # Measure cold lookups, not the keyword cache
+    return df.iloc[index.search(query)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df = synthetic_sheet(args.rows)
+    print(f"Synthetic sheet: {len(df)} rows")
+
+    build_seconds, index = timed(lambda: ExcelSearchIndex(df), 1)
+    print(f"Index build: {build_seconds * 1000:.1f} ms ({len(index.tokens)} tokens)")
+    build_seconds, vectorized = timed(lambda: VectorizedExcelSearch(df), 1)
+    print(f"Vectorized search text build: {build_seconds * 1000:.1f} ms\n")
+
+    print(f"{'query':<24}{'matches':>9}{'apply ms':>11}{'vector ms':>11}{'index ms':>11}{'speedup':>9}")
+    for query in QUERIES:
+        apply_seconds, expected = timed(lambda: apply_search(df, query), args.repeat)
+        vector_seconds, vector_rows = timed(lambda: df.iloc[vectorized.search(query)], args.repeat)
+        index_seconds, index_rows = timed(lambda: index_search(df, index, query), args.repeat)
+        assert vector_rows.index.equals(expected.index), f"Vectorized result mismatch for {query!r}"
+        assert index_rows.index.equals(expected.index), f"Index result mismatch for {query!r}"
+        print(f"{query:<24}{len(expected):>9}{apply_seconds * 1000:>11.1f}{vector_seconds * 1000:>11.2f}"
+              f"{index_seconds * 1000:>11.2f}{apply_seconds / max(index_seconds, 1e-9):>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
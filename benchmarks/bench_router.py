@@ -0,0 +1,102 @@
+"""Benchmark command routing against the previous if/elif chain.
+
+    python benchmarks/bench_router.py --iterations 200000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from router import CommandRouter  # noqa: E402
+
+MESSAGES = [
+    "search for product ThinkPad X1 Carbon",
+    "search for available usb-c dock",
+    "search for the best laptop for video editing",
+    "excel search for cable cat6",
+    "price and availability for 6YE881",
+    "next",
+    "previous",
+    "what is the difference between i5 and i7?",
+]
+
+
+def legacy_route(message_text):
+    """The handlers the previous on_message_activity ran for a message."""
+    called = []
+    lower_message = message_text.lower()
+    if (lower_message.startswith("search for ") and
+            not lower_message.startswith("search for product ") and
+            not lower_message.startswith("search for available ")):
+        called.append("generic_question")
+    if message_text.lower().startswith("excel search for "):
+        called.append("excel_search")
+        return called
+    if message_text.lower().startswith("price and availability for "):
+        called.append("price_and_availability")
+    elif message_text.lower().startswith("search for available "):
+        called.append("search_available")
+    elif message_text.lower().startswith("search for product "):
+        called.append("search_product")
+    elif message_text.lower() == "next":
+        called.append("next")
+    elif message_text.lower() == "previous":
+        called.append("previous")
+    else:
+        called.append("generic_question")
+    return called
+
+
+def build_router():
+    async def handler(turn_context, argument):
+        return argument
+
+    router = CommandRouter(handler, fallback_name="generic_question")
+    router.prefix("excel search for ", "excel_search", handler)
+    router.prefix("price and availability for ", "price_and_availability", handler)
+    router.prefix("search for available ", "search_available", handler)
+    router.prefix("search for product ", "search_product", handler)
+    router.prefix("search for ", "generic_search", handler)
+    router.exact("next", "next", handler)
+    router.exact("previous", "previous", handler)
+    return router
+
+
+def bench(func, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(MESSAGES[i % len(MESSAGES)])
+    return (time.perf_counter() - start) / iterations
+
+
+async def bench_dispatch(router, iterations):
+    start = time.perf_counter()
+    for i in range(iterations):
+        await router.dispatch(None, MESSAGES[i % len(MESSAGES)])
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200_000)
+    args = parser.parse_args()
+
+    router = build_router()
+
+    print(f"{'message':<48}{'legacy handlers':<42}{'router'}")
+    for message in MESSAGES:
+        print(f"{message:<48}{', '.join(legacy_route(message)):<42}{router.match(message)[0]}")
+
+    legacy = bench(legacy_route, args.iterations)
+    routed = bench(router.match, args.iterations)
+    dispatched = asyncio.run(bench_dispatch(router, args.iterations))
+    print(f"\nlegacy if-chain:        {legacy * 1e6:.2f} us/message")
+    print(f"router.match:           {routed * 1e6:.2f} us/message")
+    print(f"router.dispatch (noop): {dispatched * 1e6:.2f} us/message (includes latency recording)")
+
+
+if __name__ == "__main__":
+    main()
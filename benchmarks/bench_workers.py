@@ -0,0 +1,171 @@
+"""Measure throughput scaling of hypercorn workers (deploy.sh --workers).
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --duration 20
+
+For each worker count the app is served by hypercorn on a local port, with
+Ingram, OpenAI and the connector faked by this process and Graph faked in
+the workers (fake_app.py). Client processes post one command at a fixed
+concurrency; the default is an Excel search, which is CPU bound and shows
+how well work spreads across cores. The workers share caches, the token and
+the Excel snapshot through a fresh SHARED_STATE_DIR per run.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_excel_search import synthetic_sheet  # noqa: E402
+from fakes import FakeConnector, FakeIngram, FakeOpenAI, FakeServers, synthetic_workbook  # noqa: E402
+from loadtest import KEYWORDS, activity, percentile  # noqa: E402
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_healthy(url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy within {timeout}s")
+
+
+async def _drive(url, service_url, command, concurrency, duration, client_id):
+    import aiohttp
+
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+    headers = {"Content-Type": "application/json"}
+
+    async def user(session, conversation_id):
+        nonlocal errors
+        i = 0
+        while time.monotonic() < deadline:
+            text = command.format(keyword=KEYWORDS[i % len(KEYWORDS)])
+            i += 1
+            start = time.perf_counter()
+            async with session.post(f"{url}/api/messages", headers=headers,
+                                    data=json.dumps(activity(service_url, conversation_id, text))) as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(user(session, f"bench-{client_id}-{i}") for i in range(concurrency)))
+    return latencies, errors
+
+
+def drive(args):
+    return asyncio.run(_drive(*args))
+
+
+def run_load(url, service_url, command, clients, concurrency, duration):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(clients) as pool:
+        jobs = [(url, service_url, command, concurrency, duration, i) for i in range(clients)]
+        results = pool.map(drive, jobs)
+    latencies = [latency for result, _ in results for latency in result]
+    errors = sum(errors for _, errors in results)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of measured load per run")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of unmeasured load per run")
+    parser.add_argument("--clients", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="Conversations per client process")
+    parser.add_argument("--command", default="excel search for {keyword}")
+    parser.add_argument("--excel-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    servers = FakeServers()
+    ingram_url = servers.start(FakeIngram(latency=0.05).app())
+    openai_url = servers.start(FakeOpenAI(latency=0.3).app())
+    connector_url = servers.start(FakeConnector().app())
+
+    workbook = tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False)
+    workbook.write(synthetic_workbook(synthetic_sheet(args.excel_rows)))
+    workbook.close()
+
+    cpus = os.cpu_count() or 1
+    print(f"{cpus} CPUs, command {args.command!r}, "
+          f"{args.clients}x{args.concurrency} conversations, {args.duration}s per run\n")
+    if max(args.workers) > cpus:
+        # The workers and the load generators then share cores, so the runs show contention, not scaling
+        print(f"Warning: this host has {cpus} CPUs, so runs with more workers than that can't show scaling; "
+              "measure on a host with a core per worker\n")
+    print(f"{'workers':>8}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50_ms':>10}{'p95_ms':>10}"
+          f"{'p99_ms':>10}{'speedup':>10}{'efficiency':>12}")
+
+    baseline = None
+    try:
+        for workers in args.workers:
+            shared_dir = tempfile.mkdtemp(prefix="apollobot-bench-")
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            env = dict(
+                os.environ,
+                WORKERS=str(workers),
+                SHARED_STATE_DIR=shared_dir,
+                EXCEL_SNAPSHOT_DIR=shared_dir,
+                FAKE_WORKBOOK=workbook.name,
+                INGRAM_API_HOST=ingram_url,
+                INGRAM_AUTH_HOST=ingram_url,
+                INGRAM_CLIENT_ID="bench",
+                INGRAM_CLIENT_SECRET="bench",
+                OPENAI_API_KEY="bench",
+                OPENAI_BASE_URL=f"{openai_url}/v1",
+                MicrosoftAppId="",
+                MicrosoftAppPassword="",
+                LOG_LEVEL="WARNING",
+            )
+            with open(os.path.join(shared_dir, "hypercorn.log"), "w") as log:
+                server = subprocess.Popen(
+                    [sys.executable, "-m", "hypercorn", "fake_app:app", "--bind", f"127.0.0.1:{port}",
+                     "--workers", str(workers)],
+                    cwd=BENCHMARKS_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+                try:
+                    wait_until_healthy(url)
+                    run_load(url, connector_url, args.command, args.clients, args.concurrency, args.warmup)
+                    latencies, errors = run_load(
+                        url, connector_url, args.command, args.clients, args.concurrency, args.duration)
+                finally:
+                    server.terminate()
+                    server.wait(timeout=30)
+
+            throughput = len(latencies) / args.duration
+            baseline = baseline or throughput / workers
+            speedup = throughput / baseline
+            print(f"{workers:>8}{len(latencies):>10}{errors:>8}{throughput:>10.1f}"
+                  f"{percentile(latencies, 0.50) * 1000:>10.1f}{percentile(latencies, 0.95) * 1000:>10.1f}"
+                  f"{percentile(latencies, 0.99) * 1000:>10.1f}{speedup:>10.2f}{speedup / workers:>12.0%}"
+                  + ("  (more workers than CPUs)" if workers > cpus else ""))
+    finally:
+        servers.stop()
+        os.unlink(workbook.name)
+
+
+if __name__ == "__main__":
+    main()
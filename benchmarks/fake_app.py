@@ -0,0 +1,20 @@
+"""The Quart app with Graph replaced by FakeGraphClient, for the hypercorn
+workers started by bench_workers.py.
+
+FAKE_WORKBOOK is the path of the xlsx to serve; the other services are
+pointed at their fakes through the usual environment variables.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as apollobot  # noqa: E402
+from fakes import FakeGraphClient  # noqa: E402
+
+with open(os.environ["FAKE_WORKBOOK"], "rb") as f:
+    apollobot.BOT.excel_api.graph._client = FakeGraphClient(
+        f.read(), latency=float(os.environ.get("FAKE_GRAPH_LATENCY", 0.1)))
+
+app = apollobot.app
@@ -0,0 +1,281 @@
+"""Local stand-ins for the services the bot talks to, used by loadtest.py.
+
+The HTTP fakes (Ingram, OpenAI, the Bot Framework connector) run on their own
+event loop in a background thread, so their work doesn't show up as lag on
+the loop under test. GraphClient has its endpoint hard-coded, so the Graph
+fake is a client object installed on the bot's GraphSession instead.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from io import BytesIO
+
+from aiohttp import web
+
+
+class FakeIngram:
+    """Token, catalog search and price-and-availability endpoints.
+
+    `slow_ratio` of the search and price-and-availability calls take
+    `slow_latency` instead of `latency`, like a flaky upstream's tail.
+    """
+
+    def __init__(self, latency=0.05, records_found=1000, slow_ratio=0.0, slow_latency=1.0, seed=7):
+        self.latency = latency
+        self.records_found = records_found
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.random = random.Random(seed)
+        self.calls = Counter()
+
+    def _delay(self):
+        if self.random.random() < self.slow_ratio:
+            self.calls["slow"] += 1
+            return self.slow_latency
+        return self.latency
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/oauth/oauth20/token", self.token)
+        app.router.add_get("/resellers/v6/catalog", self.search)
+        app.router.add_post("/resellers/v6/catalog/priceandavailability", self.price_and_availability)
+        return app
+
+    async def token(self, request):
+        self.calls["token"] += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response({
+            "access_token": f"token-{self.calls['token']}",
+            "token_type": "Bearer",
+            "expires_in": "86399",
+        })
+
+    async def search(self, request):
+        self.calls["search"] += 1
+        page = int(request.query.get("pageNumber", 1))
+        size = int(request.query.get("pageSize", 10))
+        keyword = request.query.get("keyword", "")
+        await asyncio.sleep(self.search_latency(keyword, page, size))
+        return web.json_response(self.catalog_page(keyword, page, size))
+
+    async def price_and_availability(self, request):
+        self.calls["price_and_availability"] += 1
+        body = await request.json()
+        part_numbers = [product["ingramPartNumber"] for product in body["products"]]
+        await asyncio.sleep(self.price_and_availability_latency(part_numbers))
+        return web.json_response([self.product_entry(part_number) for part_number in part_numbers])
+
+    # Overridden by replay.py to serve recorded responses
+
+    def search_latency(self, keyword, page, size):
+        return self._delay()
+
+    def price_and_availability_latency(self, part_numbers):
+        return self._delay()
+
+    def catalog_page(self, keyword, page, size):
+        catalog = [{
+            "description": f"{keyword} product {page}-{i}",
+            "ingramPartNumber": f"P{page:03d}{i:03d}",
+            "vendorName": "Vendor",
+            "vendorPartNumber": f"VP{page:03d}{i:03d}",
+            "category": "Computers",
+            "subCategory": "Notebooks",
+            "productType": "IM::physical",
+            "upcCode": "000000000000",
+        } for i in range(size)]
+        return {
+            "recordsFound": self.records_found,
+            "pageSize": size,
+            "pageNumber": page,
+            "catalog": catalog,
+        }
+
+    def product_entry(self, part_number):
+        quantity = sum(map(ord, part_number)) % 3 * 5
+        return {
+            "ingramPartNumber": part_number,
+            "vendorPartNumber": "VP" + part_number,
+            "description": "Product " + part_number,
+            "productStatusCode": "W",
+            "availability": {
+                "available": quantity > 0,
+                "totalAvailability": quantity,
+                "availabilityByWarehouse": [{"location": "Mira Loma, CA", "quantityAvailable": quantity}],
+            },
+            "pricing": {"currencyCode": "USD", "retailPrice": 129.99, "customerPrice": 99.5},
+        }
+
+
+class FakeOpenAI:
+    """A streaming chat completions endpoint."""
+
+    def __init__(self, latency=0.3, chunks=30):
+        self.latency = latency
+        self.chunks = chunks
+        self.calls = Counter()
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        return app
+
+    async def chat_completions(self, request):
+        self.calls["chat_completions"] += 1
+        body = await request.json()
+        question = body["messages"][-1]["content"]
+        parts = self.answer_parts(question)
+        delay = self.completion_latency(question) / len(parts)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for part in parts:
+            await asyncio.sleep(delay)
+            chunk = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "delta": {"content": part}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def completion_latency(self, question):
+        return self.latency
+
+    def answer_parts(self, question):
+        return [f"{question} ({i}) " for i in range(self.chunks)]
+
+
+class FakeConnector:
+    """The Bot Framework connector replies are posted to (the activity's serviceUrl).
+
+    Keeps the text of the messages sent to each conversation, so callers can
+    check what the bot answered.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.replies = defaultdict(list)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_route("*", "/v3/conversations/{tail:.*}", self.activities)
+        return app
+
+    async def activities(self, request):
+        body = await request.json()
+        self.calls[body.get("type", "message")] += 1
+        if body.get("type", "message") == "message":
+            self.replies[(body.get("conversation") or {}).get("id")].append(body.get("text") or "")
+        return web.json_response({"id": f"reply-{sum(self.calls.values())}"})
+
+
+class FakeServers:
+    """Runs aiohttp applications on ephemeral ports on a background event loop."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="fake-servers", daemon=True)
+        self.runners = []
+
+    def start(self, app):
+        """Serve `app` and return its base URL."""
+        if not self.thread.is_alive():
+            self.thread.start()
+        return asyncio.run_coroutine_threadsafe(self._start(app), self.loop).result()
+
+    async def _start(self, app):
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self.runners.append(runner)
+        host, port = runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        async def _stop():
+            for runner in self.runners:
+                await runner.cleanup()
+        asyncio.run_coroutine_threadsafe(_stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def synthetic_workbook(df):
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+class _Query:
+    def __init__(self, graph, name, result):
+        self.graph = graph
+        self.name = name
+        self.result = result
+
+    def get(self):
+        return self
+
+    def execute_query(self):
+        self.graph.calls[self.name] += 1
+        time.sleep(self.graph.latency)
+        return self.result()
+
+
+class _Object:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class FakeGraphClient:
+    """The subset of office365's GraphClient that GraphSession uses.
+
+    Serves one workbook; assign `content` (and bump `etag`) to simulate an
+    edit of the SharePoint file.
+    """
+
+    def __init__(self, content, latency=0.1, etag="v1"):
+        self.content = content
+        self.latency = latency
+        self.etag = etag
+        self.calls = Counter()
+        self.sites = _FakeSites(self)
+        self.drives = {"drive-1": _FakeDrive(self)}
+
+    def file(self):
+        return _Object(
+            id="item-1",
+            etag=self.etag,
+            properties={"cTag": self.etag},
+            last_modified_datetime="2024-01-01T00:00:00Z",
+        )
+
+
+class _FakeSites:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def get_by_url(self, url):
+        return _Query(self.graph, "site", lambda: _Object(id="site-1"))
+
+    def __getitem__(self, site_id):
+        return _Object(drives=_Query(self.graph, "drives", lambda: [_FakeDrive(self.graph)]))
+
+
+class _FakeDrive:
+    id = "drive-1"
+
+    def __init__(self, graph):
+        self.root = _Object(get_by_path=lambda path: _Query(graph, "resolve_path", graph.file))
+        item = _Object(
+            get=lambda: _Query(graph, "item", graph.file),
+            get_content=lambda: _Query(graph, "download", lambda: graph.content),
+        )
+        self.items = {"item-1": item}
@@ -0,0 +1,257 @@
+"""Load-test the Quart app in-process against local fakes of its dependencies.
+
+    python benchmarks/loadtest.py --requests 200 --concurrency 20
+    python benchmarks/loadtest.py --ingram-latency 0.2 --json results.json --fail-p95 2000 --fail-on-errors
+
+Each command is driven through /api/messages with Bot Framework activities
+from `--concurrency` simulated conversations. Reports throughput, latency
+percentiles and event-loop lag (how late a 10ms timer fires) per command.
+The bot answers 200 even when a handler fails (it replies with an apology),
+so a request also counts as an error unless one of the replies it caused
+looks like that command's answer.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_excel_search import synthetic_sheet  # noqa: E402
+from fakes import FakeConnector, FakeGraphClient, FakeIngram, FakeOpenAI, FakeServers, synthetic_workbook  # noqa: E402
+
+KEYWORDS = ["laptop", "usb-c dock", "monitor 27", "thinkpad", "ethernet switch", "ssd 1tb", "headset", "toner"]
+QUESTIONS = [
+    "What is the difference between i5 and i7?",
+    "Is DDR5 faster than DDR4?",
+    "What does NVMe mean?",
+    "How much RAM do I need for video editing?",
+]
+
+# Ordered so "next"/"previous" page through the searches made before them.
+# The pattern is what a successful reply to the command contains.
+SCENARIOS = [
+    ("search_product", lambda rng: f"search for product {rng.choice(KEYWORDS)}", r"^Search results for '"),
+    ("next", lambda rng: "next", r"^Search results for '"),
+    # A conversation may page back more often than it paged forward
+    ("previous", lambda rng: "previous", r"^Search results for '|^You are already on the first page"),
+    ("search_available", lambda rng: f"search for available {rng.choice(KEYWORDS)}", r"^Search results for '"),
+    ("price_and_availability", lambda rng: f"price and availability for P001{rng.randrange(200):03d}",
+     r"\*\*Ingram Part Number\*\*: P001\d{3}"),
+    # The synthetic sheet doesn't contain every keyword
+    ("excel_search", lambda rng: f"excel search for {rng.choice(KEYWORDS)}",
+     r"^Search results for '|^No products found matching '"),
+    ("generic_question", lambda rng: rng.choice(QUESTIONS), r"Remember: You can search for specific products"),
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def activity(service_url, conversation_id, text):
+    return {
+        "type": "message",
+        "id": str(uuid.uuid4()),
+        "timestamp": "2024-01-01T00:00:00.000Z",
+        "channelId": "msteams",
+        "serviceUrl": service_url,
+        "from": {"id": f"user-{conversation_id}", "name": "Load Test"},
+        "recipient": {"id": "apollobot", "name": "Apollobot"},
+        "conversation": {"id": conversation_id, "conversationType": "personal"},
+        "text": text,
+        "textFormat": "plain",
+        "locale": "en-US",
+    }
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop runs a timer; samples go to the current phase."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - expected, 0.0))
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    def take(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+    def stop(self):
+        self._task.cancel()
+
+
+async def run_scenario(client, connector, service_url, make_text, expected, requests, concurrency, rng):
+    latencies = []
+    errors = 0
+    unexpected = {}
+    remaining = itertools.count()
+    headers = {"Content-Type": "application/json"}
+    expected = re.compile(expected)
+
+    async def user(conversation_id):
+        nonlocal errors
+        replies = connector.replies[conversation_id]
+        while next(remaining) < requests:
+            body = json.dumps(activity(service_url, conversation_id, make_text(rng)))
+            sent = len(replies)
+            start = time.perf_counter()
+            response = await client.post("/api/messages", data=body, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            # Replies are posted to the connector before the turn's response returns
+            answers = replies[sent:]
+            if response.status_code != 200 or not any(expected.search(answer) for answer in answers):
+                errors += 1
+                unexpected.setdefault(response.status_code, answers[:1])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(f"loadtest-{i}") for i in range(concurrency)))
+    return latencies, errors, unexpected, time.perf_counter() - start
+
+
+async def run(args, servers, graph):
+    # Imported after the environment points the bot at the fakes
+    import app as apollobot
+
+    apollobot.BOT.excel_api.graph._client = graph
+    connector = FakeConnector()
+    connector_url = servers.start(connector.app())
+    rng = random.Random(args.seed)
+    results = {}
+
+    async with apollobot.app.test_app() as test_app:
+        client = test_app.test_client()
+        # Production traffic only arrives once /ready passes, so measure a warmed-up instance
+        await apollobot.WARMUP.start()
+        monitor = LoopLagMonitor()
+        monitor.start()
+        for name, make_text, expected in SCENARIOS:
+            if args.only and name not in args.only:
+                continue
+            monitor.take()
+            latencies, errors, unexpected, elapsed = await run_scenario(
+                client, connector, connector_url, make_text, expected, args.requests, args.concurrency, rng)
+            lag = monitor.take()
+            for status, answers in unexpected.items():
+                print(f"{name}: unexpected answer (HTTP {status}): {(answers or ['no reply'])[0][:200]!r}")
+            results[name] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "throughput": len(latencies) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "max_ms": max(latencies, default=0.0) * 1000,
+                "loop_lag_p99_ms": percentile(lag, 0.99) * 1000,
+                "loop_lag_max_ms": max(lag, default=0.0) * 1000,
+            }
+        monitor.stop()
+    return results
+
+
+def report(results):
+    columns = ["requests", "errors", "throughput", "p50_ms", "p95_ms", "p99_ms", "max_ms",
+               "loop_lag_p99_ms", "loop_lag_max_ms"]
+    print(f"{'command':<24}" + "".join(f"{column:>16}" for column in columns))
+    for name, result in results.items():
+        print(f"{name:<24}" + "".join(
+            f"{result[column]:>16.1f}" if isinstance(result[column], float) else f"{result[column]:>16}"
+            for column in columns
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per command")
+    parser.add_argument("--concurrency", type=int, default=20, help="Simultaneous conversations")
+    parser.add_argument("--only", nargs="*", choices=[name for name, _, _ in SCENARIOS])
+    parser.add_argument("--ingram-latency", type=float, default=0.05, help="Seconds per fake Ingram call")
+    parser.add_argument("--ingram-slow-ratio", type=float, default=0.0,
+                        help="Share of fake Ingram calls that take --ingram-slow-latency")
+    parser.add_argument("--ingram-slow-latency", type=float, default=1.0)
+    parser.add_argument("--graph-latency", type=float, default=0.1, help="Seconds per fake Graph call")
+    parser.add_argument("--openai-latency", type=float, default=0.3, help="Seconds per fake completion")
+    parser.add_argument("--excel-rows", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--fail-p95", type=float, help="Exit non-zero if any command's p95 exceeds this (ms)")
+    parser.add_argument("--fail-on-errors", action="store_true",
+                        help="Exit non-zero if any request failed or got an unexpected answer")
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    servers = FakeServers()
+    ingram = FakeIngram(latency=args.ingram_latency, slow_ratio=args.ingram_slow_ratio,
+                        slow_latency=args.ingram_slow_latency, seed=args.seed)
+    openai = FakeOpenAI(latency=args.openai_latency)
+    ingram_url = servers.start(ingram.app())
+    openai_url = servers.start(openai.app())
+    graph = FakeGraphClient(synthetic_workbook(synthetic_sheet(args.excel_rows)), latency=args.graph_latency)
+
+    os.environ.update({
+        "INGRAM_API_HOST": ingram_url,
+        "INGRAM_AUTH_HOST": ingram_url,
+        "INGRAM_CLIENT_ID": "loadtest",
+        "INGRAM_CLIENT_SECRET": "loadtest",
+        "OPENAI_API_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "EXCEL_SNAPSHOT_DIR": tempfile.mkdtemp(prefix="apollobot-loadtest-"),
+        "MicrosoftAppId": "",
+        "MicrosoftAppPassword": "",
+    })
+
+    try:
+        results = asyncio.run(run(args, servers, graph))
+    finally:
+        servers.stop()
+
+    report(results)
+    calls = {**ingram.calls, **openai.calls, **{f"graph_{k}": v for k, v in graph.calls.items()}}
+    print("\nupstream calls: " + ", ".join(f"{name}={count}" for name, count in sorted(calls.items())))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "upstream_calls": calls, "args": vars(args)}, f, indent=2)
+
+    failed = False
+    if args.fail_on_errors:
+        erroring = [name for name, result in results.items() if result["errors"]]
+        if erroring:
+            print(f"Errors or unexpected answers: {', '.join(erroring)}")
+            failed = True
+    if args.fail_p95 is not None:
+        slow = [name for name, result in results.items() if result["p95_ms"] > args.fail_p95]
+        if slow:
+            print(f"p95 above {args.fail_p95}ms: {', '.join(slow)}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
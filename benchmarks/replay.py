@@ -0,0 +1,265 @@
+"""Replay a traffic capture against a local instance, with recorded upstream responses.
+
+    CAPTURE=true CAPTURE_SAMPLE_RATE=0.05 hypercorn app:app ...   # in production
+    python benchmarks/replay.py capture.jsonl --json replay.json
+    python benchmarks/replay.py capture.jsonl --speed 0 --concurrency 20 --baseline replay.json
+
+The captured messages are posted to /api/messages in their recorded order
+and spacing (--speed 2 replays twice as fast; 0 sends each conversation's
+turns back to back, --concurrency conversations at a time). Ingram and
+OpenAI answer with the captured responses after the captured latency; calls
+that were not captured fall back to the synthetic fakes at the median
+captured latency. Graph serves a synthetic workbook at the captured download
+latency, and attachments are dropped since their URLs aren't captured.
+
+Reports each command's captured and replayed latency percentiles, and with
+--baseline how the replay compares with an earlier run's --json output.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_excel_search import synthetic_sheet  # noqa: E402
+from fakes import FakeConnector, FakeGraphClient, FakeIngram, FakeOpenAI, FakeServers, synthetic_workbook  # noqa: E402
+from loadtest import activity, percentile  # noqa: E402
+
+
+def load_capture(path):
+    turns = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                turn = json.loads(line)
+            except ValueError:
+                print(f"Skipping unreadable line {number}")
+                continue
+            if turn["activity"].get("type") == "message" and turn["activity"].get("text"):
+                turns.append(turn)
+    turns.sort(key=lambda turn: turn["time"])
+    return turns
+
+
+def captured_calls(turns, name):
+    return [call for turn in turns for call in turn["calls"] if call["name"] == name and "error" not in call]
+
+
+def median_duration(calls, default):
+    return statistics.median(call["duration"] for call in calls) if calls else default
+
+
+class RecordedIngram(FakeIngram):
+    """Search pages and price-and-availability entries from a capture."""
+
+    def __init__(self, turns, latency=0.05):
+        super().__init__(latency=latency)
+        searches = captured_calls(turns, "ingram_search")
+        lookups = captured_calls(turns, "ingram_price_and_availability")
+        self.pages = {}
+        for call in searches:
+            request = call["request"]
+            if "response" in call:
+                key = (request["keyword"], request["page_number"], request["page_size"])
+                self.pages[key] = (call["response"], call["duration"])
+        self.entries = {}
+        for call in lookups:
+            for entry in call.get("response") or []:
+                if entry.get("ingramPartNumber"):
+                    self.entries[entry["ingramPartNumber"].upper()] = entry
+        self.search_median = median_duration(searches, latency)
+        self.lookup_median = median_duration(lookups, latency)
+        self.lookup_durations = {tuple(call["request"]["part_numbers"]): call["duration"] for call in lookups}
+
+    def search_latency(self, keyword, page, size):
+        recorded = self.pages.get((keyword, page, size))
+        self.calls["search_recorded" if recorded else "search_synthetic"] += 1
+        return recorded[1] if recorded else self.search_median
+
+    def catalog_page(self, keyword, page, size):
+        recorded = self.pages.get((keyword, page, size))
+        return recorded[0] if recorded else super().catalog_page(keyword, page, size)
+
+    def price_and_availability_latency(self, part_numbers):
+        # Batches may be split differently on replay, so only an identical batch gets its own timing
+        return self.lookup_durations.get(tuple(part_numbers), self.lookup_median)
+
+    def product_entry(self, part_number):
+        entry = self.entries.get(part_number.upper())
+        self.calls["entries_recorded" if entry else "entries_synthetic"] += 1
+        return entry or super().product_entry(part_number)
+
+
+class RecordedOpenAI(FakeOpenAI):
+    """Completions from a capture, streamed over the captured latency."""
+
+    def __init__(self, turns, latency=0.3):
+        super().__init__(latency=latency)
+        completions = captured_calls(turns, "openai")
+        self.answers = {call["request"]["question"]: (call.get("response"), call["duration"]) for call in completions}
+        self.median = median_duration(completions, latency)
+
+    def completion_latency(self, question):
+        recorded = self.answers.get(question)
+        return recorded[1] if recorded else self.median
+
+    def answer_parts(self, question):
+        answer = (self.answers.get(question) or (None, None))[0]
+        if not answer:
+            return super().answer_parts(question)
+        words = answer.split(" ")
+        return [word + " " for word in words[:-1]] + [words[-1]]
+
+
+async def replay(args, turns, servers, graph):
+    # Imported after the environment points the bot at the fakes
+    import app as apollobot
+
+    apollobot.BOT.excel_api.graph._client = graph
+    connector_url = servers.start(FakeConnector().app())
+    headers = {"Content-Type": "application/json"}
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    async with apollobot.app.test_app() as test_app:
+        client = test_app.test_client()
+        # Production traffic only arrives once /ready passes, so measure a warmed-up instance
+        await apollobot.WARMUP.start()
+
+        async def send(turn):
+            text = turn["activity"]["text"]
+            name = apollobot.BOT.router.match(text)[0]
+            body = activity(connector_url, turn["activity"]["conversation"]["id"] or "replay", text)
+            start = time.perf_counter()
+            response = await client.post("/api/messages", data=json.dumps(body), headers=headers)
+            latencies[name].append(time.perf_counter() - start)
+            if response.status_code not in (200, 202):
+                errors[name] += 1
+
+        if args.speed > 0:
+            # Open loop: every turn starts at its captured offset
+            origin = turns[0]["time"]
+            start = time.monotonic()
+
+            async def scheduled(turn):
+                await asyncio.sleep(max(0.0, (turn["time"] - origin) / args.speed - (time.monotonic() - start)))
+                await send(turn)
+
+            await asyncio.gather(*(scheduled(turn) for turn in turns))
+        else:
+            # Each conversation's turns in order, so next/previous page through the right search
+            conversations = defaultdict(list)
+            for turn in turns:
+                conversations[turn["activity"]["conversation"]["id"]].append(turn)
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def conversation(conversation_turns):
+                async with semaphore:
+                    for turn in conversation_turns:
+                        await send(turn)
+
+            await asyncio.gather(*(conversation(conversation_turns) for conversation_turns in conversations.values()))
+
+        captured = defaultdict(list)
+        for turn in turns:
+            captured[apollobot.BOT.router.match(turn["activity"]["text"])[0]].append(turn["duration"])
+
+    return {
+        name: {
+            "turns": len(latencies[name]),
+            "errors": errors[name],
+            "captured_p50_ms": percentile(captured[name], 0.50) * 1000,
+            "captured_p95_ms": percentile(captured[name], 0.95) * 1000,
+            "p50_ms": percentile(latencies[name], 0.50) * 1000,
+            "p95_ms": percentile(latencies[name], 0.95) * 1000,
+            "p99_ms": percentile(latencies[name], 0.99) * 1000,
+        }
+        for name in sorted(latencies)
+    }
+
+
+def report(results, baseline=None):
+    columns = ["turns", "errors", "captured_p50_ms", "captured_p95_ms", "p50_ms", "p95_ms", "p99_ms"]
+    rows = {name: dict(result) for name, result in results.items()}
+    if baseline:
+        columns += ["baseline_p95_ms", "p95_change"]
+        for name, result in rows.items():
+            previous = baseline.get(name)
+            result["baseline_p95_ms"] = previous["p95_ms"] if previous else float("nan")
+            result["p95_change"] = (f"{result['p95_ms'] / previous['p95_ms'] - 1:+.0%}"
+                                    if previous and previous["p95_ms"] else "n/a")
+    print(f"{'command':<24}" + "".join(f"{column:>17}" for column in columns))
+    for name, result in rows.items():
+        print(f"{name:<24}" + "".join(
+            f"{result[column]:>17.1f}" if isinstance(result[column], float) else f"{result[column]:>17}"
+            for column in columns
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="JSON lines file written with CAPTURE=true")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed-up; 0 sends turns back to back")
+    parser.add_argument("--concurrency", type=int, default=10, help="Conversations at a time with --speed 0")
+    parser.add_argument("--excel-rows", type=int, default=5000)
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--baseline", help="Results of an earlier replay (--json) to compare with")
+    parser.add_argument("--verbose", action="store_true", help="Keep the bot's INFO logging")
+    args = parser.parse_args()
+
+    turns = load_capture(args.capture)
+    if not turns:
+        sys.exit(f"No message turns in {args.capture}")
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    servers = FakeServers()
+    ingram = RecordedIngram(turns)
+    openai = RecordedOpenAI(turns)
+    ingram_url = servers.start(ingram.app())
+    openai_url = servers.start(openai.app())
+    graph = FakeGraphClient(synthetic_workbook(synthetic_sheet(args.excel_rows)),
+                            latency=median_duration(captured_calls(turns, "graph_download"), 0.1))
+
+    os.environ.update({
+        "INGRAM_API_HOST": ingram_url,
+        "INGRAM_AUTH_HOST": ingram_url,
+        "INGRAM_CLIENT_ID": "replay",
+        "INGRAM_CLIENT_SECRET": "replay",
+        "OPENAI_API_KEY": "replay",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "EXCEL_SNAPSHOT_DIR": tempfile.mkdtemp(prefix="apollobot-replay-"),
+        "CAPTURE": "false",
+        "MicrosoftAppId": "",
+        "MicrosoftAppPassword": "",
+    })
+
+    print(f"Replaying {len(turns)} turns from {args.capture}\n")
+    try:
+        results = asyncio.run(replay(args, turns, servers, graph))
+    finally:
+        servers.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    report(results, baseline)
+    print("\nupstream calls: " + ", ".join(f"{name}={count}" for name, count in sorted({
+        **ingram.calls, **openai.calls, **{f"graph_{k}": v for k, v in graph.calls.items()}}.items())))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results, "args": vars(args)}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
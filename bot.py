@@ -1,33 +1,64 @@
-import xi.sdk.resellers
-import openai
-from openai import OpenAI
 import logging
-import time
 import asyncio
-import uuid
+import re
+import functools
 from dotenv import load_dotenv
 import os
-from xi.sdk.resellers.rest import ApiException
-from xi.sdk.resellers.api.accesstoken_api import AccesstokenApi
-from xi.sdk.resellers.api.product_catalog_api import ProductCatalogApi
-from xi.sdk.resellers.models.price_and_availability_request import PriceAndAvailabilityRequest
-from xi.sdk.resellers.models.price_and_availability_request_products_inner import PriceAndAvailabilityRequestProductsInner
-from botbuilder.core import TurnContext, ActivityHandler
-from botbuilder.schema import ChannelAccount
+import uuid
+from botbuilder.core import TurnContext
+from botbuilder.core.teams import TeamsActivityHandler
+from botbuilder.schema import Activity, ActivityTypes, ChannelAccount
 from pprint import pprint
-from office365.graph_client import GraphClient
-import pandas as pd
 from io import BytesIO
 from config import CONFIG
+from cache import TTLCache, make_cache
+from conversation_state import ConversationState, ConversationStateStore
+from excel_snapshot import ExcelSnapshot
+from graph_session import GraphSession
+from excel_search import VectorizedExcelSearch
+from excel_catalog import ExcelCatalog
+import ingram_client
+from ingram_client import IngramClient
+from token_manager import SharedTokenStore, TokenManager
+from pa_cache import PriceAvailabilityCache
+from search_cache import AvailableProductSearch, SearchPage, SearchPageCache
+from router import CommandRouter
+from metrics import stats_families, summary_family, track
+from capture import CAPTURE
+from resilience import BUSY_MESSAGE, Dependency, Overloaded
+from price_availability import (
+    PRICE_AND_AVAILABILITY_FILE, can_send_files, download_attachment, file_consent_card, file_info_card,
+    format_price_and_availability, format_price_and_availability_table, is_allowed_file_url, parse_part_numbers,
+    part_numbers_attachment, price_and_availability_csv, read_part_numbers_file, summary_row, upload_file
+)
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
-client = OpenAI()
+
+def read_workbook(content):
+    # pandas is only imported once a workbook actually has to be parsed
+    import pandas as pd
+    return pd.read_excel(BytesIO(content))
+
+
+def create_openai_client():
+    from openai import AsyncOpenAI
+    # Retries are done by openai_limits, which also caps concurrency and rate
+    client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"), max_retries=0)
+    # The client imports its resources on first access; do that here too, off the event loop
+    client.chat.completions
+    return client
+
+
+def normalize_question(question):
+    # "What is the difference between i5 and i7?" and "what is the  difference
+    # between i5 and i7" should share one cached answer
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
 
 class ExcelAPI:
     def __init__(self):
@@ -36,29 +67,51 @@ class ExcelAPI:
         self.tenant_id = CONFIG.AZURE_TENANT_ID
         self.site_url = CONFIG.SHAREPOINT_SITE_URL
         self.file_path = CONFIG.EXCEL_FILE_URL
+        self.snapshot = ExcelSnapshot()
+        self.graph = GraphSession(self.tenant_id, self.client_id, self.client_secret, self.site_url, self.file_path)
+
+    @staticmethod
+    def _file_version(file):
+        return {
+            "etag": file.etag,
+            "ctag": file.properties.get("cTag"),
+            "last_modified": file.last_modified_datetime,
+        }
+
+    async def get_file_version(self):
+        file = await self.graph.get_item()
+        return self._file_version(file)
+
+    async def load_snapshot(self, etag):
+        if not etag:
+            return None
+        with track("excel_snapshot_load"):
+            return await asyncio.get_running_loop().run_in_executor(None, self.snapshot.load, etag)
 
     async def get_excel_data(self):
-        if not await self.test_graph_access():
-            raise Exception("Failed to access Microsoft Graph. Please check your credentials and permissions.")
-
         try:
-            client = GraphClient.with_client_secret(self.tenant_id, self.client_id, self.client_secret)
-            site = client.sites.get_by_url(self.site_url).get().execute_query()
-            drives = site.drives.get().execute_query()
+            loop = asyncio.get_running_loop()
+            file = await self.graph.get_item()
+            version = self._file_version(file)
 
-            if not drives:
-                raise Exception("No drives found in the site")
+            # Skip the download and parse if the local snapshot is for this version
+            df = await self.load_snapshot(file.etag)
+            if df is not None:
+                return df, version
 
-            drive = drives[0]
-            file = drive.root.get_by_path(self.file_path).get().execute_query()
-            content = file.get_content().execute_query()
+            # With several workers, one downloads and parses while the others wait for its snapshot
+            async with self.snapshot.lock:
+                df = await self.load_snapshot(file.etag)
+                if df is not None:
+                    return df, version
 
-            if not isinstance(content, bytes):
-                if hasattr(content, 'value'):
-                    content = content.value
+                content = await self.graph.download()
 
-            df = pd.read_excel(BytesIO(content))
-            return df
+                with track("excel_parse"):
+                    df = await loop.run_in_executor(None, read_workbook, content)
+                if file.etag:
+                    await loop.run_in_executor(None, self.snapshot.save, df, file.etag, file.last_modified_datetime)
+            return df, version
 
         except Exception as e:
             logger.error(f"Unexpected error in get_excel_data: {str(e)}")
@@ -66,89 +119,122 @@ class ExcelAPI:
 
     async def test_graph_access(self):
         try:
-            client = GraphClient.with_client_secret(self.tenant_id, self.client_id, self.client_secret)
-            site = client.sites.get_by_url(self.site_url).get().execute_query()
+            await self.graph.get_site_id()
             return True
         except Exception as e:
             logger.error(f"Error accessing Graph API: {str(e)}")
             return False
 
-    def search_products(self, df, keywords):
-        keywords_set = set(keywords.lower().split())
-        
-        def match_keywords(row):
-            text = (str(row['Description']).lower() +
-                    str(row['Category']).lower() +
-                    str(row['Sub Category']).lower())
-            return all(keyword in text for keyword in keywords_set)
-        
-        results = df[df.apply(match_keywords, axis=1)]
-        return results
+    def search_products(self, df, keywords, engine=None, page_number=1, page_size=CONFIG.EXCEL_PAGE_SIZE):
+        """One page of matching rows, most relevant first, and the total match count."""
+        # engine is an ExcelSearchIndex or VectorizedExcelSearch built for df
+        if engine is None:
+            engine = VectorizedExcelSearch(df)
+        rows = engine.rank(keywords)
+        start = (page_number - 1) * page_size
+        return df.iloc[rows[start:start + page_size]], len(rows)
 
     def format_results(self, results):
-        formatted_results = []
-        for _, row in results.iterrows():
-            formatted_result = []
-            for column, value in row.items():
-                # Strip whitespace from both column name and value
-                column = column.strip()
-                if isinstance(value, str):
-                    value = value.strip()
-                
-                if value is not None and str(value).strip():  # Only include non-empty values
-                    formatted_result.append(f"**{column}**: {value}")
-            formatted_results.append("  \n".join(formatted_result))  # Join with newline
+        # Built column by column over the shown rows only; empty cells are left out
+        fields = []
+        for column in results.columns:
+            values = results[column]
+            text = values.astype(str).str.strip()
+            field = ("**" + str(column).strip() + "**: " + text).where(values.notna() & (text != ""))
+            fields.append(field.tolist())
+        formatted_results = [
+            "  \n".join(value for value in row if isinstance(value, str))  # Join with newline
+            for row in zip(*fields)
+        ]
         return "\n\n".join(formatted_results)  # Join products with double newline
 
-class IngramMicroBot(ActivityHandler):
+class IngramMicroBot(TeamsActivityHandler):
     def __init__(self):
         super().__init__()
-        self.openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.openai_client = None
+        self.openai_limits = Dependency("openai", CONFIG.OPENAI_MAX_CONCURRENCY, rate=CONFIG.OPENAI_RATE_LIMIT)
+        self.answer_cache = make_cache(CONFIG.OPENAI_CACHE_SIZE, CONFIG.OPENAI_CACHE_TTL, "openai_answers")
+        self._pending_answers = {}
         self.client_id = os.environ.get("INGRAM_CLIENT_ID")
         self.client_secret = os.environ.get("INGRAM_CLIENT_SECRET")
-        self.access_token = None
-        self.token_expiry = 0
-        self.page_number = 1
-        self.search_term = None
-        self.only_available = False
+        self.conversation_state = ConversationStateStore()
         self.excel_api = ExcelAPI()
-        self.excel_data = None
+        self.excel_catalog = ExcelCatalog(self.excel_api)
+        self.ingram = IngramClient()
+        self.token_manager = TokenManager(
+            functools.partial(self.ingram.fetch_access_token, self.client_id, self.client_secret),
+            on_refresh=self.ingram.set_access_token,
+            store=SharedTokenStore(os.path.join(CONFIG.SHARED_STATE_DIR, "ingram_token.json")) if CONFIG.SHARED_TOKEN else None
+        )
+        self.pa_cache = PriceAvailabilityCache(
+            self.fetch_price_and_availability,
+            customer_number=self.ingram.customer_number,
+            country_code=self.ingram.country_code
+        )
+        self.search_cache = SearchPageCache(self.fetch_search_page)
+        # CSVs offered on a file consent card, until the user answers; shared by workers with CACHE_BACKEND=sqlite
+        self.result_files = make_cache(CONFIG.PA_RESULT_FILE_CACHE_SIZE, CONFIG.PA_RESULT_FILE_TTL, "pa_result_files")
+        # Holds read-ahead tasks, so it stays in this process whatever CACHE_BACKEND is
+        self.available_searches = TTLCache(CONFIG.SEARCH_CACHE_SIZE, CONFIG.SEARCH_CACHE_TTL, name="available_searches")
+        self.router = self._build_router()
+
+    @property
+    def excel_data(self):
+        state = self.excel_catalog.state
+        return state.data if state is not None else None
 
     async def load_excel_data(self):
         try:
-            self.excel_data = await self.excel_api.get_excel_data()
+            await self.excel_catalog.load()
             logger.info("Excel data loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load Excel data: {str(e)}")
 
     async def get_access_token(self):
-        configuration = xi.sdk.resellers.Configuration(
-            host="https://api.ingrammicro.com:443"
-        )
-
-        with xi.sdk.resellers.ApiClient(configuration) as api_client:
-            api_instance = AccesstokenApi(api_client)
-            grant_type = 'client_credentials'
-
-            try:
-                api_response = api_instance.get_accesstoken(grant_type, self.client_id, self.client_secret)
-                self.access_token = api_response.access_token
-                self.token_expiry = int(time.time()) + int(api_response.expires_in)  # Set expiry time
-                logger.debug(f"New access token obtained. Expires at {self.token_expiry}")
-                return self.access_token
-            except ApiException as e:
-                logger.error(f"Exception when calling AccesstokenApi->get_accesstoken: {e}")
-                raise
+        try:
+            return await self.token_manager.refresh()
+        except ingram_client.ApiException as e:
+            logger.error(f"Exception when calling AccesstokenApi->get_accesstoken: {e}")
+            raise
 
     async def ensure_access_token(self):
-        current_time = int(time.time())
-        if not self.access_token or current_time >= self.token_expiry:
-            await self.get_access_token()
-        return self.access_token
+        return await self.token_manager.get_token()
 
+    async def get_openai_client(self):
+        # openai takes a few hundred ms to import, so it's imported off the event loop on first use
+        if self.openai_client is None:
+            loop = asyncio.get_running_loop()
+            client = await loop.run_in_executor(None, create_openai_client)
+            self.openai_client = self.openai_client or client
+        return self.openai_client
+
+    async def fetch_price_and_availability(self, part_numbers):
+        await self.ensure_access_token()
+        return await self.ingram.price_and_availability(part_numbers)
 
     async def handle_generic_question(self, turn_context: TurnContext, question: str) -> str:
         logger.debug(f"Attempting to handle generic question: {question}")
+
+        key = normalize_question(question)
+        answer = self.answer_cache.get(key)
+        if answer is not None:
+            logger.debug("Generic question answered from cache")
+            return answer
+
+        # Identical questions asked at the same time share one completion
+        task = self._pending_answers.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._answer_question(question, key))
+            self._pending_answers[key] = task
+            task.add_done_callback(lambda _: self._pending_answers.pop(key, None))
+        # Every caller waiting on the shared completion gets its own typing indicator
+        typing = asyncio.ensure_future(self._keep_typing(turn_context))
+        try:
+            return await asyncio.shield(task)
+        finally:
+            typing.cancel()
+
+    async def _answer_question(self, question: str, key: str) -> str:
         try:
             system_message = (
                 "You are an assistant helping employees provide relevant product information to customers. "
@@ -157,314 +243,444 @@ class IngramMicroBot(ActivityHandler):
                 "Make sure to include the most up-to-date and accurate information, particularly for product releases and specifications."
             )
 
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": question}
-                ],
-                max_tokens=300  # Adjust this value as needed for response length
-            )
-            answer = response.choices[0].message.content
-            
+            answer = await self.openai_limits.call(self._complete, system_message, question)
+
             logger.debug(f"OpenAI response received: {answer}")
-            
+
             # Check if the response is meaningful
             if "I don't know" in answer.lower() or "I'm not sure" in answer.lower():
                 logger.debug("OpenAI response was not meaningful")
-                return ""
-            
-            # Add the reminder about product search
-            reminder = "\n\nRemember: You can search for specific products by typing '**search for product**' followed by the product name."
-            
-            return answer + reminder
+                answer = ""
+            else:
+                # Add the reminder about product search
+                reminder = "\n\nRemember: You can search for specific products by typing '**search for product**' followed by the product name."
+                answer += reminder
+
+            self.answer_cache.set(key, answer)
+            return answer
+
+        except Overloaded:
+            return BUSY_MESSAGE
 
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {str(e)}")
             return f"An error occurred while processing your question: {str(e)}"
-    
+
+    async def _complete(self, system_message: str, question: str) -> str:
+        client = await self.get_openai_client()
+        with track("openai"), CAPTURE.upstream("openai", {"question": question}) as call:
+            stream = await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": system_message},
+                    {"role": "user", "content": question}
+                ],
+                max_tokens=300,  # Adjust this value as needed for response length
+                stream=True
+            )
+            parts = []
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+            call.response = "".join(parts)
+            return call.response
+
+    def collect_metrics(self):
+        caches = {
+            "price_and_availability": self.pa_cache.stats(),
+            "search_pages": self.search_cache.stats(),
+            "openai_answers": self.answer_cache.stats(),
+            "available_searches": self.available_searches.stats(),
+            "pa_result_files": self.result_files.stats(),
+        }
+        families = stats_families("apollobot_cache", "cache", caches, "Cache statistics")
+        families += stats_families("apollobot_token", "token", {"ingram": self.token_manager.stats()},
+                                   "Access token refreshes")
+        families += stats_families("apollobot_excel_catalog", "catalog", {"excel": self.excel_catalog.status()},
+                                   "Excel catalog freshness")
+        dependencies = {
+            "ingram": self.ingram.limits.stats(),
+            "graph": self.excel_api.graph.limits.stats(),
+            "openai": self.openai_limits.stats(),
+        }
+        families += stats_families("apollobot_dependency", "dependency", dependencies, "Upstream admission control")
+        hedges = {hedge.name: hedge.stats() for hedge in self.ingram.hedges.values()}
+        families += stats_families("apollobot_hedge", "call", hedges, "Hedged upstream calls")
+        families.append(summary_family("apollobot_command_duration_seconds", "command", self.router.stats,
+                                       "Time spent handling each command."))
+        return families
+
+    async def _keep_typing(self, turn_context: TurnContext):
+        # Teams shows a typing indicator for a few seconds; repeat it while the answer streams in
+        try:
+            while True:
+                await turn_context.send_activity(Activity(type=ActivityTypes.typing))
+                await asyncio.sleep(CONFIG.TYPING_INTERVAL)
+        except Exception as e:
+            logger.debug(f"Failed to send typing indicator: {str(e)}")
+
+    def _build_router(self):
+        router = CommandRouter(self.answer_question, fallback_name="generic_question")
+        router.prefix("excel search for ", "excel_search", self.search_excel_products)
+        # No trailing space: the part numbers may be on the next line, or in an attached file
+        router.prefix("price and availability for", "price_and_availability", self.price_and_availability)
+        router.exact("price and availability", "price_and_availability", self.price_and_availability)
+        router.prefix("search for available ", "search_available",
+                      functools.partial(self.start_product_search, only_available=True))
+        router.prefix("search for product ", "search_product",
+                      functools.partial(self.start_product_search, only_available=False))
+        # Any other "search for ..." is a generic question about the rest of the message
+        router.prefix("search for ", "generic_search", self.answer_question)
+        router.exact("next", "next", self.show_next_page)
+        router.exact("previous", "previous", self.show_previous_page)
+        return router
+
     async def on_message_activity(self, turn_context: TurnContext):
-        message_text = turn_context.activity.text
+        message_text = turn_context.activity.text or ""
         logger.debug(f"Received message: {message_text}")
 
-        lower_message = message_text.lower()
-
-        if (lower_message.startswith("search for ") and 
-            not lower_message.startswith("search for product ") and 
-            not lower_message.startswith("search for available ")):            # This is a generic search query
-            search_query = message_text[11:].strip()  # Remove "search for " from the start
-            
-            # Handle generic questions with OpenAI
-            openai_response = await self.handle_generic_question(turn_context, search_query)
-
-        if message_text.lower().startswith("excel search for "):
-            search_term = message_text[17:].strip()
-            handled = await self.search_excel_products(turn_context, search_term)
-            if handled:
-                return  # Exit the method if the Excel search was handled
-
-        if message_text.lower().startswith("price and availability for "):
-            part_number = message_text[26:].strip()
-            await self.get_price_and_availability(turn_context, part_number)
-        
-        elif message_text.lower().startswith("search for available "):
-            self.search_term = message_text[21:]
-            self.page_number = 1
-            self.only_available = True
-            await self.search_product(turn_context, self.search_term, self.page_number, only_available=True)
-        
-        elif message_text.lower().startswith("search for product "):
-            self.search_term = message_text[19:]
-            self.page_number = 1
-            self.only_available = False
-            await self.search_product(turn_context, self.search_term, self.page_number, only_available=False)
-        
-        elif message_text.lower() == "next":
-            if self.search_term:
-                self.page_number += 1
-                await turn_context.send_activity(f"Loading page {self.page_number} for: {self.search_term}")
-                await self.search_product(turn_context, self.search_term, self.page_number, only_available=self.only_available)
-            else:
-                await turn_context.send_activity("No active search. Please start a new search.")
-        
-        elif message_text.lower() == "previous":
-            if self.search_term:
-                if self.page_number > 1:
-                    self.page_number -= 1
-                    await self.search_product(turn_context, self.search_term, self.page_number, only_available=self.only_available)
-                else:
-                    await turn_context.send_activity("You are already on the first page.")
-            else:
-                await turn_context.send_activity("No active search. Please start a new search.")
-        
+        await self.router.dispatch(turn_context, message_text)
+
+    async def start_product_search(self, turn_context: TurnContext, search_term: str, only_available: bool = False):
+        state = ConversationState(search_term=search_term, page_number=1, only_available=only_available)
+        await self.conversation_state.save(turn_context.activity.conversation.id, state)
+        await self.search_product(turn_context, state.search_term, state.page_number, only_available=only_available)
+
+    async def show_page(self, turn_context: TurnContext, state: ConversationState):
+        if state.source == "excel":
+            await self.show_excel_page(turn_context, state.search_term, state.page_number)
+        else:
+            await self.search_product(turn_context, state.search_term, state.page_number, only_available=state.only_available)
+
+    async def show_next_page(self, turn_context: TurnContext, _=None):
+        conversation_id = turn_context.activity.conversation.id
+        state = await self.conversation_state.get(conversation_id)
+        if state.search_term:
+            state.page_number += 1
+            await self.conversation_state.save(conversation_id, state)
+            await turn_context.send_activity(f"Loading page {state.page_number} for: {state.search_term}")
+            await self.show_page(turn_context, state)
         else:
-            logger.debug("Message didn't match any specific commands, treating as generic question")
-            # Handle generic questions with OpenAI
-            openai_response = await self.handle_generic_question(turn_context, message_text)
-            
-            logger.debug(f"OpenAI response successful: {openai_response}")
-            
-        # If OpenAI couldn't provide a meaningful response, fall back to the default message
-            if openai_response:
-                await turn_context.send_activity(openai_response)
+            await turn_context.send_activity("No active search. Please start a new search.")
+
+    async def show_previous_page(self, turn_context: TurnContext, _=None):
+        conversation_id = turn_context.activity.conversation.id
+        state = await self.conversation_state.get(conversation_id)
+        if state.search_term:
+            if state.page_number > 1:
+                state.page_number -= 1
+                await self.conversation_state.save(conversation_id, state)
+                await self.show_page(turn_context, state)
             else:
-                # If OpenAI couldn't provide a meaningful response, fall back to the default message
-                response = "I'm not sure how to respond to that. Here are some things you can try:"
-                response += "\n- Search for products: 'search for product [product name]'"
-                response += "\n- Search for available products: 'search for available [product name]'"
-                response += "\n- Get price and availability: 'price and availability for [part number]'"
-                response += "\n- Navigate search results: 'next' or 'previous'"
-                response += "\n- Or you can ask me general questions about computer hardware!"
-                await turn_context.send_activity(response)
-            
-            return  # Exit the method after handling the generic search
+                await turn_context.send_activity("You are already on the first page.")
+        else:
+            await turn_context.send_activity("No active search. Please start a new search.")
+
+    async def answer_question(self, turn_context: TurnContext, question: str):
+        openai_response = await self.handle_generic_question(turn_context, question) if question else ""
+
+        logger.debug(f"OpenAI response successful: {openai_response}")
+
+        if openai_response:
+            await turn_context.send_activity(openai_response)
+        else:
+            # If OpenAI couldn't provide a meaningful response, fall back to the default message
+            response = "I'm not sure how to respond to that. Here are some things you can try:"
+            response += "\n- Search for products: 'search for product [product name]'"
+            response += "\n- Search for available products: 'search for available [product name]'"
+            response += "\n- Get price and availability: 'price and availability for [part number]'"
+            response += "\n- Navigate search results: 'next' or 'previous'"
+            response += "\n- Or you can ask me general questions about computer hardware!"
+            await turn_context.send_activity(response)
+
+    def available_search(self, search_term: str, page_size: int):
+        key = (search_term.strip().lower(), page_size)
+        search = self.available_searches.get(key)
+        if search is None:
+            search = AvailableProductSearch(
+                functools.partial(self.fetch_catalog_page, search_term),
+                self.pa_cache.get_many,
+                catalog_page_size=page_size * CONFIG.SEARCH_OVERFETCH
+            )
+            self.available_searches.set(key, search)
+        return search
+
+    async def fetch_catalog_page(self, search_term: str, page_number: int, page_size: int):
+        api_response = await self.ingram.search(search_term, page_number, page_size=page_size)
+        return api_response.catalog
+
+    async def fetch_search_page(self, search_term: str, only_available: bool, page_number: int, page_size: int = 10):
+        await self.ensure_access_token()
+
+        if only_available:
+            # Read ahead through the catalog until the page is full of in-stock products
+            return await self.available_search(search_term, page_size).page(page_number, page_size)
+
+        api_response = await self.ingram.search(search_term, page_number, page_size=page_size)
+
+        logger.debug(f"API response received: {api_response}")
+
+        catalog = (api_response.catalog or [])[:page_size]
+        if not catalog:
+            return SearchPage(products=[], found=False, has_more=False)
+
+        # Price and availability for the whole page, batched and cached
+        p_and_a_response = await self.pa_cache.get_many([product.ingram_part_number for product in catalog])
+
+        return SearchPage(products=list(zip(catalog, p_and_a_response)), found=True, has_more=len(catalog) >= page_size)
+
+    def format_search_page(self, search_term: str, page_number: int, page: SearchPage):
+        if not page.found:
+            return f"No products found matching your search term '{search_term}'.\n\nPlease try a different search term or ask for help if you need assistance."
+        if not page.products:
+            return f"No products found matching your criteria on page {page_number}.\n\nWould you like to try a different search term?"
+
+        response = f"Search results for '**{search_term}**':\n\n"
+        for product, p_and_a_info in page.products:
+            response += f"**Name**: {product.description}  \n"
+            response += f"**Part Number**: {product.ingram_part_number}  \n"
+            response += f"**Vendor**: {product.vendor_name}  \n"
+            response += f"**Category**: {product.category}  \n"
+            response += f"**Sub-Category**: {product.sub_category}  \n"
+            response += f"**Product Type**: {product.product_type}  \n"
+            response += f"**UPC Code**: {product.upc_code}  \n"
+            response += f"**Availability**: {'Available' if p_and_a_info and p_and_a_info.availability and p_and_a_info.availability.total_availability > 0 else 'Not Available'}  \n"
+            if p_and_a_info and p_and_a_info.availability:
+                response += f"**Total Availability**: {p_and_a_info.availability.total_availability}  \n"
+            response += "  \n"
+
+        navigation_message = (
+            f"\n📄 **Page {page_number}**\n\n"
+            "Navigation Options:  \n"
+            "    • Type '**next**' to view the next page of results  \n"
+            "    • Type '**previous**' to view the previous page of results  \n"
+            "    • For price and availability details, type '**price and availability for [part number]**'\n\n"
+            "What would you like to do next?"
+        )
+
+        return response + navigation_message
 
     async def search_product(self, turn_context: TurnContext, search_term: str, page_number: int, only_available: bool = False):
         logger.debug(f"Searching for product: {search_term}, page: {page_number}, only available: {only_available}")
-        configuration = xi.sdk.resellers.Configuration(
-            host="https://api.ingrammicro.com:443/sandbox"
-        )
 
         try:
-            await self.ensure_access_token()
+            search_term = search_term.replace("laptop", "Notebook")
 
-            configuration.access_token = self.access_token
+            page = await self.search_cache.get_page(search_term, only_available, page_number)
 
-            search_term = search_term.replace("laptop", "Notebook")
+            await turn_context.send_activity(self.format_search_page(search_term, page_number, page))
+            logger.info(f"Sent search results for '{search_term}' (Page {page_number})")
 
-            with xi.sdk.resellers.ApiClient(configuration) as api_client:
-                api_instance = ProductCatalogApi(api_client)
-
-                im_customer_number = '20-222222'  # Replace with your actual customer number
-                im_correlation_id = str(uuid.uuid4())[:32]  # Truncate to 32 characters
-                im_country_code = 'US'
-                page_size = 10
-                keyword = [search_term]
-
-                api_response = api_instance.get_reseller_v6_productsearch(
-                    im_customer_number=im_customer_number,
-                    im_correlation_id=im_correlation_id,
-                    im_country_code=im_country_code,
-                    page_size=page_size,
-                    page_number=page_number,
-                    keyword=keyword
-                )
+            # Have the next page ready by the time the user types "next"
+            if page.has_more:
+                self.search_cache.prefetch(search_term, only_available, page_number + 1)
 
-                logger.debug(f"API response received: {api_response}")
-
-                if api_response.catalog and len(api_response.catalog) > 0:
-                    # Prepare a list of products for batch request
-                    product_list = [PriceAndAvailabilityRequestProductsInner(ingram_part_number=product.ingram_part_number) 
-                                    for product in api_response.catalog[:10]]
-
-                    # Make a single batch request for price and availability
-                    p_and_a_request = PriceAndAvailabilityRequest(products=product_list)
-                    p_and_a_response = api_instance.post_priceandavailability(
-                        im_customer_number=im_customer_number,
-                        im_correlation_id=im_correlation_id,
-                        im_country_code=im_country_code,
-                        include_availability=True,
-                        include_pricing=True,
-                        price_and_availability_request=p_and_a_request
-                    )
-
-                    # Process the batch response
-                    filtered_products = []
-                    for product, p_and_a_info in zip(api_response.catalog[:10], p_and_a_response):
-                        is_available = p_and_a_info.availability and p_and_a_info.availability.total_availability > 0
-                        if not only_available or (only_available and is_available):
-                            filtered_products.append((product, p_and_a_info))
-
-                        if filtered_products:
-                            response = f"Search results for '**{search_term}**':\n\n"
-                            for product, p_and_a_info in filtered_products:
-                                response += f"**Name**: {product.description}  \n"
-                                response += f"**Part Number**: {product.ingram_part_number}  \n"
-                                response += f"**Vendor**: {product.vendor_name}  \n"
-                                response += f"**Category**: {product.category}  \n"
-                                response += f"**Sub-Category**: {product.sub_category}  \n"
-                                response += f"**Product Type**: {product.product_type}  \n"
-                                response += f"**UPC Code**: {product.upc_code}  \n"
-                                response += f"**Availability**: {'Available' if p_and_a_info.availability and p_and_a_info.availability.total_availability > 0 else 'Not Available'}  \n"
-                                if p_and_a_info.availability:
-                                    response += f"**Total Availability**: {p_and_a_info.availability.total_availability}  \n"
-                                response += "  \n"
-
-                    navigation_message = (
-                        f"\n📄 **Page {page_number}**\n\n"
-                        "Navigation Options:  \n"
-                        "    • Type '**next**' to view the next page of results  \n"
-                        "    • Type '**previous**' to view the previous page of results  \n"
-                        "    • For price and availability details, type '**price and availability for [part number]**'\n\n"
-                        "What would you like to do next?"
-                    )                    
-
-                    response += navigation_message
-                elif api_response.catalog and len(api_response.catalog) > 0:
-                    response = f"No products found matching your criteria on page {page_number}.\n\nWould you like to try a different search term?"
-                else:
-                    response = f"No products found matching your search term '{search_term}'.\n\nPlease try a different search term or ask for help if you need assistance."
-
-                await turn_context.send_activity(response)
-                logger.info(f"Sent search results for '{search_term}' (Page {page_number})")
-
-        except ApiException as e:
+        except ingram_client.ApiException as e:
             error_message = f"An API error occurred: {str(e)}"
             logger.error(error_message)
-                        
+
             # User-friendly message
             user_message = "I'm sorry, but I couldn't find any information about that product right now. Please try searching for a similar product or check back later."
             await turn_context.send_activity(user_message)
 
+        except asyncio.TimeoutError:
+            logger.error(f"Ingram API timed out searching for '{search_term}'")
+            await turn_context.send_activity("The product search is taking longer than expected. Please try again in a moment.")
+
+        except Overloaded:
+            await turn_context.send_activity(BUSY_MESSAGE)
+
         except Exception as e:
             error_message = f"An unexpected error occurred: {str(e)}"
             logger.error(error_message)
-                    
+
             # User-friendly message
             user_message = "I apologize, but I encountered an issue while searching for that product. Please try again later or contact support if the problem persists."
             await turn_context.send_activity(user_message)
 
+    async def price_and_availability(self, turn_context: TurnContext, argument: str):
+        # One part number gets the detailed reply; a pasted list or an attached
+        # CSV/Excel file gets one compact row per part number
+        part_numbers = parse_part_numbers(argument)
+        if len(part_numbers) == 1:
+            await self.get_price_and_availability(turn_context, part_numbers[0])
+            return
+
+        if not part_numbers:
+            attachment = part_numbers_attachment(turn_context.activity.attachments, CONFIG.PA_ATTACHMENT_HOSTS)
+            if attachment is None:
+                await turn_context.send_activity(
+                    "Please give one or more part numbers separated by commas or line breaks, "
+                    "or attach a CSV or Excel (.xlsx) file with a part number column."
+                )
+                return
+            try:
+                part_numbers = await self.read_part_numbers_attachment(*attachment)
+            except Exception as e:
+                logger.error(f"Failed to read part numbers from {attachment[0]}: {str(e)}")
+                await turn_context.send_activity(f"Sorry, I couldn't read part numbers from {attachment[0]}: {str(e)}")
+                return
+            if not part_numbers:
+                await turn_context.send_activity(f"No part numbers found in {attachment[0]}.")
+                return
+
+        await self.get_bulk_price_and_availability(turn_context, part_numbers)
+
+    async def read_part_numbers_attachment(self, name, url):
+        content = await download_attachment(url, CONFIG.PA_BULK_FILE_MAX_BYTES, CONFIG.INGRAM_TIMEOUT)
+        return await asyncio.get_running_loop().run_in_executor(None, read_part_numbers_file, name, content)
+
+    async def get_bulk_price_and_availability(self, turn_context: TurnContext, part_numbers):
+        if len(part_numbers) > CONFIG.PA_BULK_MAX_PARTS:
+            await turn_context.send_activity(
+                f"Please send at most {CONFIG.PA_BULK_MAX_PARTS} part numbers at a time "
+                f"(got {len(part_numbers)})."
+            )
+            return
+
+        logger.debug(f"Getting price and availability for {len(part_numbers)} part numbers")
+
+        try:
+            # The cache splits the misses into PA_MAX_BATCH_SIZE requests and sends them concurrently
+            products = await self.pa_cache.get_many(part_numbers)
+            rows = [summary_row(part_number, product) for part_number, product in zip(part_numbers, products)]
+            found = sum(product is not None for product in products)
+
+            text = f"**Price and availability for {len(part_numbers)} part numbers** ({found} found):\n\n"
+            text += format_price_and_availability_table(rows[:CONFIG.PA_BULK_TABLE_ROWS])
+            attachments = None
+            if len(rows) > CONFIG.PA_BULK_TABLE_ROWS and can_send_files(turn_context.activity):
+                # Teams only takes files through its upload flow; the CSV is sent once the user accepts
+                text += (f"\n\nShowing the first {CONFIG.PA_BULK_TABLE_ROWS}. "
+                         f"Accept the file below to get all {len(rows)} as a CSV.")
+                content = price_and_availability_csv(rows)
+                file_id = uuid.uuid4().hex
+                self.result_files.set(file_id, content)
+                attachments = [file_consent_card(PRICE_AND_AVAILABILITY_FILE, len(content), file_id)]
+            elif len(rows) > CONFIG.PA_BULK_TABLE_ROWS:
+                text += (f"\n\nShowing the first {CONFIG.PA_BULK_TABLE_ROWS} of {len(rows)}. Send at most "
+                         f"{CONFIG.PA_BULK_TABLE_ROWS} part numbers per message to see them all, or ask in a "
+                         f"1:1 chat with the bot to get the full list as a file.")
+
+            await turn_context.send_activity(Activity(type=ActivityTypes.message, text=text, attachments=attachments))
+            logger.debug(f"Sent price and availability for {len(part_numbers)} part numbers")
+
+        except ingram_client.ApiException as e:
+            error_message = f"An API error occurred: {str(e)}"
+            logger.error(error_message)
+            await turn_context.send_activity(error_message)
+
+        except asyncio.TimeoutError:
+            error_message = "The price and availability request timed out. Please try again."
+            logger.error(error_message)
+            await turn_context.send_activity(error_message)
+
+        except Overloaded:
+            await turn_context.send_activity(BUSY_MESSAGE)
+
+        except Exception as e:
+            error_message = f"An unexpected error occurred: {str(e)}"
+            logger.error(error_message)
+            await turn_context.send_activity(error_message)
+
+    async def on_teams_file_consent_accept(self, turn_context: TurnContext, file_consent_card_response):
+        upload_info = file_consent_card_response.upload_info
+        file_id = str((file_consent_card_response.context or {}).get("file_id"))
+        # The bytes the card announced, so the upload matches its size
+        content = self.result_files.get(file_id)
+        if content is None:
+            await turn_context.send_activity(
+                "That file is no longer available. Please ask for the price and availability again.")
+            return
+        try:
+            if not is_allowed_file_url(upload_info.upload_url, CONFIG.PA_ATTACHMENT_HOSTS):
+                raise ValueError("unexpected upload location")
+            await upload_file(upload_info.upload_url, content, CONFIG.INGRAM_TIMEOUT)
+            self.result_files.pop(file_id)
+        except Exception as e:
+            logger.error(f"Failed to upload price and availability file: {str(e)}")
+            await turn_context.send_activity(f"Sorry, I couldn't upload the file: {str(e)}")
+            return
+        await turn_context.send_activity(Activity(type=ActivityTypes.message, attachments=[file_info_card(upload_info)]))
+
+    async def on_teams_file_consent_decline(self, turn_context: TurnContext, file_consent_card_response):
+        self.result_files.pop(str((file_consent_card_response.context or {}).get("file_id")))
+        await turn_context.send_activity("OK, I won't upload the file.")
+
     async def get_price_and_availability(self, turn_context: TurnContext, part_number: str):
         # Convert part number to uppercase
         part_number = part_number.upper()
-        
+
         logger.debug(f"Getting price and availability for part number: {part_number}")
-        configuration = xi.sdk.resellers.Configuration(
-            host="https://api.ingrammicro.com:443/sandbox"
-        )
 
         try:
-            await self.ensure_access_token()
-
-            configuration.access_token = self.access_token
+            # Get price and availability
+            product_info = await self.pa_cache.get(part_number)
 
-            with xi.sdk.resellers.ApiClient(configuration) as api_client:
-                api_instance = ProductCatalogApi(api_client)
+            logger.debug(f"API response received: {product_info}")
 
-                im_customer_number = '20-222222'  # Replace with your actual customer number
-                im_correlation_id = str(uuid.uuid4())[:32]  # Truncate to 32 characters
-                im_country_code = 'US'
+            response = format_price_and_availability(part_number, product_info)
 
-                # Get price and availability
-                products = [PriceAndAvailabilityRequestProductsInner(ingram_part_number=part_number)]
-                price_and_availability_request = PriceAndAvailabilityRequest(products=products)
+            await turn_context.send_activity(response)
+            print(f"Sent price and availability for '{part_number}'")  # Print to console for debugging
 
-                api_response = api_instance.post_priceandavailability(
-                    im_customer_number=im_customer_number,
-                    im_correlation_id=im_correlation_id,
-                    im_country_code=im_country_code,
-                    include_availability=True,
-                    include_pricing=True,
-                    price_and_availability_request=price_and_availability_request
-                )
-
-                logger.debug(f"API response received: {api_response}")
-
-                if api_response and len(api_response) > 0:
-                    product_info = api_response[0]
-                    
-                    response = f"**Name**: {product_info.description or 'N/A'}  \n"
-                    response += f"**Ingram Part Number**: {product_info.ingram_part_number}  \n"
-                    response += f"**Vendor Part Number**: {product_info.vendor_part_number or 'N/A'}  \n"
-                    
-                    if product_info.availability:
-                        total_availability = product_info.availability.total_availability
-                        response += f"**Availability**: {'Available' if total_availability > 0 else 'Not Available'}  \n"
-                        response += f"**Total Availability**: {total_availability}  \n"
-                        
-                        availability_by_warehouse = product_info.availability.availability_by_warehouse or []
-                        available_warehouses = [
-                            f"**Warehouse**: {wh.location if hasattr(wh, 'location') else 'N/A'}, "
-                            f"**Quantity Available**: {wh.quantity_available}"
-                            for wh in availability_by_warehouse
-                            if hasattr(wh, 'quantity_available') and wh.quantity_available > 0
-                        ]
-                        
-                        if available_warehouses:
-                            response += "**Availability by Warehouse**:  \n" + "  \n".join(available_warehouses) + "  \n"
-                        else:
-                            response += "**No warehouses with available stock**.  \n"
-                    
-                    if product_info.pricing:
-                        response += f"**Pricing (Currency {product_info.pricing.currency_code or 'N/A'})**:  \n"
-                        if hasattr(product_info.pricing, 'retail_price'):
-                            retail_price = product_info.pricing.retail_price
-                            response += f"**Retail Price**: ${retail_price:.2f}  \n" if retail_price is not None else "Retail Price: N/A  \n"
-                        if hasattr(product_info.pricing, 'customer_price'):
-                            customer_price = product_info.pricing.customer_price
-                            response += f"**Customer Price**: ${customer_price:.2f}  \n" if customer_price is not None else "Customer Price: N/A  \n"
-                else:
-                    response = f"**No price and availability information found for part number {part_number}**."
-
-                await turn_context.send_activity(response)
-                print(f"Sent price and availability for '{part_number}'")  # Print to console for debugging
-
-        except ApiException as e:
+        except ingram_client.ApiException as e:
             error_message = f"An API error occurred: {str(e)}"
             logger.error(error_message)
             await turn_context.send_activity(error_message)
 
+        except asyncio.TimeoutError:
+            error_message = f"The price and availability request for {part_number} timed out. Please try again."
+            logger.error(error_message)
+            await turn_context.send_activity(error_message)
+
+        except Overloaded:
+            await turn_context.send_activity(BUSY_MESSAGE)
+
         except Exception as e:
             error_message = f"An unexpected error occurred: {str(e)}"
             logger.error(error_message)
             await turn_context.send_activity(error_message)
 
     async def search_excel_products(self, turn_context: TurnContext, search_term: str):
-        if self.excel_data is None:
+        state = ConversationState(search_term=search_term, page_number=1, source="excel")
+        await self.conversation_state.save(turn_context.activity.conversation.id, state)
+        await self.show_excel_page(turn_context, search_term, 1)
+        return True  # Indicate that the message has been handled
+
+    async def show_excel_page(self, turn_context: TurnContext, search_term: str, page_number: int):
+        if self.excel_catalog.state is None:
             await self.load_excel_data()
-        
-        if self.excel_data is not None:
-            results = self.excel_api.search_products(self.excel_data, search_term)
-            if not results.empty:
-                formatted_results = self.excel_api.format_results(results)
-                await turn_context.send_activity(f"Search results for '{search_term}':\n\n{formatted_results}")
-            else:
-                await turn_context.send_activity(f"No products found matching '{search_term}' in the Excel file.")
-        else:
+
+        # Read the state once so a refresh swapping it mid-search can't mix versions
+        state = self.excel_catalog.state
+        if state is None:
             await turn_context.send_activity("Sorry, I couldn't access the Excel data. Please try again later.")
-        
-        # Add this line to prevent further processing
-        return True  # Indicate that the message has been handled
+            return
+
+        with track("excel_search"):
+            results, total = self.excel_api.search_products(
+                state.data, search_term, engine=state.engine, page_number=page_number)
+        if total == 0:
+            await turn_context.send_activity(f"No products found matching '{search_term}' in the Excel file.")
+            return
+        if results.empty:
+            # Keep "previous" one step away from the last page
+            last_page = (total - 1) // CONFIG.EXCEL_PAGE_SIZE + 1
+            await self.conversation_state.save(
+                turn_context.activity.conversation.id,
+                ConversationState(search_term=search_term, page_number=last_page, source="excel"))
+            await turn_context.send_activity(f"No more results for '{search_term}'; there are {total} in all.")
+            return
+
+        first = (page_number - 1) * CONFIG.EXCEL_PAGE_SIZE + 1
+        formatted_results = self.excel_api.format_results(results)
+        navigation_message = (
+            f"\n\n📄 **Page {page_number}** (results {first}-{first + len(results) - 1} of {total})\n\n"
+            "Type '**next**' or '**previous**' to see more results."
+        )
+        await turn_context.send_activity(
+            f"Search results for '{search_term}':\n\n{formatted_results}{navigation_message}")
 
     async def on_members_added_activity(
         self, members_added: [ChannelAccount], turn_context: TurnContext
@@ -476,7 +692,8 @@ class IngramMicroBot(ActivityHandler):
                     "I can help you with:\n\n"
                     "1️⃣ Searching products in the Ingram Micro database:  \n"
                     "• Type '**search for product** [your search term]'  \n"
-                    "• For available products only, type '**search for available** [your search term]'\n\n"
+                    "• For available products only, type '**search for available** [your search term]'  \n"
+                    "• For prices and stock, type '**price and availability for** [part numbers]' or attach a CSV/Excel list\n\n"
                     "2️⃣ Searching the Aera Procure database:  \n"
                     "• Type '**excel search for** [your search term]'\n\n"
                     "3️⃣ Answering questions about computer software and hardware\n\n"
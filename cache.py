@@ -0,0 +1,265 @@
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from collections import OrderedDict
+
+from config import CONFIG
+from shared_state import ensure_private_directory
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire after `ttl` seconds.
+
+    Meant to be used from the event loop only; it does no locking.
+    """
+
+    def __init__(self, maxsize, ttl, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get_many(self, keys):
+        """{key: value} for the keys that are cached."""
+        values = {}
+        for key in keys:
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                values[key] = value
+        return values
+
+    def set_many(self, items, ttl=None):
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key):
+        entry = self._data.get(key)
+        return entry is not None and entry[0] > time.monotonic()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteTTLCache:
+    """TTLCache stored in a SQLite file, so every worker on the host shares it.
+
+    Same interface as TTLCache, with values pickled. Lookups stay
+    synchronous like TTLCache's: on a local WAL database without fsync a
+    lookup takes tens of microseconds, and losing the file only costs
+    refetching. There is no busy timeout, since waiting for another
+    worker's write would stall the event loop; a statement that finds the
+    database locked is skipped instead (a miss, or an entry not cached).
+    `get_many` and `set_many` take a whole batch of keys in one statement
+    or transaction, so a bulk lookup costs one query instead of one per key.
+    Expired rows and rows over `maxsize` (oldest expiry first) are purged
+    every `purge_every` writes.
+    """
+
+    # Well under SQLite's limit on bound parameters per statement
+    MAX_PARAMETERS = 500
+
+    def __init__(self, maxsize, ttl, name, path=None, purge_every=256):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.path = path or os.path.join(CONFIG.SHARED_STATE_DIR, "cache.db")
+        self.purge_every = purge_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.busy = 0
+        self._writes = 0
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                ensure_private_directory(directory)
+            # Setup happens once per worker and may wait for another worker doing the same
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(name TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (name, key))"
+            )
+            connection.execute("PRAGMA busy_timeout = 0")
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql, params=()):
+        """Run one statement; None if another worker holds the database lock."""
+        try:
+            return self._connect().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            if "locked" not in str(e) and "busy" not in str(e):
+                raise
+            self.busy += 1
+            logger.debug(f"{self.name} cache is busy, skipping: {str(e)}")
+            return None
+
+    def get(self, key, default=None):
+        cursor = self._execute(
+            "SELECT value FROM cache WHERE name = ? AND key = ? AND expires_at > ?",
+            (self.name, repr(key), time.time())
+        )
+        row = cursor.fetchone() if cursor is not None else None
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def get_many(self, keys):
+        """{key: value} for the keys that are cached, read with one query per MAX_PARAMETERS keys."""
+        by_repr = {repr(key): key for key in keys}
+        reprs = list(by_repr)
+        values = {}
+        now = time.time()
+        for start in range(0, len(reprs), self.MAX_PARAMETERS):
+            chunk = reprs[start:start + self.MAX_PARAMETERS]
+            cursor = self._execute(
+                f"SELECT key, value FROM cache WHERE name = ? AND expires_at > ? "
+                f"AND key IN ({','.join('?' * len(chunk))})",
+                (self.name, now, *chunk)
+            )
+            for key_repr, blob in cursor.fetchall() if cursor is not None else ():
+                values[by_repr[key_repr]] = pickle.loads(blob)
+        self.hits += len(values)
+        self.misses += len(by_repr) - len(values)
+        return values
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl
+        rows = []
+        for key, value in items.items():
+            try:
+                rows.append((self.name, repr(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at))
+            except Exception as e:
+                logger.warning(f"Not caching unpicklable {self.name} value: {str(e)}")
+        if not rows:
+            return
+        insert = "INSERT OR REPLACE INTO cache (name, key, value, expires_at) VALUES (?, ?, ?, ?)"
+        if len(rows) == 1:
+            if self._execute(insert, rows[0]) is None:
+                return
+        else:
+            # One transaction for the batch; BEGIN IMMEDIATE takes the write lock up front or is skipped
+            if self._execute("BEGIN IMMEDIATE") is None:
+                return
+            try:
+                self._connection.executemany(insert, rows)
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        writes, self._writes = self._writes, self._writes + len(rows)
+        if writes // self.purge_every != self._writes // self.purge_every:
+            self._purge()
+
+    def _purge(self):
+        self._execute("DELETE FROM cache WHERE name = ? AND expires_at <= ?", (self.name, time.time()))
+        excess = len(self) - self.maxsize
+        if excess > 0:
+            deleted = self._execute(
+                "DELETE FROM cache WHERE name = ? AND key IN "
+                "(SELECT key FROM cache WHERE name = ? ORDER BY expires_at LIMIT ?)",
+                (self.name, self.name, excess)
+            )
+            if deleted is not None:
+                self.evictions += deleted.rowcount
+
+    def pop(self, key, default=None):
+        value = self.get(key, default)
+        self._execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, repr(key)))
+        return value
+
+    def clear(self):
+        self._execute("DELETE FROM cache WHERE name = ?", (self.name,))
+
+    def __contains__(self, key):
+        cursor = self._execute(
+            "SELECT 1 FROM cache WHERE name = ? AND key = ? AND expires_at > ?",
+            (self.name, repr(key), time.time())
+        )
+        return cursor is not None and cursor.fetchone() is not None
+
+    def __len__(self):
+        cursor = self._execute("SELECT COUNT(*) FROM cache WHERE name = ?", (self.name,))
+        return cursor.fetchone()[0] if cursor is not None else 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "busy": self.busy,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def make_cache(maxsize, ttl, name):
+    """A result cache of the configured CACHE_BACKEND."""
+    if CONFIG.CACHE_BACKEND == "sqlite":
+        try:
+            ensure_private_directory(CONFIG.SHARED_STATE_DIR)
+            return SQLiteTTLCache(maxsize, ttl, name)
+        except OSError as e:
+            logger.error(f"Keeping the {name} cache in memory: {str(e)}")
+    return TTLCache(maxsize, ttl, name=name)
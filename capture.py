@@ -0,0 +1,196 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import CONFIG
+from shared_state import ensure_private_directory
+
+logger = logging.getLogger(__name__)
+
+# The capture record of the turn being processed, if it was sampled
+_current_turn = contextvars.ContextVar("capture_turn", default=None)
+
+# Activity fields kept verbatim; everything else (serviceUrl, channelData,
+# user names, tenant ids) is left out of the capture. `name` is the invoke's
+# name, such as "fileConsent/invoke".
+ACTIVITY_FIELDS = ("type", "name", "timestamp", "channelId", "text", "textFormat", "locale")
+# Keys of an invoke or card submit `value` that are safe to keep. The rest can
+# hold pre-authenticated upload URLs (a file consent's uploadInfo), the user's
+# part number lists or whatever a card form collected.
+VALUE_FIELDS = ("action",)
+
+
+def pseudonym(value):
+    """A stable stand-in for an id, so a conversation's turns stay grouped."""
+    return hashlib.sha256(str(value).encode()).hexdigest()[:16] if value else None
+
+
+def redact_activity(activity):
+    """The parts of a serialized activity needed to replay it, without secrets or personal data."""
+    redacted = {field: activity[field] for field in ACTIVITY_FIELDS if activity.get(field) is not None}
+    value = activity.get("value")
+    if isinstance(value, dict):
+        redacted["value"] = {key: value[key] for key in VALUE_FIELDS if isinstance(value.get(key), str)}
+    redacted["conversation"] = {"id": pseudonym((activity.get("conversation") or {}).get("id"))}
+    redacted["from"] = {"id": pseudonym((activity.get("from") or {}).get("id"))}
+    # Attachment URLs are pre-authenticated, so only the kind of file is kept
+    redacted["attachments"] = [
+        {"contentType": attachment.get("contentType"), "name": attachment.get("name")}
+        for attachment in activity.get("attachments") or []
+    ]
+    return redacted
+
+
+def jsonable(value):
+    """Ingram SDK models (and lists of them) as their wire-format dicts."""
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    return value
+
+
+class UpstreamCall:
+    """Yielded by `upstream`; set `response` to have it recorded."""
+    __slots__ = ("response",)
+
+    def __init__(self):
+        self.response = None
+
+
+class TrafficCapture:
+    """Opt-in record of sampled turns, for replaying production traffic offline.
+
+    Each sampled turn is one JSON line: the redacted inbound activity, how
+    long the turn took, and every upstream call made while it ran (name,
+    request arguments, offset, duration, error and, with CAPTURE_RESPONSES,
+    the response body). Upstream calls find their turn through a context
+    variable, so background tasks started by the turn are attributed to it;
+    calls finishing after the turn was written are dropped. Lines are written
+    by one background thread with O_APPEND, so workers can share a file.
+    Capturing stops once the file reaches `max_bytes`.
+    """
+
+    def __init__(self, enabled=CONFIG.CAPTURE, path=CONFIG.CAPTURE_PATH,
+                 sample_rate=CONFIG.CAPTURE_SAMPLE_RATE, max_bytes=CONFIG.CAPTURE_MAX_BYTES,
+                 responses=CONFIG.CAPTURE_RESPONSES):
+        self.enabled = enabled
+        self.path = path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.responses = responses
+        self.turns = 0
+        self.dropped_calls = 0
+        self.bytes = 0
+        self._fd = None
+        self._executor = None
+
+    @property
+    def full(self):
+        return self.bytes >= self.max_bytes
+
+    def _open(self):
+        if self._fd is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                ensure_private_directory(directory)
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            self.bytes = os.fstat(self._fd).st_size
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+            logger.info(f"Capturing {self.sample_rate:.0%} of turns to {self.path}")
+
+    @contextmanager
+    def turn(self, activity):
+        """Capture the turn run inside this block, if it is sampled.
+
+        Yields the record (or None) so the caller can add the response status.
+        """
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield None
+            return
+        self._open()
+        if self.full:
+            yield None
+            return
+
+        record = {
+            "id": uuid.uuid4().hex,
+            "time": time.time(),
+            "activity": redact_activity(activity.serialize() if hasattr(activity, "serialize") else activity),
+            "calls": [],
+        }
+        start = time.perf_counter()
+        token = _current_turn.set((record, start))
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = type(e).__name__
+            raise
+        finally:
+            _current_turn.reset(token)
+            record["duration"] = round(time.perf_counter() - start, 4)
+            record["closed"] = True
+            self._write(record)
+
+    @contextmanager
+    def upstream(self, name, request=None):
+        """Record the upstream call made inside this block against the current turn."""
+        call = UpstreamCall()
+        current = _current_turn.get()
+        if current is None:
+            yield call
+            return
+
+        record, turn_start = current
+        entry = {"name": name, "request": request, "offset": round(time.perf_counter() - turn_start, 4)}
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException as e:
+            entry["error"] = type(e).__name__
+            raise
+        finally:
+            entry["duration"] = round(time.perf_counter() - start, 4)
+            if self.responses and call.response is not None:
+                entry["response"] = jsonable(call.response)
+            if record.get("closed"):
+                self.dropped_calls += 1
+            else:
+                record["calls"].append(entry)
+
+    def _write(self, record):
+        try:
+            line = json.dumps({key: value for key, value in record.items() if key != "closed"},
+                              separators=(",", ":"), default=str)
+            line = (line + "\n").encode()
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Could not serialize captured turn: {e}")
+            return
+        self.turns += 1
+        self.bytes += len(line)
+        self._executor.submit(os.write, self._fd, line)
+
+    def stats(self):
+        return {
+            "enabled": int(self.enabled),
+            "turns": self.turns,
+            "bytes": self.bytes,
+            "dropped_calls": self.dropped_calls,
+        }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            os.close(self._fd)
+            self._executor = None
+            self._fd = None
+
+
+CAPTURE = TrafficCapture()
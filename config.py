@@ -1,18 +1,86 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 class CONFIG:
+    # Server processes (deploy.sh --workers). With more than one, caches, the
+    # access token and conversation state are shared through SHARED_STATE_DIR.
+    WORKERS = int(os.getenv("WORKERS", 1))
+    SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", os.path.join(tempfile.gettempdir(), "apollobot"))
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite" if WORKERS > 1 else "memory").lower()  # "memory" or "sqlite"
+    SHARED_TOKEN = os.getenv("SHARED_TOKEN", str(WORKERS > 1)).lower() == "true"  # One Ingram token for all workers
+
     AZURE_CLIENT_ID = os.getenv("AZURE_CLIENT_ID")
     AZURE_CLIENT_SECRET = os.getenv("AZURE_CLIENT_SECRET")
     AZURE_TENANT_ID = os.getenv("AZURE_TENANT_ID")
     SHAREPOINT_SITE_URL = os.getenv("SHAREPOINT_SITE_URL")
     EXCEL_FILE_URL = os.getenv("EXCEL_FILE_URL")
+    EXCEL_SNAPSHOT_DIR = os.getenv("EXCEL_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "apollobot"))  # Empty disables snapshots
+    EXCEL_REFRESH_INTERVAL = float(os.getenv("EXCEL_REFRESH_INTERVAL", 300))  # Seconds between change checks, 0 disables
+    EXCEL_SEARCH_ENGINE = os.getenv("EXCEL_SEARCH_ENGINE", "index").lower()  # "index" or "vectorized"
+    EXCEL_PAGE_SIZE = int(os.getenv("EXCEL_PAGE_SIZE", 10))  # Excel search results per page, best first
+    GRAPH_RATE_LIMIT = float(os.getenv("GRAPH_RATE_LIMIT", 5))  # Graph calls per second, 0 disables
     
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+    OPENAI_CACHE_TTL = float(os.getenv("OPENAI_CACHE_TTL", 3600))  # Seconds a generic answer is reused
+    OPENAI_CACHE_SIZE = int(os.getenv("OPENAI_CACHE_SIZE", 1000))
+    TYPING_INTERVAL = float(os.getenv("TYPING_INTERVAL", 3))  # Seconds between typing indicators
+    OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", 16))  # Completions streaming at once
+    OPENAI_RATE_LIMIT = float(os.getenv("OPENAI_RATE_LIMIT", 5))  # Completions started per second, 0 disables
     INGRAM_CLIENT_ID = os.getenv("INGRAM_CLIENT_ID")
     INGRAM_CLIENT_SECRET = os.getenv("INGRAM_CLIENT_SECRET")
+    INGRAM_API_HOST = os.getenv("INGRAM_API_HOST", "https://api.ingrammicro.com:443/sandbox")
+    INGRAM_AUTH_HOST = os.getenv("INGRAM_AUTH_HOST", "https://api.ingrammicro.com:443")
+    INGRAM_CUSTOMER_NUMBER = os.getenv("INGRAM_CUSTOMER_NUMBER", "20-222222")
+    INGRAM_COUNTRY_CODE = os.getenv("INGRAM_COUNTRY_CODE", "US")
+    INGRAM_MAX_CONCURRENCY = int(os.getenv("INGRAM_MAX_CONCURRENCY", 16))  # Worker threads / pooled connections
+    INGRAM_TIMEOUT = float(os.getenv("INGRAM_TIMEOUT", 15))  # Seconds per API call
+    INGRAM_RATE_LIMIT = float(os.getenv("INGRAM_RATE_LIMIT", 20))  # Calls per second, 0 disables
+    INGRAM_RATE_BURST = int(os.getenv("INGRAM_RATE_BURST", 40))
+    PA_CACHE_TTL = float(os.getenv("PA_CACHE_TTL", 60))  # Seconds a price-and-availability entry stays fresh
+    PA_CACHE_SIZE = int(os.getenv("PA_CACHE_SIZE", 5000))
+    PA_BATCH_WINDOW = float(os.getenv("PA_BATCH_WINDOW", 0.005))  # Seconds to wait for more misses to batch
+    PA_MAX_BATCH_SIZE = int(os.getenv("PA_MAX_BATCH_SIZE", 50))  # Products per PriceAndAvailabilityRequest
+    PA_BULK_MAX_PARTS = int(os.getenv("PA_BULK_MAX_PARTS", 500))  # Part numbers accepted in one bulk request
+    PA_BULK_TABLE_ROWS = int(os.getenv("PA_BULK_TABLE_ROWS", 50))  # Longer bulk results also come as a CSV file
+    PA_BULK_FILE_MAX_BYTES = int(os.getenv("PA_BULK_FILE_MAX_BYTES", 1024 * 1024))  # Largest uploaded part list
+    PA_RESULT_FILE_TTL = float(os.getenv("PA_RESULT_FILE_TTL", 900))  # Seconds a CSV offered on a consent card is kept
+    PA_RESULT_FILE_CACHE_SIZE = int(os.getenv("PA_RESULT_FILE_CACHE_SIZE", 100))
+    # Hosts (and their subdomains) that uploaded part lists may be downloaded from
+    PA_ATTACHMENT_HOSTS = tuple(host.strip().lower() for host in
+                                os.getenv("PA_ATTACHMENT_HOSTS", "sharepoint.com,sharepoint.us").split(",") if host.strip())
+    SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 120))  # Seconds a search result page stays cached
+    SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 500))
+    SEARCH_OVERFETCH = int(os.getenv("SEARCH_OVERFETCH", 3))  # Catalog page size for "search for available", in result pages
+    SEARCH_PA_BATCH_SIZE = int(os.getenv("SEARCH_PA_BATCH_SIZE", 10))  # Part numbers per concurrent P&A sub-batch
+    SEARCH_MAX_CATALOG_PAGES = int(os.getenv("SEARCH_MAX_CATALOG_PAGES", 5))  # Catalog pages read per available page
+    CONVERSATION_STATE_BACKEND = os.getenv("CONVERSATION_STATE_BACKEND", "sqlite" if WORKERS > 1 else "memory").lower()  # "memory" or "sqlite"
+    CONVERSATION_STATE_PATH = os.getenv("CONVERSATION_STATE_PATH", os.path.join(SHARED_STATE_DIR, "conversation_state.db"))
+    CONVERSATION_STATE_TTL = float(os.getenv("CONVERSATION_STATE_TTL", 4 * 3600))  # Seconds an idle conversation is remembered
+    CONVERSATION_STATE_SIZE = int(os.getenv("CONVERSATION_STATE_SIZE", 10000))  # Conversations kept by the memory backend
+    TOKEN_REFRESH_MARGIN = int(os.getenv("TOKEN_REFRESH_MARGIN", 300))  # Refresh this many seconds before expiry
+    UPSTREAM_RETRIES = int(os.getenv("UPSTREAM_RETRIES", 2))  # Retries of a 429/5xx from Ingram, Graph or OpenAI
+    UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", 0.2))  # Seconds, doubled per retry, jittered
+    UPSTREAM_BACKOFF_CAP = float(os.getenv("UPSTREAM_BACKOFF_CAP", 2))  # Longest wait before a retry
+    UPSTREAM_QUEUE_BUDGET = float(os.getenv("UPSTREAM_QUEUE_BUDGET", 2))  # Seconds a call may queue before it is shed
+    HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", 0.95))  # Latency quantile after which an Ingram read is duplicated
+    HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 0.2))  # Never hedge sooner than this many seconds
+    HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", 0.1))  # Share of calls that may be hedged, 0 disables
+    WARMUP = os.getenv("WARMUP", "true").lower() == "true"  # Get the token and Excel catalog ready at startup
+    WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "false").lower() == "true"  # Don't accept traffic until warm
+    WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", 120))  # Seconds WARMUP_BLOCKING waits before serving anyway
+    WARMUP_RETRY_INTERVAL = float(os.getenv("WARMUP_RETRY_INTERVAL", 10))  # Seconds between attempts of a failed warm-up step
+    CAPTURE = os.getenv("CAPTURE", "false").lower() == "true"  # Record sampled turns for benchmarks/replay.py
+    CAPTURE_PATH = os.getenv("CAPTURE_PATH", os.path.join(SHARED_STATE_DIR, "capture.jsonl"))
+    CAPTURE_SAMPLE_RATE = float(os.getenv("CAPTURE_SAMPLE_RATE", 0.05))  # Share of turns recorded
+    CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", 200 * 1024 * 1024))  # Stop capturing past this file size
+    CAPTURE_RESPONSES = os.getenv("CAPTURE_RESPONSES", "true").lower() == "true"  # Also record upstream response bodies
+    ASYNC_TURNS = os.getenv("ASYNC_TURNS", "false").lower() == "true"  # Acknowledge messages before processing them
+    TURN_QUEUE_SIZE = int(os.getenv("TURN_QUEUE_SIZE", 200))  # Queued turns before new messages get 503
+    TURN_QUEUE_WORKERS = int(os.getenv("TURN_QUEUE_WORKERS", 32))  # Turns processed at once
+    TURN_QUEUE_DRAIN_TIMEOUT = float(os.getenv("TURN_QUEUE_DRAIN_TIMEOUT", 10))  # Seconds to finish queued turns at shutdown
 
     MICROSOFT_APP_ID = os.getenv("MicrosoftAppId")
     MICROSOFT_APP_PASSWORD = os.getenv("MicrosoftAppPassword")
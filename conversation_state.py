@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import astuple, dataclass
+from typing import Optional
+
+from cache import TTLCache
+from config import CONFIG
+from shared_state import ensure_private_directory
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ConversationState:
+    """What a conversation is currently paging through."""
+    search_term: Optional[str] = None
+    page_number: int = 1
+    only_available: bool = False
+    source: str = "ingram"  # "ingram" or "excel"
+
+
+class MemoryStateBackend:
+    """Per-process state; entries expire `ttl` seconds after their last write."""
+
+    def __init__(self, ttl=CONFIG.CONVERSATION_STATE_TTL, maxsize=CONFIG.CONVERSATION_STATE_SIZE):
+        self.entries = TTLCache(maxsize, ttl, name="conversation_state")
+
+    async def get(self, conversation_id):
+        return self.entries.get(conversation_id)
+
+    async def set(self, conversation_id, values):
+        self.entries.set(conversation_id, values)
+
+    def close(self):
+        self.entries.clear()
+
+
+class SQLiteStateBackend:
+    """State in a local SQLite file, shared by every worker on the host."""
+
+    def __init__(self, path=CONFIG.CONVERSATION_STATE_PATH, ttl=CONFIG.CONVERSATION_STATE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._last_purge = 0
+        # sqlite3 connections are bound to one thread, so all queries run on it
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-state")
+        self._connection = None
+
+    def _connect(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                ensure_private_directory(directory)
+            self._connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_state "
+                "(conversation_id TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._connection
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    def _get(self, conversation_id):
+        row = self._connect().execute(
+            "SELECT state FROM conversation_state WHERE conversation_id = ? AND expires_at > ?",
+            (conversation_id, time.time())
+        ).fetchone()
+        return tuple(json.loads(row[0])) if row else None
+
+    def _set(self, conversation_id, values):
+        now = time.time()
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO conversation_state (conversation_id, state, expires_at) VALUES (?, ?, ?)",
+            (conversation_id, json.dumps(values, separators=(",", ":")), now + self.ttl)
+        )
+        if now - self._last_purge > 60:
+            connection.execute("DELETE FROM conversation_state WHERE expires_at <= ?", (now,))
+            self._last_purge = now
+
+    async def get(self, conversation_id):
+        return await self._run(self._get, conversation_id)
+
+    async def set(self, conversation_id, values):
+        await self._run(self._set, conversation_id, values)
+
+    def close(self):
+        def _close():
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        self.executor.submit(_close)
+        self.executor.shutdown(wait=True)
+
+
+BACKENDS = {
+    "memory": MemoryStateBackend,
+    "sqlite": SQLiteStateBackend,
+}
+
+
+class ConversationStateStore:
+    """Conversation-scoped state, keyed by the Bot Framework conversation id."""
+
+    def __init__(self, backend=None):
+        if backend is None:
+            backend = BACKENDS[CONFIG.CONVERSATION_STATE_BACKEND]()
+        self.backend = backend
+
+    async def get(self, conversation_id):
+        values = await self.backend.get(conversation_id)
+        return ConversationState(*values) if values is not None else ConversationState()
+
+    async def save(self, conversation_id, state):
+        # Stored as a plain tuple to keep each entry small
+        await self.backend.set(conversation_id, astuple(state))
+
+    def close(self):
+        self.backend.close()
@@ -1,11 +1,28 @@
 #!/bin/bash
 
+# Usage: ./deploy.sh [--workers N]
+# With more than one worker, the Excel snapshot, Ingram token, result caches
+# and conversation state are shared through SHARED_STATE_DIR.
+# Workers only add throughput with a core each: on a 1 CPU host 2 workers
+# served 0.76x-1.02x the requests of 1. Scaling on more cores hasn't been
+# measured yet; run python benchmarks/bench_workers.py --workers 1 2 4 on
+# the target host before raising it.
+WORKERS=${WORKERS:-1}
+while [[ $# -gt 0 ]]; do
+    case "$1" in
+        --workers) WORKERS="$2"; shift 2 ;;
+        --workers=*) WORKERS="${1#*=}"; shift ;;
+        *) echo "Unknown option: $1"; exit 1 ;;
+    esac
+done
+export WORKERS
+
 # Install dependencies without cache
 pip install -r requirements.txt --no-cache-dir
 
 pip install --upgrade pip
 
 # Start the application
-hypercorn app:app --bind 0.0.0.0:8000
+hypercorn app:app --bind 0.0.0.0:8000 --workers "$WORKERS"
 
 echo "Deployment completed."
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from config import CONFIG
+from excel_search import ExcelSearchIndex, VectorizedExcelSearch
+
+logger = logging.getLogger(__name__)
+
+# One loaded version of the workbook. Searches read a single CatalogState,
+# so the DataFrame and the search engine built for it always belong together.
+CatalogState = namedtuple("CatalogState", ["data", "engine", "version", "loaded_at"])
+
+
+def same_version(a, b):
+    # cTag only changes with the file content; fall back to eTag
+    if a.get("ctag") and b.get("ctag"):
+        return a["ctag"] == b["ctag"]
+    return a.get("etag") == b.get("etag")
+
+
+class ExcelCatalog:
+    """The SharePoint Excel catalog, kept current by a background refresher.
+
+    The refresher polls the drive item's version every `refresh_interval`
+    seconds and only re-downloads and re-indexes when it changed. The new
+    state is built completely before it replaces the old one. With several
+    workers only one polls SharePoint; the others reload from its snapshot.
+    """
+
+    def __init__(self, excel_api, refresh_interval=CONFIG.EXCEL_REFRESH_INTERVAL):
+        self.excel_api = excel_api
+        self.refresh_interval = refresh_interval
+        self.state = None
+        self.checked_at = None
+        self.last_refresh_seconds = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self._lock = None
+        self._refresher = None
+
+    async def load(self):
+        """Load the catalog if it isn't loaded yet and start the refresher."""
+        if self.state is None:
+            async with self._get_lock():
+                if self.state is None:
+                    data, version = await self.excel_api.get_excel_data()
+                    await self._swap(data, version)
+        self.start()
+        return self.state
+
+    async def refresh(self):
+        """Reload the catalog if the source file changed. Returns True if it did."""
+        async with self._get_lock():
+            if not self.excel_api.snapshot.refresher_lock.try_acquire():
+                return await self._refresh_from_snapshot()
+
+            version = await self.excel_api.get_file_version()
+            self.checked_at = time.time()
+            if self.state is not None and same_version(self.state.version, version):
+                logger.debug("Excel catalog is up to date")
+                return False
+
+            start = time.perf_counter()
+            data, version = await self.excel_api.get_excel_data()
+            await self._swap(data, version)
+            self.last_refresh_seconds = time.perf_counter() - start
+            self.refreshes += 1
+            logger.info(f"Excel catalog refreshed to {version.get('etag')} in {self.last_refresh_seconds:.2f}s")
+            return True
+
+    async def _refresh_from_snapshot(self):
+        loop = asyncio.get_running_loop()
+        metadata = await loop.run_in_executor(None, self.excel_api.snapshot.read_metadata)
+        # Checked against the snapshot the refreshing worker keeps current
+        self.checked_at = time.time()
+        if metadata is None or (self.state is not None and self.state.version.get("etag") == metadata.get("etag")):
+            return False
+
+        start = time.perf_counter()
+        data = await self.excel_api.load_snapshot(metadata.get("etag"))
+        if data is None:
+            return False  # Replaced again since the metadata was read; picked up next time
+        version = {"etag": metadata["etag"], "ctag": None, "last_modified": metadata.get("last_modified")}
+        await self._swap(data, version)
+        self.last_refresh_seconds = time.perf_counter() - start
+        self.refreshes += 1
+        logger.info(f"Excel catalog reloaded from snapshot {version['etag']}")
+        return True
+
+    async def _swap(self, data, version):
+        engine = await asyncio.get_running_loop().run_in_executor(None, build_search_engine, data)
+        self.state = CatalogState(data=data, engine=engine, version=version, loaded_at=time.time())
+        self.checked_at = self.state.loaded_at
+
+    def _get_lock(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    def start(self):
+        if self.refresh_interval > 0 and self._refresher is None:
+            self._refresher = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.error(f"Failed to refresh Excel catalog: {str(e)}")
+
+    def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+        self.excel_api.snapshot.refresher_lock.release()
+
+    def status(self):
+        now = time.time()
+        state = self.state
+        return {
+            "loaded": state is not None,
+            "rows": len(state.data) if state is not None else 0,
+            "etag": state.version.get("etag") if state is not None else None,
+            "last_modified": str(state.version.get("last_modified")) if state is not None else None,
+            "age_seconds": now - state.loaded_at if state is not None else None,
+            # Time since the source was last confirmed unchanged
+            "staleness_seconds": now - self.checked_at if self.checked_at is not None else None,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
+
+
+def build_search_engine(data):
+    if CONFIG.EXCEL_SEARCH_ENGINE == "index":
+        try:
+            engine = ExcelSearchIndex(data)
+            logger.info(f"Excel search index built: {len(engine.tokens)} tokens")
+            return engine
+        except Exception as e:
+            logger.error(f"Failed to build Excel search index, using vectorized search: {str(e)}")
+    return VectorizedExcelSearch(data)
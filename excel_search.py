@@ -0,0 +1,199 @@
+import functools
+import logging
+import re
+from bisect import bisect_right
+from collections import Counter, defaultdict
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = ['Description', 'Category', 'Sub Category']
+
+
+def parse_keywords(keywords):
+    return set(keywords.lower().split())
+
+
+def search_text(df):
+    # The text each row is matched against: the search columns lowercased
+    # and concatenated, exactly as the row-wise matcher builds it.
+    text = df[SEARCH_COLUMNS[0]].astype(str).str.lower()
+    for column in SEARCH_COLUMNS[1:]:
+        text = text + df[column].astype(str).str.lower()
+    return text
+
+
+def bm25(term_frequency, lengths, average_length, document_frequency, row_count, k1=1.2, b=0.75):
+    """BM25 weight of one keyword for rows with the given term frequencies and lengths."""
+    import numpy as np
+    idf = np.log(1 + (row_count - document_frequency + 0.5) / (document_frequency + 0.5))
+    return idf * term_frequency * (k1 + 1) / (term_frequency + k1 * (1 - b + b * lengths / average_length))
+
+
+def order_by_score(rows, scores):
+    import numpy as np
+    # Best first; equal scores keep the sheet order
+    return rows[np.argsort(-scores, kind="stable")]
+
+
+def apply_search(df, keywords):
+    """Row-wise reference implementation, kept for comparison benchmarks."""
+    keywords_set = parse_keywords(keywords)
+
+    def match_keywords(row):
+        text = (str(row['Description']).lower() +
+                str(row['Category']).lower() +
+                str(row['Sub Category']).lower())
+        return all(keyword in text for keyword in keywords_set)
+
+    return df[df.apply(match_keywords, axis=1)]
+
+
+class VectorizedExcelSearch:
+    """Substring search over a search-text column precomputed once per load.
+
+    Each keyword is a single vectorized `str.contains` over the rows still
+    matching, so results are identical to `apply_search` without any
+    per-row Python calls. `rank` orders the matches by BM25 over substring
+    occurrence counts.
+    """
+
+    def __init__(self, df, rank_cache_size=256):
+        import numpy as np
+        self.row_count = len(df)
+        # Positional index so matches map straight back to row positions
+        self.text = search_text(df).reset_index(drop=True)
+        self.lengths = self.text.str.split().str.len().to_numpy(dtype=np.float64)
+        self.average_length = max(self.lengths.mean(), 1.0) if self.row_count else 1.0
+        self.rank = functools.lru_cache(maxsize=rank_cache_size)(self._rank)
+
+    def search(self, keywords):
+        """Return the sorted row positions matching every keyword."""
+        candidates = self.text
+        for keyword in sorted(parse_keywords(keywords), key=len, reverse=True):
+            candidates = candidates[candidates.str.contains(keyword, regex=False).to_numpy()]
+            if candidates.empty:
+                break
+        return candidates.index.to_numpy()
+
+    def _rank(self, keywords):
+        """Row positions matching every keyword, most relevant first (BM25)."""
+        import numpy as np
+        rows = self.search(keywords)
+        keywords_set = parse_keywords(keywords)
+        if not rows.size or not keywords_set:
+            return rows
+        text = self.text.iloc[rows]
+        scores = np.zeros(rows.size)
+        for keyword in keywords_set:
+            document_frequency = int(self.text.str.contains(keyword, regex=False).sum())
+            term_frequency = text.str.count(re.escape(keyword)).to_numpy(dtype=np.float64)
+            scores += bm25(term_frequency, self.lengths[rows], self.average_length, document_frequency, self.row_count)
+        return order_by_score(rows, scores)
+
+
+class ExcelSearchIndex:
+    """Inverted index from text tokens to the rows containing them.
+
+    Keywords never contain whitespace, so a keyword is a substring of a row's
+    text exactly when it is a substring of one of the row's whitespace
+    separated tokens. A query therefore finds the matching tokens in the
+    vocabulary, unions their postings and intersects across keywords, which
+    returns the same rows as the substring scan in `apply_search`. `rank`
+    orders those rows by BM25, counting a keyword once per occurrence of
+    each token that contains it.
+    """
+
+    def __init__(self, df, keyword_cache_size=1024, rank_cache_size=256):
+        import numpy as np
+        postings = defaultdict(list)
+        counts = defaultdict(list)
+        lengths = []
+        for row, text in enumerate(search_text(df).tolist()):
+            row_tokens = text.split()
+            lengths.append(len(row_tokens))
+            for token, count in Counter(row_tokens).items():
+                postings[token].append(row)
+                counts[token].append(count)
+
+        self.row_count = len(df)
+        self.tokens = list(postings)
+        self.postings = [np.array(postings[token], dtype=np.int64) for token in self.tokens]
+        # Occurrences of each token in each of its posting rows, for ranking
+        self.counts = [np.array(counts[token], dtype=np.float64) for token in self.tokens]
+        self.lengths = np.array(lengths, dtype=np.float64)
+        self.average_length = max(self.lengths.mean(), 1.0) if self.row_count else 1.0
+
+        # All tokens in one newline separated string, so finding the tokens
+        # that contain a keyword is a str.find scan instead of a Python loop
+        self._vocabulary = "\n".join(self.tokens) + "\n"
+        self._starts = []
+        offset = 0
+        for token in self.tokens:
+            self._starts.append(offset)
+            offset += len(token) + 1
+
+        self.rows_for_keyword = functools.lru_cache(maxsize=keyword_cache_size)(self._rows_for_keyword)
+        self.frequencies_for_keyword = functools.lru_cache(maxsize=keyword_cache_size)(self._frequencies_for_keyword)
+        self.rank = functools.lru_cache(maxsize=rank_cache_size)(self._rank)
+        logger.debug(f"Built Excel search index: {self.row_count} rows, {len(self.tokens)} tokens")
+
+    def _token_ids(self, keyword):
+        token_ids = []
+        position = self._vocabulary.find(keyword)
+        while position != -1:
+            token_id = bisect_right(self._starts, position) - 1
+            token_ids.append(token_id)
+            # Skip to the next token; one hit per token is enough
+            position = self._vocabulary.find(keyword, self._starts[token_id] + len(self.tokens[token_id]) + 1)
+        return token_ids
+
+    def _rows_for_keyword(self, keyword):
+        import numpy as np
+        token_ids = self._token_ids(keyword)
+        if not token_ids:
+            return np.empty(0, dtype=np.int64)
+        if len(token_ids) == 1:
+            return self.postings[token_ids[0]]
+        return np.unique(np.concatenate([self.postings[token_id] for token_id in token_ids]))
+
+    def search(self, keywords):
+        """Return the sorted row positions matching every keyword."""
+        import numpy as np
+        keywords_set = parse_keywords(keywords)
+        if not keywords_set:
+            return np.arange(self.row_count)
+
+        rows = None
+        # Longer keywords tend to be rarer, which keeps the intersections small
+        for keyword in sorted(keywords_set, key=len, reverse=True):
+            keyword_rows = self.rows_for_keyword(keyword)
+            rows = keyword_rows if rows is None else np.intersect1d(rows, keyword_rows, assume_unique=True)
+            if not rows.size:
+                break
+        return rows
+
+    def _frequencies_for_keyword(self, keyword):
+        """(rows, occurrences) of every token containing the keyword, summed per row."""
+        import numpy as np
+        token_ids = self._token_ids(keyword)
+        if not token_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        rows = np.concatenate([self.postings[token_id] for token_id in token_ids])
+        counts = np.concatenate([self.counts[token_id] for token_id in token_ids])
+        rows, inverse = np.unique(rows, return_inverse=True)
+        return rows, np.bincount(inverse, weights=counts)
+
+    def _rank(self, keywords):
+        """Row positions matching every keyword, most relevant first (BM25)."""
+        import numpy as np
+        rows = self.search(keywords)
+        keywords_set = parse_keywords(keywords)
+        if not rows.size or not keywords_set:
+            return rows
+        scores = np.zeros(rows.size)
+        for keyword in keywords_set:
+            keyword_rows, frequencies = self.frequencies_for_keyword(keyword)
+            # Every matching row contains every keyword, so each is in keyword_rows
+            term_frequency = frequencies[np.searchsorted(keyword_rows, rows)]
+            scores += bm25(term_frequency, self.lengths[rows], self.average_length, keyword_rows.size, self.row_count)
+        return order_by_score(rows, scores)
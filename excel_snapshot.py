@@ -0,0 +1,117 @@
+import importlib.util
+import json
+import logging
+import os
+import tempfile
+import time
+
+from config import CONFIG
+from file_lock import FileLock
+from shared_state import ensure_private_directory
+
+logger = logging.getLogger(__name__)
+
+METADATA_KEY = b"apollobot.source"
+
+
+class ExcelSnapshot:
+    """Parsed Excel catalog persisted as an Arrow/Feather file.
+
+    The source file's eTag and lastModified are stored in the file's schema
+    metadata, so data and version are always replaced together. Reads go
+    through a memory map, which lets every worker on the host share the
+    page cache instead of re-parsing the workbook.
+
+    `lock` serializes building the snapshot across workers, and the worker
+    holding `refresher_lock` is the one that polls SharePoint for changes.
+    """
+
+    def __init__(self, directory=CONFIG.EXCEL_SNAPSHOT_DIR, name="excel_catalog"):
+        self.path = os.path.join(directory, f"{name}.feather")
+        # pyarrow is optional and slow to import, so it is only looked for here
+        # and imported on first use
+        available = importlib.util.find_spec("pyarrow") is not None
+        self.enabled = available and bool(directory)
+        if not available:
+            logger.warning("pyarrow is not installed; Excel snapshots are disabled")
+        self.lock = FileLock(self.path + ".lock" if self.enabled else None)
+        self.refresher_lock = FileLock(os.path.join(directory, f"{name}.refresher.lock") if self.enabled else None)
+
+    def read_metadata(self):
+        if not self.enabled or not os.path.exists(self.path):
+            return None
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        try:
+            with pa.memory_map(self.path) as source:
+                metadata = pa.ipc.open_file(source).schema.metadata or {}
+            return json.loads(metadata[METADATA_KEY])
+        except Exception as e:
+            logger.warning(f"Unreadable Excel snapshot {self.path}: {str(e)}")
+            return None
+
+    def load(self, etag=None):
+        """Return the snapshot DataFrame, or None if missing or not for `etag`."""
+        metadata = self.read_metadata()
+        if metadata is None:
+            return None
+        if etag is not None and metadata.get("etag") != etag:
+            logger.info(f"Excel snapshot is stale ({metadata.get('etag')} != {etag})")
+            return None
+
+        import pyarrow as pa
+        start = time.perf_counter()
+        with pa.memory_map(self.path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        df = table.to_pandas()
+        logger.info(f"Loaded Excel snapshot ({len(df)} rows) in {time.perf_counter() - start:.3f}s")
+        return df
+
+    def save(self, df, etag, last_modified=None):
+        if not self.enabled:
+            return False
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        try:
+            table = pa.Table.from_pandas(_arrow_compatible(df), preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[METADATA_KEY] = json.dumps({
+                "etag": etag,
+                "last_modified": str(last_modified) if last_modified is not None else None,
+                "saved_at": time.time(),
+                "rows": len(df),
+            })
+            table = table.replace_schema_metadata(metadata)
+
+            directory = os.path.dirname(self.path)
+            ensure_private_directory(directory)
+            # Write next to the target and rename so readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            logger.info(f"Saved Excel snapshot to {self.path}")
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to save Excel snapshot: {str(e)}")
+            return False
+
+
+def _arrow_compatible(df):
+    # Excel columns often mix numbers and text, which Arrow cannot store in
+    # one column; keep the text form for those, leaving empty cells empty.
+    import pandas as pd
+    converted = None
+    for column in df.columns:
+        if df[column].dtype != object:
+            continue
+        values = df[column].dropna()
+        if values.map(type).nunique() > 1:
+            if converted is None:
+                converted = df.copy()
+            converted[column] = df[column].map(lambda value: value if pd.isna(value) else str(value))
+    return df if converted is None else converted
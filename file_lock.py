@@ -0,0 +1,76 @@
+import asyncio
+import os
+
+from shared_state import ensure_private_directory
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows has no flock; only safe with one worker
+    fcntl = None
+
+
+class FileLock:
+    """Exclusive flock on a file, for coordinating the workers on one host.
+
+    `async with lock:` waits for the lock on a thread so the event loop keeps
+    running; tasks of the same process also queue on an asyncio.Lock, because
+    flock doesn't exclude holders of the same file descriptor.
+    `try_acquire()` takes the lock without waiting and keeps it until
+    `release()`, which is used to elect the one worker doing a periodic job.
+    The OS drops the lock if the process dies. A `path` of None disables it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.held = False
+        self._fd = None
+        self._local = None
+
+    def _open(self):
+        if self._fd is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                ensure_private_directory(directory)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        return self._fd
+
+    def _lock(self, blocking=True):
+        if self.path is None or fcntl is None:
+            return True
+        try:
+            fcntl.flock(self._open(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock(self):
+        if self._fd is not None and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def try_acquire(self):
+        if not self.held:
+            self.held = self._lock(blocking=False)
+        return self.held
+
+    def release(self):
+        if self.held:
+            self._unlock()
+            self.held = False
+
+    async def __aenter__(self):
+        if self._local is None:
+            self._local = asyncio.Lock()
+        await self._local.acquire()
+        acquired = asyncio.get_running_loop().run_in_executor(None, self._lock)
+        try:
+            await asyncio.shield(acquired)
+        except BaseException:
+            # The thread still takes the lock; give it back once it has
+            acquired.add_done_callback(lambda _: self._unlock())
+            self._local.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._unlock()
+        self._local.release()
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from capture import CAPTURE
+from config import CONFIG
+from metrics import track
+from resilience import Dependency
+
+logger = logging.getLogger(__name__)
+
+
+class GraphSession:
+    """Long-lived Microsoft Graph access to the SharePoint Excel file.
+
+    The GraphClient (and with it the cached Azure AD token) is created once,
+    and the site, drive and item ids are resolved on first use, so later
+    loads go straight to the item. All Graph calls run on a dedicated thread
+    because the office365 client is synchronous and not thread-safe.
+    """
+
+    def __init__(self, tenant_id, client_id, client_secret, site_url, file_path):
+        self.tenant_id = tenant_id
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.site_url = site_url
+        self.file_path = file_path
+        self.site_id = None
+        self.drive_id = None
+        self.item_id = None
+        self._client = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="graph")
+        # Graph calls load the catalog in the background rather than answer a
+        # user directly, so they may queue longer than user-facing calls
+        self.limits = Dependency("graph", 1, rate=CONFIG.GRAPH_RATE_LIMIT, queue_budget=30)
+
+    @property
+    def client(self):
+        if self._client is None:
+            # Imported here, on the Graph thread, to keep it out of startup
+            from office365.graph_client import GraphClient
+            self._client = GraphClient.with_client_secret(self.tenant_id, self.client_id, self.client_secret)
+        return self._client
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await self.limits.call(loop.run_in_executor, self.executor, func, *args)
+
+    async def get_site_id(self):
+        return await self.run(self._resolve_site)
+
+    async def get_item(self):
+        """The drive item's metadata (eTag, cTag, lastModifiedDateTime, ...)."""
+        with track("graph_metadata"), CAPTURE.upstream("graph_metadata"):
+            return await self.run(self._get_item)
+
+    async def download(self):
+        # Timing only; the workbook itself is never captured
+        with track("graph_download"), CAPTURE.upstream("graph_download"):
+            return await self.run(self._download)
+
+    def _resolve_site(self):
+        if self.site_id is None:
+            site = self.client.sites.get_by_url(self.site_url).get().execute_query()
+            self.site_id = site.id
+        return self.site_id
+
+    def _resolve_item(self):
+        site_id = self._resolve_site()
+        drives = self.client.sites[site_id].drives.get().execute_query()
+
+        if not drives:
+            raise Exception("No drives found in the site")
+
+        drive = drives[0]
+        file = drive.root.get_by_path(self.file_path).get().execute_query()
+        self.drive_id, self.item_id = drive.id, file.id
+        logger.info(f"Resolved Excel file to drive {self.drive_id}, item {self.item_id}")
+        return file
+
+    def _item(self):
+        return self.client.drives[self.drive_id].items[self.item_id]
+
+    def _forget_item(self, e):
+        # The cached ids go stale if the file is replaced or moved
+        if not _is_not_found(e):
+            raise e
+        logger.info("Cached Excel item id is stale, resolving the file path again")
+        self.drive_id = self.item_id = None
+
+    def _get_item(self):
+        from office365.runtime.client_request_exception import ClientRequestException
+        if self.item_id is not None:
+            try:
+                return self._item().get().execute_query()
+            except ClientRequestException as e:
+                self._forget_item(e)
+        return self._resolve_item()
+
+    def _download(self):
+        from office365.runtime.client_request_exception import ClientRequestException
+        if self.item_id is None:
+            self._resolve_item()
+        try:
+            content = self._item().get_content().execute_query()
+        except ClientRequestException as e:
+            self._forget_item(e)
+            self._resolve_item()
+            content = self._item().get_content().execute_query()
+
+        if not isinstance(content, bytes):
+            if hasattr(content, 'value'):
+                content = content.value
+        return content
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _is_not_found(e):
+    response = getattr(e, "response", None)
+    return response is not None and response.status_code == 404
@@ -0,0 +1,176 @@
+import asyncio
+import functools
+import logging
+import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from capture import CAPTURE
+from config import CONFIG
+from metrics import track
+from resilience import Dependency, Hedge
+
+logger = logging.getLogger(__name__)
+
+
+class _NotRaised(Exception):
+    """Stands in for ApiException until the SDK is imported; nothing raises it."""
+
+
+def __getattr__(name):
+    # `except ingram_client.ApiException` without importing the SDK up front:
+    # if it isn't imported yet, no Ingram call can have raised one
+    if name == "ApiException":
+        rest = sys.modules.get("xi.sdk.resellers.rest")
+        return rest.ApiException if rest is not None else _NotRaised
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class IngramClient:
+    """Long-lived, shared access to the Ingram Micro reseller APIs.
+
+    The xi.sdk.resellers clients are synchronous, so every call is run on a
+    bounded thread pool instead of the event loop. One ApiClient is kept per
+    host so the urllib3 pool (and its keep-alive connections) is reused
+    across messages.
+
+    The SDK takes most of a second to import, so it is imported, and the
+    clients built, on a worker thread by the first call rather than when
+    the bot is created.
+    """
+
+    def __init__(self,
+                 api_host=CONFIG.INGRAM_API_HOST,
+                 auth_host=CONFIG.INGRAM_AUTH_HOST,
+                 max_concurrency=CONFIG.INGRAM_MAX_CONCURRENCY,
+                 timeout=CONFIG.INGRAM_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.customer_number = CONFIG.INGRAM_CUSTOMER_NUMBER
+        self.country_code = CONFIG.INGRAM_COUNTRY_CODE
+
+        self.api_host = api_host
+        self.auth_host = auth_host
+        self.access_token = None
+        self.api_client = None
+        self.auth_client = None
+        self.catalog_api = None
+        self.accesstoken_api = None
+        self._sdk_lock = threading.Lock()
+
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="ingram")
+        self.limits = Dependency("ingram", max_concurrency,
+                                 rate=CONFIG.INGRAM_RATE_LIMIT, burst=CONFIG.INGRAM_RATE_BURST)
+        # Searches and P&A lookups are reads, so a slow one can safely be sent twice
+        self.hedges = {
+            "search": Hedge("ingram_search"),
+            "price_and_availability": Hedge("ingram_price_and_availability"),
+        }
+
+    @property
+    def loaded(self):
+        return self.catalog_api is not None
+
+    def _load_sdk(self):
+        with self._sdk_lock:
+            if self.loaded:
+                return
+            import xi.sdk.resellers
+            from xi.sdk.resellers.api.accesstoken_api import AccesstokenApi
+            from xi.sdk.resellers.api.product_catalog_api import ProductCatalogApi
+
+            self.api_client = xi.sdk.resellers.ApiClient(self._configuration(xi.sdk.resellers, self.api_host))
+            self.auth_client = xi.sdk.resellers.ApiClient(self._configuration(xi.sdk.resellers, self.auth_host))
+            self.api_client.configuration.access_token = self.access_token
+            self.accesstoken_api = AccesstokenApi(self.auth_client)
+            self.catalog_api = ProductCatalogApi(self.api_client)
+
+    async def load(self):
+        if not self.loaded:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self._load_sdk)
+
+    def _configuration(self, sdk, host):
+        configuration = sdk.Configuration(host=host)
+        # One pooled connection per worker thread
+        configuration.connection_pool_maxsize = self.max_concurrency
+        return configuration
+
+    async def run(self, api, method, *args, **kwargs):
+        await self.load()
+        func = getattr(getattr(self, api), method)
+        call = functools.partial(func, *args, _request_timeout=self.timeout, **kwargs)
+        return await self.limits.call(self._execute, call)
+
+    async def _execute(self, call):
+        # Time spent queued behind busy workers counts against the timeout, so
+        # a backlog surfaces as a timeout instead of an ever-growing queue.
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(self.executor, call), self.timeout)
+
+    def set_access_token(self, access_token):
+        # A token shared by another worker may arrive before the SDK is loaded
+        self.access_token = access_token
+        if self.api_client is not None:
+            self.api_client.configuration.access_token = access_token
+
+    @staticmethod
+    def correlation_id():
+        return str(uuid.uuid4())[:32]  # Truncate to 32 characters
+
+    async def get_access_token(self, client_id, client_secret):
+        # The response holds the token, so only the timing is captured
+        with track("ingram_token"), CAPTURE.upstream("ingram_token"):
+            return await self.run("accesstoken_api", "get_accesstoken", 'client_credentials', client_id, client_secret)
+
+    async def fetch_access_token(self, client_id, client_secret):
+        api_response = await self.get_access_token(client_id, client_secret)
+        return api_response.access_token, int(api_response.expires_in)
+
+    async def search(self, keyword, page_number, page_size=10):
+        request = {"keyword": keyword, "page_number": page_number, "page_size": page_size}
+        with track("ingram_search"), CAPTURE.upstream("ingram_search", request) as call:
+            call.response = await self.hedges["search"].call(self._search, keyword, page_number, page_size)
+            return call.response
+
+    async def _search(self, keyword, page_number, page_size):
+        return await self.run(
+            "catalog_api", "get_reseller_v6_productsearch",
+            im_customer_number=self.customer_number,
+            im_correlation_id=self.correlation_id(),
+            im_country_code=self.country_code,
+            page_size=page_size,
+            page_number=page_number,
+            keyword=[keyword]
+        )
+
+    async def price_and_availability(self, part_numbers):
+        request = {"part_numbers": list(part_numbers)}
+        with track("ingram_price_and_availability"), CAPTURE.upstream("ingram_price_and_availability", request) as call:
+            call.response = await self.hedges["price_and_availability"].call(self._price_and_availability, part_numbers)
+            return call.response
+
+    async def _price_and_availability(self, part_numbers):
+        await self.load()
+        from xi.sdk.resellers.models.price_and_availability_request import PriceAndAvailabilityRequest
+        from xi.sdk.resellers.models.price_and_availability_request_products_inner import (
+            PriceAndAvailabilityRequestProductsInner
+        )
+        products = [PriceAndAvailabilityRequestProductsInner(ingram_part_number=part_number)
+                    for part_number in part_numbers]
+        return await self.run(
+            "catalog_api", "post_priceandavailability",
+            im_customer_number=self.customer_number,
+            im_correlation_id=self.correlation_id(),
+            im_country_code=self.country_code,
+            include_availability=True,
+            include_pricing=True,
+            price_and_availability_request=PriceAndAvailabilityRequest(products=products)
+        )
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for api_client in (self.api_client, self.auth_client):
+            if api_client is not None:
+                api_client.rest_client.pool_manager.clear()
+        logger.info("Ingram client closed")
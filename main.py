@@ -1,31 +1,39 @@
 import os
+import asyncio
+import functools
 from dotenv import load_dotenv
-import xi.sdk.resellers
 from xi.sdk.resellers.rest import ApiException
 from pprint import pprint
+from ingram_client import IngramClient
+from token_manager import TokenManager
 
 # Load environment variables
 load_dotenv()
 
-# Configure the SDK
-configuration = xi.sdk.resellers.Configuration(
-    host="https://api.ingrammicro.com:443"
-)
 
-# Create an API client
-with xi.sdk.resellers.ApiClient(configuration) as api_client:
-    # Create an instance of the API class
-    api_instance = xi.sdk.resellers.AccesstokenApi(api_client)
-    
+async def main():
+    # Create an API client
+    ingram = IngramClient()
+
     # Set up your credentials
-    grant_type = 'client_credentials'
     client_id = os.getenv('INGRAM_CLIENT_ID')
     client_secret = os.getenv('INGRAM_CLIENT_SECRET')
 
+    token_manager = TokenManager(
+        functools.partial(ingram.fetch_access_token, client_id, client_secret),
+        on_refresh=ingram.set_access_token
+    )
+
     try:
         # Get access token
-        api_response = api_instance.get_accesstoken(grant_type, client_id, client_secret)
+        access_token = await token_manager.get_token()
         print("Access token response:")
-        pprint(api_response)
+        pprint({"access_token": access_token, **token_manager.stats()})
     except ApiException as e:
         print(f"Exception when calling AccesstokenApi->get_accesstoken: {e}\n")
+    finally:
+        token_manager.close()
+        ingram.close()
+
+
+asyncio.run(main())
@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers cache hits through slow upstream calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _labels(self, key):
+        return dict(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            return [(self.name + "_total", self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # one slot per bucket, then sum
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-1] += value
+
+    def collect(self):
+        samples = []
+        with self._lock:
+            for key, counts in self._values.items():
+                labels = self._labels(key)
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((self.name + "_bucket", {**labels, "le": _format_value(bound)}, count))
+                samples.append((self.name + "_sum", labels, counts[-1]))
+                samples.append((self.name + "_count", labels, counts[-2]))
+        return samples
+
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text format.
+
+    Collectors are callables returning `(name, type, help, samples)` tuples,
+    for values that are read from elsewhere (cache stats, queue sizes) at
+    scrape time instead of being updated as they change.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        families = [(m.name, m.type, m.documentation, m.collect()) for m in self._metrics.values()]
+        for collector in self._collectors:
+            families.extend(collector())
+
+        lines = []
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "apollobot_stage_duration_seconds", "Time spent in each processing stage.", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "apollobot_stage_errors", "Errors raised by each processing stage.", ["stage"])
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "apollobot_stage_in_flight", "Calls currently running in each processing stage.", ["stage"])
+
+
+@contextmanager
+def track(stage):
+    """Record latency, errors and concurrency of the wrapped block under `stage`."""
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        # A cancelled call is not an error of the stage itself
+        raise
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+def stats_families(name, label, stats_by_owner, documentation):
+    """Gauge families for the numeric fields of `stats()` dicts, one label value per owner."""
+    fields = {}
+    for owner, stats in stats_by_owner.items():
+        for field, value in stats.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                fields.setdefault(field, []).append((f"{name}_{field}", {label: owner}, value))
+    return [(f"{name}_{field}", "gauge", f"{documentation} ({field}).", samples)
+            for field, samples in fields.items()]
+
+
+def summary_family(name, label, latency_by_owner, documentation, quantiles=(0.5, 0.95, 0.99)):
+    """A summary family from router.LatencyStats-style objects."""
+    samples = []
+    for owner, latency in latency_by_owner.items():
+        for q in quantiles:
+            samples.append((name, {label: owner, "quantile": str(q)}, latency.percentile(q)))
+        samples.append((name + "_sum", {label: owner}, latency.total))
+        samples.append((name + "_count", {label: owner}, latency.count))
+    return (name, "summary", documentation, samples)
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from cache import make_cache
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class PriceAvailabilityCache:
+    """Caches price-and-availability results per part number.
+
+    Lookups that miss the cache are not sent one by one: misses arriving
+    within `batch_window` seconds of each other are merged into a single
+    upstream request of at most `max_batch_size` products, and concurrent
+    lookups of the same part number share one pending result.
+
+    `fetch` is an async callable taking a list of part numbers and returning
+    the price-and-availability entries for them.
+    """
+
+    def __init__(self, fetch,
+                 customer_number=CONFIG.INGRAM_CUSTOMER_NUMBER,
+                 country_code=CONFIG.INGRAM_COUNTRY_CODE,
+                 ttl=CONFIG.PA_CACHE_TTL,
+                 maxsize=CONFIG.PA_CACHE_SIZE,
+                 batch_window=CONFIG.PA_BATCH_WINDOW,
+                 max_batch_size=CONFIG.PA_MAX_BATCH_SIZE):
+        self.fetch = fetch
+        self.customer_number = customer_number
+        self.country_code = country_code
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.cache = make_cache(maxsize, ttl, "price_and_availability")
+        self._pending = {}  # key -> Future waiting for the next batch
+        self._in_flight = {}  # key -> Future already sent upstream
+        self._flush_handle = None
+        self.batches = 0
+        self.batched_parts = 0
+
+    def _key(self, part_number):
+        return (self.customer_number, self.country_code, part_number.upper())
+
+    async def get_many(self, part_numbers, batch_size=None):
+        """Return the entries for `part_numbers` in order, None where unknown.
+
+        With `batch_size`, pending misses are sent as soon as that many have
+        gathered, so callers can run smaller requests side by side.
+        """
+        loop = asyncio.get_running_loop()
+        # One lookup for the whole list; with the SQLite backend that is one query
+        results = self.cache.get_many(dict.fromkeys(self._key(part_number) for part_number in part_numbers))
+        waiting = {}
+        for part_number in part_numbers:
+            key = self._key(part_number)
+            if key in results or key in waiting:
+                continue
+            future = self._pending.get(key) or self._in_flight.get(key)
+            if future is None:
+                future = loop.create_future()
+                future.add_done_callback(_consume_exception)
+                self._pending[key] = future
+                self._schedule_flush(loop, batch_size)
+            waiting[key] = future
+
+        if waiting:
+            # Shielded: the futures are shared with other callers
+            values = await asyncio.gather(*(asyncio.shield(future) for future in waiting.values()))
+            results.update(zip(waiting.keys(), values))
+        return [results[self._key(part_number)] for part_number in part_numbers]
+
+    async def get(self, part_number):
+        return (await self.get_many([part_number]))[0]
+
+    def invalidate(self, part_number):
+        self.cache.pop(self._key(part_number))
+
+    def _schedule_flush(self, loop, batch_size=None):
+        if len(self._pending) >= min(batch_size or self.max_batch_size, self.max_batch_size):
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = {key: pending[key] for key in keys[start:start + self.max_batch_size]}
+            self._in_flight.update(batch)
+            asyncio.ensure_future(self._fetch_batch(batch))
+
+    async def _fetch_batch(self, batch):
+        part_numbers = [key[2] for key in batch]
+        self.batches += 1
+        self.batched_parts += len(part_numbers)
+        logger.debug(f"Fetching price and availability for {len(part_numbers)} part numbers")
+        try:
+            response = await self.fetch(part_numbers)
+        except asyncio.CancelledError:
+            for future in batch.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            for key in batch:
+                self._in_flight.pop(key, None)
+
+        response = list(response or [])
+        by_part = {}
+        for info in response:
+            if getattr(info, 'ingram_part_number', None):
+                by_part[info.ingram_part_number.upper()] = info
+        if len(response) == len(part_numbers):
+            # Entries without a part number are matched by position
+            for part_number, info in zip(part_numbers, response):
+                by_part.setdefault(part_number, info)
+
+        found = {key: by_part[key[2]] for key in batch if key[2] in by_part}
+        self.cache.set_many(found)
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["batches"] = self.batches
+        stats["batched_parts"] = self.batched_parts
+        stats["in_flight"] = len(self._in_flight)
+        return stats
+
+
+def _consume_exception(future):
+    # A waiter may have been cancelled; don't warn about unretrieved errors
+    if not future.cancelled():
+        future.exception()
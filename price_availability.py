@@ -0,0 +1,227 @@
+import csv
+import io
+import re
+from urllib.parse import urlsplit
+
+import aiohttp
+from botbuilder.schema import Attachment
+from botbuilder.schema.teams import FileConsentCard, FileInfoCard
+
+# Part numbers are separated by commas, semicolons, tabs or line breaks
+PART_NUMBER_SEPARATORS = re.compile(r"[,;\t\r\n]+")
+HEADER_WORDS = ("part", "sku", "number")
+# Legacy .xls would need xlrd, which isn't a dependency; openpyxl reads .xlsx
+PART_NUMBER_FILE_TYPES = (".csv", ".txt", ".xlsx")
+TEAMS_FILE_DOWNLOAD_INFO = "application/vnd.microsoft.teams.file.download.info"
+TEAMS_FILE_CONSENT = "application/vnd.microsoft.teams.card.file.consent"
+TEAMS_FILE_INFO = "application/vnd.microsoft.teams.card.file.info"
+PRICE_AND_AVAILABILITY_FILE = "price_and_availability.csv"
+
+
+def parse_part_numbers(text):
+    """Unique, uppercased part numbers from pasted text, in the order given."""
+    parts = (part.strip().upper() for part in PART_NUMBER_SEPARATORS.split(text or ""))
+    return list(dict.fromkeys(part for part in parts if part))
+
+
+def part_numbers_from_frame(df):
+    """Part numbers from a sheet read with header=None.
+
+    Uses the column whose first cell looks like a part number header
+    ("Ingram Part Number", "SKU", ...), otherwise the first column.
+    """
+    if df.empty:
+        return []
+    column, skip = 0, 0
+    header = [str(value).lower() for value in df.iloc[0]]
+    for i, value in enumerate(header):
+        if any(word in value for word in HEADER_WORDS):
+            # Prefer the Ingram column when a sheet has several part number columns
+            if column == 0 or "ingram" in value:
+                column, skip = i, 1
+    values = df.iloc[skip:, column].dropna().astype(str)
+    return parse_part_numbers("\n".join(values))
+
+
+def read_csv_rows(content):
+    """Rows of a CSV or text upload, which is often just one part number per line."""
+    text = content.decode("utf-8-sig", errors="replace")
+    try:
+        # Only real separators: left to guess, a one-column file gets split on a letter
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t")
+    except csv.Error:
+        return [[line] for line in text.splitlines() if line.strip()]
+    return [row for row in csv.reader(io.StringIO(text), dialect) if any(cell.strip() for cell in row)]
+
+
+def read_part_numbers_file(name, content):
+    """Part numbers from an uploaded CSV or Excel file."""
+    import pandas as pd
+    if name.lower().endswith(".xlsx"):
+        df = pd.read_excel(io.BytesIO(content), header=None, dtype=str)
+    else:
+        df = pd.DataFrame(read_csv_rows(content), dtype=str)
+    return part_numbers_from_frame(df)
+
+
+def is_allowed_file_url(url, hosts):
+    """Whether `url` is https on one of `hosts` or their subdomains."""
+    parts = urlsplit(url or "")
+    host = (parts.hostname or "").lower()
+    return parts.scheme == "https" and any(host == allowed or host.endswith("." + allowed) for allowed in hosts)
+
+
+def part_numbers_attachment(attachments, hosts):
+    """(name, url) of the first attached part number list, or None.
+
+    Only Teams file uploads are read: they come as download info with a
+    pre-authenticated SharePoint downloadUrl. The file's rows are echoed
+    back, so any other URL the activity names is never fetched.
+    """
+    for attachment in attachments or []:
+        name = attachment.name or ""
+        if not name.lower().endswith(PART_NUMBER_FILE_TYPES):
+            continue
+        if attachment.content_type != TEAMS_FILE_DOWNLOAD_INFO or not isinstance(attachment.content, dict):
+            continue
+        url = attachment.content.get("downloadUrl")
+        if is_allowed_file_url(url, hosts):
+            return name, url
+    return None
+
+
+async def download_attachment(url, max_bytes, timeout):
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        # A redirect could lead off the allowed hosts
+        async with session.get(url, allow_redirects=False) as response:
+            response.raise_for_status()
+            if response.status != 200:
+                raise ValueError(f"The file download returned HTTP {response.status}")
+            content = await response.content.read(max_bytes + 1)
+    if len(content) > max_bytes:
+        raise ValueError(f"The file is larger than {max_bytes // 1024} KB")
+    return content
+
+
+def format_price(value):
+    return f"${value:.2f}" if value is not None else "N/A"
+
+
+def format_price_and_availability(part_number, product_info):
+    """The detailed reply for one part number."""
+    if product_info is None:
+        return f"**No price and availability information found for part number {part_number}**."
+
+    response = f"**Name**: {product_info.description or 'N/A'}  \n"
+    response += f"**Ingram Part Number**: {product_info.ingram_part_number}  \n"
+    response += f"**Vendor Part Number**: {product_info.vendor_part_number or 'N/A'}  \n"
+
+    if product_info.availability:
+        total_availability = product_info.availability.total_availability
+        response += f"**Availability**: {'Available' if total_availability > 0 else 'Not Available'}  \n"
+        response += f"**Total Availability**: {total_availability}  \n"
+
+        availability_by_warehouse = product_info.availability.availability_by_warehouse or []
+        available_warehouses = [
+            f"**Warehouse**: {wh.location if hasattr(wh, 'location') else 'N/A'}, "
+            f"**Quantity Available**: {wh.quantity_available}"
+            for wh in availability_by_warehouse
+            if hasattr(wh, 'quantity_available') and wh.quantity_available > 0
+        ]
+
+        if available_warehouses:
+            response += "**Availability by Warehouse**:  \n" + "  \n".join(available_warehouses) + "  \n"
+        else:
+            response += "**No warehouses with available stock**.  \n"
+
+    if product_info.pricing:
+        response += f"**Pricing (Currency {product_info.pricing.currency_code or 'N/A'})**:  \n"
+        if hasattr(product_info.pricing, 'retail_price'):
+            retail_price = product_info.pricing.retail_price
+            response += f"**Retail Price**: ${retail_price:.2f}  \n" if retail_price is not None else "Retail Price: N/A  \n"
+        if hasattr(product_info.pricing, 'customer_price'):
+            customer_price = product_info.pricing.customer_price
+            response += f"**Customer Price**: ${customer_price:.2f}  \n" if customer_price is not None else "Customer Price: N/A  \n"
+    return response
+
+
+def summary_row(part_number, product_info):
+    """One compact row per part number, with the same values as the detailed reply."""
+    if product_info is None:
+        return [part_number, "", "Not found", "", "", "", "", ""]
+    availability = product_info.availability
+    pricing = product_info.pricing
+    total_availability = availability.total_availability if availability else None
+    return [
+        product_info.ingram_part_number or part_number,
+        product_info.vendor_part_number or "N/A",
+        product_info.description or "N/A",
+        ("Available" if total_availability > 0 else "Not Available") if total_availability is not None else "N/A",
+        total_availability if total_availability is not None else "N/A",
+        (pricing.currency_code or "N/A") if pricing else "N/A",
+        format_price(getattr(pricing, "customer_price", None)),
+        format_price(getattr(pricing, "retail_price", None)),
+    ]
+
+
+SUMMARY_COLUMNS = ["Ingram Part", "Vendor Part", "Name", "Availability", "Qty", "Currency", "Customer", "Retail"]
+
+
+def format_price_and_availability_table(rows, name_width=40):
+    """A markdown table of summary rows."""
+    def cell(value, width=None):
+        text = str(value).replace("|", "/").replace("\n", " ")
+        return text if width is None or len(text) <= width else text[:width - 1] + "…"
+
+    lines = ["| " + " | ".join(SUMMARY_COLUMNS) + " |", "|" + "---|" * len(SUMMARY_COLUMNS)]
+    for row in rows:
+        lines.append("| " + " | ".join(cell(value, name_width if i == 2 else None) for i, value in enumerate(row)) + " |")
+    return "\n".join(lines)
+
+
+def price_and_availability_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(SUMMARY_COLUMNS)
+    writer.writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def can_send_files(activity):
+    # Teams only offers file uploads from a bot in 1:1 chats
+    conversation = activity.conversation
+    return activity.channel_id == "msteams" and getattr(conversation, "conversation_type", None) == "personal"
+
+
+def file_consent_card(name, size, file_id):
+    """Asks the user to let the bot put a file in their OneDrive.
+
+    The file is kept under `file_id`, which comes back in the accept (or
+    decline) context, so exactly the `size` bytes the card announced are
+    uploaded.
+    """
+    card = FileConsentCard(
+        description="Price and availability for all requested part numbers",
+        size_in_bytes=size,
+        accept_context={"file_id": file_id},
+        decline_context={"file_id": file_id},
+    )
+    return Attachment(content_type=TEAMS_FILE_CONSENT, name=name, content=card)
+
+
+async def upload_file(upload_url, content, timeout):
+    """PUT `content` to the upload session Teams created for a consent card."""
+    headers = {"Content-Length": str(len(content)), "Content-Range": f"bytes 0-{len(content) - 1}/{len(content)}"}
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        async with session.put(upload_url, data=content, headers=headers, allow_redirects=False) as response:
+            response.raise_for_status()
+
+
+def file_info_card(upload_info):
+    """The card that shows an uploaded file in the chat."""
+    return Attachment(
+        content_type=TEAMS_FILE_INFO,
+        name=upload_info.name,
+        content_url=upload_info.content_url,
+        content=FileInfoCard(unique_id=upload_info.unique_id, file_type=upload_info.file_type),
+    )
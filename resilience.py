@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "I'm handling a lot of requests right now. Please try again in a few seconds."
+
+
+class Overloaded(Exception):
+    """A call was shed because it would have waited longer than the dependency's queue budget."""
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adapts to the upstream (AIMD).
+
+    Every successful call raises the limit by 1/limit (about +1 per full
+    window), and a 429, 503 or timeout halves it, at most once per second, so
+    a struggling upstream sees less concurrency instead of more retries. The
+    limit stays between `min_limit` and `max_limit`.
+    """
+
+    def __init__(self, max_limit, min_limit=1, name="upstream"):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min(min_limit, max_limit)
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.latency = 0.0  # moving average, seconds
+        self._waiters = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def waiting(self):
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def expected_wait(self):
+        # How long a new call would queue if the current pace holds
+        return (self.waiting + 1) / max(int(self.limit), 1) * self.latency
+
+    async def acquire(self, budget):
+        if self.in_flight < int(self.limit) and not self.waiting:
+            self.in_flight += 1
+            return
+        if self.expected_wait() > budget:
+            raise Overloaded(f"expected wait {self.expected_wait():.2f}s exceeds {budget}s")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, budget)
+        except BaseException as e:
+            # The slot may have been handed over just before the timeout or cancellation
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded(f"no free slot within {budget}s")
+            raise
+
+    def release(self, elapsed, overloaded=False):
+        self.in_flight -= 1
+        self.latency = elapsed if not self.latency else 0.8 * self.latency + 0.2 * elapsed
+        now = time.monotonic()
+        if overloaded:
+            if now - self._last_decrease > 1.0:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+                logger.warning(f"{self.name} overloaded, concurrency limit lowered to {int(self.limit)}")
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot is handed over; the woken caller doesn't take it again
+                self.in_flight += 1
+                waiter.set_result(None)
+
+
+class TokenBucket:
+    """Rate limit of `rate` calls per second with bursts of up to `burst`.
+
+    Tokens are reserved up front (the balance may go negative), so callers
+    are served in arrival order and each knows its wait before sleeping.
+    A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, budget):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > budget:
+            self.tokens += 1
+            raise Overloaded(f"rate limit wait {wait:.2f}s exceeds {budget}s")
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.tokens += 1
+                raise
+
+
+def status_of(e):
+    """HTTP status of an Ingram (ApiException), Graph or OpenAI error, if any."""
+    status = getattr(e, "status", None) or getattr(e, "status_code", None)
+    if status is None:
+        response = getattr(e, "response", None)
+        status = getattr(response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(e):
+    headers = getattr(e, "headers", None) or getattr(getattr(e, "response", None), "headers", None)
+    value = headers.get("Retry-After") if headers else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class Dependency:
+    """Admission control for one upstream: rate limit, adaptive concurrency and retries.
+
+    `call` waits at most `queue_budget` seconds for a token and a slot, and
+    raises Overloaded straight away when the wait would be longer, so the bot
+    can answer "busy" quickly instead of piling up slow turns. 429 and 5xx
+    responses are retried up to `retries` times with full-jitter backoff,
+    honouring Retry-After when it fits within `backoff_cap`.
+    """
+
+    def __init__(self, name, max_concurrency, rate=0, burst=None,
+                 retries=CONFIG.UPSTREAM_RETRIES,
+                 backoff_base=CONFIG.UPSTREAM_BACKOFF_BASE,
+                 backoff_cap=CONFIG.UPSTREAM_BACKOFF_CAP,
+                 queue_budget=CONFIG.UPSTREAM_QUEUE_BUDGET):
+        self.name = name
+        self.limiter = AdaptiveLimiter(max_concurrency, name=name)
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.queue_budget = queue_budget
+        self.calls = 0
+        self.retried = 0
+        self.shed = 0
+        self.overloads = 0
+
+    def _backoff(self, attempt, e):
+        delay = retry_after(e)
+        if delay is None:
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        return delay
+
+    async def _admit(self):
+        try:
+            await self.bucket.acquire(self.queue_budget)
+            await self.limiter.acquire(self.queue_budget)
+        except Overloaded as e:
+            self.shed += 1
+            logger.warning(f"Shedding {self.name} call: {e}")
+            raise
+
+    async def call(self, func, *args, **kwargs):
+        """Await `func(*args, **kwargs)` under this dependency's limits."""
+        for attempt in range(self.retries + 1):
+            await self._admit()
+            self.calls += 1
+            start = time.monotonic()
+            overloaded = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                status = status_of(e)
+                overloaded = status in (429, 503) or isinstance(e, asyncio.TimeoutError)
+                self.overloads += int(overloaded)
+                retryable = status is not None and (status == 429 or status >= 500)
+                delay = self._backoff(attempt, e) if retryable else None
+                if not retryable or attempt == self.retries or delay > self.backoff_cap:
+                    raise
+                self.retried += 1
+                logger.warning(f"{self.name} call failed with {status}, retry {attempt + 1} in {delay:.2f}s")
+            finally:
+                self.limiter.release(time.monotonic() - start, overloaded)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "limit": int(self.limiter.limit),
+            "in_flight": self.limiter.in_flight,
+            "waiting": self.limiter.waiting,
+            "latency_seconds": self.limiter.latency,
+            "calls": self.calls,
+            "retries": self.retried,
+            "shed": self.shed,
+            "overloads": self.overloads,
+        }
+
+
+class Hedge:
+    """Tail-latency hedging for one kind of idempotent call.
+
+    When an attempt has run longer than the `quantile` of recent latencies
+    (and at least `min_delay`), a duplicate is sent; whichever succeeds
+    first is returned and the other is cancelled. Until `min_samples`
+    latencies are known nothing is hedged, and at most `max_ratio` of calls
+    are, so a uniformly slow upstream doesn't get twice the load.
+    """
+
+    def __init__(self, name, quantile=CONFIG.HEDGE_QUANTILE, min_delay=CONFIG.HEDGE_MIN_DELAY,
+                 max_ratio=CONFIG.HEDGE_MAX_RATIO, min_samples=20, window=500):
+        self.name = name
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self.latencies = deque(maxlen=window)
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay(self):
+        """Seconds to wait before hedging, or None to not hedge this call."""
+        if self.max_ratio <= 0 or len(self.latencies) < self.min_samples:
+            return None
+        if self.hedged >= self.max_ratio * self.calls:
+            return None
+        ordered = sorted(self.latencies)
+        return max(self.min_delay, ordered[min(int(self.quantile * len(ordered)), len(ordered) - 1)])
+
+    async def call(self, func, *args, **kwargs):
+        """Await `func(*args, **kwargs)`, hedged once if it is slow."""
+        self.calls += 1
+        delay = self.delay()
+        start = time.monotonic()
+        attempts = [asyncio.ensure_future(func(*args, **kwargs))]
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    logger.debug(f"Hedging {self.name} call after {delay:.2f}s")
+                    attempts.append(asyncio.ensure_future(func(*args, **kwargs)))
+
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in (a for a in attempts if a in done):
+                    if attempt.exception() is None:
+                        hedge = attempt is not attempts[0]
+                        self.hedge_wins += int(hedge)
+                        # Each attempt's own duration, so hedging doesn't skew the threshold
+                        self.latencies.append(time.monotonic() - start - (delay if hedge else 0))
+                        return attempt.result()
+                    error = error or attempt.exception()
+            raise error
+        finally:
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+                elif not attempt.cancelled():
+                    attempt.exception()  # A losing attempt's error isn't worth a warning
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "delay_seconds": self.delay() or 0.0,
+        }
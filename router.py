@@ -0,0 +1,108 @@
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyStats:
+    """Count, mean, max and recent percentiles of a handler's latency."""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def record(self, seconds, error=False):
+        self.count += 1
+        self.errors += int(error)
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentile(self, q):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class CommandRouter:
+    """Routes each message to exactly one handler.
+
+    Commands are either exact messages ("next") or prefixes followed by an
+    argument ("search for product laptop"). A prefix only matches whole
+    words: it must be followed by whitespace or, unless it was registered
+    with a trailing space (meaning an argument is required), the end of the
+    message. Prefixes are bucketed by their first word and tried longest
+    first, so "search for available x" never falls through to "search for
+    x". The text is lowercased once per message. Handlers are awaited as
+    `handler(turn_context, argument)`.
+    """
+
+    def __init__(self, fallback, fallback_name="fallback"):
+        self.fallback = (fallback_name, fallback)
+        self._exact = {}
+        self._prefixes = {}  # first word -> [(prefix, requires_argument, name, handler)], longest first
+        self.stats = {fallback_name: LatencyStats()}
+
+    def exact(self, text, name, handler):
+        self._exact[text.lower()] = (name, handler)
+        self.stats.setdefault(name, LatencyStats())
+
+    def prefix(self, prefix, name, handler):
+        requires_argument = prefix.endswith(" ")
+        prefix = prefix.lower().rstrip()
+        bucket = self._prefixes.setdefault(prefix.split()[0], [])
+        bucket.append((prefix, requires_argument, name, handler))
+        bucket.sort(key=lambda entry: len(entry[0]), reverse=True)
+        self.stats.setdefault(name, LatencyStats())
+
+    def match(self, text):
+        """Return (name, handler, argument) for a message."""
+        text = text.strip()
+        lower = text.lower()
+
+        command = self._exact.get(lower)
+        if command is not None:
+            return command[0], command[1], ""
+
+        first_word = lower.split(maxsplit=1)[0] if lower else ""
+        for prefix, requires_argument, name, handler in self._prefixes.get(first_word, ()):
+            if not lower.startswith(prefix):
+                continue
+            # "price and availability forward" is not "price and availability for" + "ward"
+            rest = lower[len(prefix):]
+            if rest[:1].isspace() or (not rest and not requires_argument):
+                return name, handler, text[len(prefix):].strip()
+
+        return self.fallback[0], self.fallback[1], text
+
+    async def dispatch(self, turn_context, text):
+        name, handler, argument = self.match(text)
+        logger.debug(f"Routing message to '{name}'")
+        start = time.perf_counter()
+        error = False
+        try:
+            return await handler(turn_context, argument)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.stats[name].record(time.perf_counter() - start, error)
+
+    def summary(self):
+        return {name: stats.summary() for name, stats in self.stats.items()}
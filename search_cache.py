@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from collections import namedtuple
+from cache import MISSING, make_cache
+from config import CONFIG
+
+logger = logging.getLogger(__name__)
+
+# products: list of (catalog product, price-and-availability entry) pairs to show
+# found: the catalog returned anything for this page at all
+# has_more: the catalog page was full, so a next page may exist
+SearchPage = namedtuple("SearchPage", ["products", "found", "has_more"])
+
+
+class SearchPageCache:
+    """Caches Ingram search result pages per (term, only_available, page).
+
+    Concurrent requests for the same page share one fetch, and `prefetch`
+    loads a page in the background so "next" can be answered from memory.
+
+    `fetch` is an async callable `(search_term, only_available, page_number)`
+    returning a SearchPage.
+    """
+
+    def __init__(self, fetch, ttl=CONFIG.SEARCH_CACHE_TTL, maxsize=CONFIG.SEARCH_CACHE_SIZE):
+        self.fetch = fetch
+        self.pages = make_cache(maxsize, ttl, "search_pages")
+        self._in_flight = {}
+        self.prefetches = 0
+
+    @staticmethod
+    def _key(search_term, only_available, page_number):
+        return (search_term.strip().lower(), bool(only_available), page_number)
+
+    async def get_page(self, search_term, only_available, page_number):
+        key = self._key(search_term, only_available, page_number)
+        page = self.pages.get(key, MISSING)
+        if page is not MISSING:
+            return page
+        task = self._in_flight.get(key) or self._start(key, search_term, only_available, page_number)
+        return await asyncio.shield(task)
+
+    def prefetch(self, search_term, only_available, page_number):
+        key = self._key(search_term, only_available, page_number)
+        if key in self.pages or key in self._in_flight:
+            return
+        self.prefetches += 1
+        self._start(key, search_term, only_available, page_number)
+
+    def _start(self, key, search_term, only_available, page_number):
+        task = asyncio.ensure_future(self._load(key, search_term, only_available, page_number))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return task
+
+    async def _load(self, key, search_term, only_available, page_number):
+        page = await self.fetch(search_term, only_available, page_number)
+        self.pages.set(key, page)
+        return page
+
+    def _done(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.debug(f"Loading search page {key} failed: {task.exception()}")
+
+    def stats(self):
+        stats = self.pages.stats()
+        stats["in_flight"] = len(self._in_flight)
+        stats["prefetches"] = self.prefetches
+        return stats
+
+
+def is_available(p_and_a_info):
+    return bool(p_and_a_info and p_and_a_info.availability and p_and_a_info.availability.total_availability > 0)
+
+
+class AvailableProductSearch:
+    """The in-stock products for one search term, read ahead through the catalog.
+
+    Catalog pages are `catalog_page_size` products, several result pages at
+    once, since many products are out of stock. Each catalog page is priced
+    in `batch_size` sub-batches sent side by side, and the next catalog page
+    is requested while the current one is being priced. Products are kept in
+    catalog order, so result page N is always the same slice.
+
+    `search` is an async callable `(page_number, page_size)` returning
+    catalog products; `price_and_availability` is an async callable
+    `(part_numbers, batch_size)` returning their entries in order.
+    """
+
+    def __init__(self, search, price_and_availability,
+                 catalog_page_size, batch_size=CONFIG.SEARCH_PA_BATCH_SIZE,
+                 max_catalog_pages=CONFIG.SEARCH_MAX_CATALOG_PAGES):
+        self.search = search
+        self.price_and_availability = price_and_availability
+        self.catalog_page_size = catalog_page_size
+        self.batch_size = batch_size
+        self.max_catalog_pages = max_catalog_pages
+        self.products = []  # (catalog product, price-and-availability entry), in stock only
+        self.found = False
+        self.exhausted = False
+        self.catalog_pages = 0
+        self._lookahead = None
+        self._lock = asyncio.Lock()
+
+    async def page(self, page_number, page_size):
+        end = page_number * page_size
+        async with self._lock:
+            read = 0
+            # One more than the page, to know whether a next page exists
+            while len(self.products) <= end and not self.exhausted and read < self.max_catalog_pages:
+                await self._read_catalog_page()
+                read += 1
+        return SearchPage(
+            products=self.products[end - page_size:end],
+            found=self.found,
+            has_more=len(self.products) > end or not self.exhausted,
+        )
+
+    def _fetch_catalog_page(self, catalog_page):
+        task = asyncio.ensure_future(self.search(catalog_page, self.catalog_page_size))
+        task.add_done_callback(_consume_exception)
+        return task
+
+    async def _read_catalog_page(self):
+        task = self._lookahead or self._fetch_catalog_page(self.catalog_pages + 1)
+        self._lookahead = None
+        catalog = list(await task or [])[:self.catalog_page_size]
+        if not catalog:
+            self.catalog_pages += 1
+            self.exhausted = True
+            return
+
+        # Pipelined: the next catalog page loads while this one is priced
+        full = len(catalog) == self.catalog_page_size
+        lookahead = self._fetch_catalog_page(self.catalog_pages + 2) if full else None
+        batches = [catalog[start:start + self.batch_size] for start in range(0, len(catalog), self.batch_size)]
+        try:
+            entries = await asyncio.gather(*(
+                self.price_and_availability([product.ingram_part_number for product in batch], self.batch_size)
+                for batch in batches
+            ))
+        except BaseException:
+            # Nothing is recorded, so the next attempt starts from this catalog page again
+            if lookahead is not None:
+                lookahead.cancel()
+            raise
+
+        self.catalog_pages += 1
+        self.found = True
+        self.exhausted = not full
+        self._lookahead = lookahead
+        for batch, batch_entries in zip(batches, entries):
+            self.products.extend(
+                (product, info) for product, info in zip(batch, batch_entries) if is_available(info))
+
+
+def _consume_exception(task):
+    # A read-ahead nobody ends up awaiting shouldn't warn about its error
+    if not task.cancelled():
+        task.exception()
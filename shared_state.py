@@ -0,0 +1,20 @@
+import os
+
+
+def ensure_private_directory(directory):
+    """Create `directory` for this user only, or check that an existing one is theirs.
+
+    Shared state defaults to a predictable path under the system temp
+    directory, so another local user could create it first and plant or
+    read the files in it (cached values are unpickled, the token file holds
+    a live token). An existing directory must belong to this user; its mode
+    is tightened to 0700 if a previous version created it more open.
+    """
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, "geteuid"):  # pragma: no cover - no POSIX ownership to check
+        return
+    info = os.stat(directory)
+    if info.st_uid != os.geteuid():
+        raise PermissionError(f"{directory} belongs to another user (uid {info.st_uid}); refusing to use it")
+    if info.st_mode & 0o077:
+        os.chmod(directory, 0o700)
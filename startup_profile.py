@@ -0,0 +1,65 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+# Prints how long the import itself took, after -X importtime's own lines
+TIMED_IMPORT = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def parse_importtime(output):
+    """(module, depth, self_us, cumulative_us) for each line of -X importtime output."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return imports
+
+
+def profile_startup(module="app", python=sys.executable):
+    """Import `module` in a fresh interpreter and break down where the time went."""
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", TIMED_IMPORT.format(module=module)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = parse_importtime(result.stderr)
+    by_package = defaultdict(int)
+    for name, _, self_us, _ in imports:
+        by_package[name.split(".")[0]] += self_us
+    return {
+        "module": module,
+        "seconds": float(result.stdout.strip().splitlines()[-1]),
+        "modules": len(imports),
+        "packages": dict(sorted(by_package.items(), key=lambda item: -item[1])),
+        "imports": sorted(imports, key=lambda item: -item[3]),
+    }
+
+
+def report(profile, top=20):
+    print(f"import {profile['module']}: {profile['seconds']:.3f}s, {profile['modules']} modules\n")
+    print(f"{'package':<40}{'self ms':>10}")
+    for package, self_us in list(profile["packages"].items())[:top]:
+        print(f"{package:<40}{self_us / 1000:>10.1f}")
+    print(f"\n{'import':<60}{'cumulative ms':>15}{'self ms':>10}")
+    for name, depth, self_us, cumulative_us in profile["imports"][:top]:
+        print(f"{'  ' * depth + name:<60}{cumulative_us / 1000:>15.1f}{self_us / 1000:>10.1f}")
+
+
+def main(module="app", top=20, json_path=None, fail_seconds=None):
+    """Print the profile; returns the exit status, 1 if the import took over `fail_seconds`."""
+    profile = profile_startup(module)
+    report(profile, top)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(profile, f, indent=2)
+    if fail_seconds is not None and profile["seconds"] > fail_seconds:
+        print(f"\nimport {module} took longer than {fail_seconds}s")
+        return 1
+    return 0
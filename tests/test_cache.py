@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import shared_state
+from cache import SQLiteTTLCache, TTLCache
+from shared_state import ensure_private_directory
+
+
+def test_ttl_cache_expires_and_evicts():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=-1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    cache.set("c", 3)
+    cache.set("d", 4)
+    assert "a" not in cache
+    assert cache.evictions == 1
+
+
+def test_sqlite_cache_is_shared(tmp_path):
+    path = str(tmp_path / "state" / "cache.db")
+    first = SQLiteTTLCache(10, 60, "pa", path=path)
+    second = SQLiteTTLCache(10, 60, "pa", path=path)
+    other = SQLiteTTLCache(10, 60, "answers", path=path)
+    first.set(("C1", "US", "ABC"), {"price": 1.5})
+    assert second.get(("C1", "US", "ABC")) == {"price": 1.5}
+    assert other.get(("C1", "US", "ABC")) is None
+    first.set("expired", 1, ttl=-1)
+    assert second.get("expired", "default") == "default"
+
+
+def test_sqlite_cache_skips_a_locked_database(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteTTLCache(10, 60, "pa", path=path)
+    cache.set("a", 1)
+
+    # Another worker holding the write lock must not stall this one
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+    try:
+        start = time.perf_counter()
+        cache.set("b", 2)
+        assert time.perf_counter() - start < 1
+        assert cache.busy == 1
+        # WAL readers don't wait for writers
+        assert cache.get("a") == 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    assert cache.get("b") is None
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def any_cache(request, tmp_path):
+    if request.param == "memory":
+        return TTLCache(maxsize=2000, ttl=60)
+    return SQLiteTTLCache(2000, 60, "pa", path=str(tmp_path / "cache.db"))
+
+
+def test_batch_reads_and_writes(any_cache):
+    any_cache.set_many({("C1", "US", f"P{i}"): {"qty": i} for i in range(1200)})
+    any_cache.set_many({"expired": 1}, ttl=-1)
+    keys = [("C1", "US", f"P{i}") for i in range(0, 1300, 100)] + ["expired"]
+
+    found = any_cache.get_many(keys)
+    assert found == {("C1", "US", f"P{i}"): {"qty": i} for i in range(0, 1200, 100)}
+    assert (any_cache.hits, any_cache.misses) == (12, 2)
+    assert any_cache.get_many([]) == {}
+
+
+def test_sqlite_batch_read_is_one_query_per_chunk(tmp_path, monkeypatch):
+    cache = SQLiteTTLCache(2000, 60, "pa", path=str(tmp_path / "cache.db"))
+    cache.set_many({f"P{i}": i for i in range(1200)})
+    statements = []
+    execute = cache._execute
+    monkeypatch.setattr(cache, "_execute", lambda sql, params=(): statements.append(sql) or execute(sql, params))
+
+    assert len(cache.get_many([f"P{i}" for i in range(1200)])) == 1200
+    assert len(statements) == 3  # 500 keys per statement
+
+
+def test_sqlite_batch_write_skips_a_locked_database(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteTTLCache(10, 60, "pa", path=path)
+    cache.set("a", 1)
+
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+    try:
+        start = time.perf_counter()
+        cache.set_many({"b": 2, "c": 3})
+        assert time.perf_counter() - start < 1
+        assert cache.busy == 1
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1}
+    cache.set_many({"b": 2, "c": 3})
+    assert cache.get_many(["a", "b", "c"]) == {"a": 1, "b": 2, "c": 3}
+
+
+def test_private_directory_is_created_for_this_user_only(tmp_path):
+    directory = str(tmp_path / "apollobot")
+    ensure_private_directory(directory)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+    os.chmod(directory, 0o755)
+    ensure_private_directory(directory)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+def test_private_directory_of_another_user_is_refused(tmp_path, monkeypatch):
+    directory = str(tmp_path / "apollobot")
+    os.mkdir(directory, 0o700)
+    monkeypatch.setattr(shared_state.os, "geteuid", lambda: os.stat(directory).st_uid + 1)
+    with pytest.raises(PermissionError):
+        ensure_private_directory(directory)
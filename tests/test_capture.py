@@ -0,0 +1,81 @@
+import json
+
+from botbuilder.schema import Activity
+
+from capture import TrafficCapture, pseudonym, redact_activity
+
+UPLOAD_URL = "https://contoso-my.sharepoint.com/personal/user/_api/v2.0/drive/items/1/uploadSession?tempauth=secret"
+
+FILE_CONSENT_INVOKE = {
+    "type": "invoke",
+    "name": "fileConsent/invoke",
+    "channelId": "msteams",
+    "serviceUrl": "https://smba.trafficmanager.net/amer/",
+    "from": {"id": "29:user", "name": "Jane Doe", "aadObjectId": "aad-user"},
+    "conversation": {"id": "a:conversation", "conversationType": "personal", "tenantId": "tenant"},
+    "channelData": {"tenant": {"id": "tenant"}},
+    "value": {
+        "type": "fileUpload",
+        "action": "accept",
+        "context": {"part_numbers": ["ABC123", "DEF456"]},
+        "uploadInfo": {
+            "contentUrl": "https://contoso-my.sharepoint.com/personal/user/Documents/price_and_availability.csv",
+            "name": "price_and_availability.csv",
+            "uploadUrl": UPLOAD_URL,
+            "uniqueId": "unique-id",
+            "fileType": "csv",
+        },
+    },
+}
+
+
+def test_file_consent_invoke_keeps_no_urls_or_part_numbers():
+    redacted = redact_activity(FILE_CONSENT_INVOKE)
+    dumped = json.dumps(redacted)
+    assert "https://" not in dumped
+    assert "tempauth" not in dumped
+    assert "ABC123" not in dumped
+    assert "Jane Doe" not in dumped and "tenant" not in dumped
+    assert redacted["name"] == "fileConsent/invoke"
+    assert redacted["value"] == {"action": "accept"}
+    assert redacted["conversation"] == {"id": pseudonym("a:conversation")}
+
+
+def test_serialized_activity_is_redacted_the_same_way():
+    activity = Activity().deserialize(FILE_CONSENT_INVOKE)
+    assert "https://" not in json.dumps(redact_activity(activity.serialize()))
+
+
+def test_card_submit_values_are_dropped():
+    activity = {"type": "message", "text": "", "value": {"action": "search", "query": "my secret"}}
+    assert redact_activity(activity)["value"] == {"action": "search"}
+
+
+def test_attachments_keep_only_their_kind():
+    activity = {
+        "type": "message",
+        "text": "parts",
+        "attachments": [{
+            "contentType": "application/vnd.microsoft.teams.file.download.info",
+            "name": "parts.csv",
+            "content": {"downloadUrl": UPLOAD_URL},
+        }],
+    }
+    redacted = redact_activity(activity)
+    assert redacted["attachments"] == [
+        {"contentType": "application/vnd.microsoft.teams.file.download.info", "name": "parts.csv"}]
+    assert "https://" not in json.dumps(redacted)
+
+
+def test_captured_turn_is_written_redacted(tmp_path):
+    path = tmp_path / "capture" / "turns.jsonl"
+    capture = TrafficCapture(enabled=True, path=str(path), sample_rate=1, max_bytes=1 << 20, responses=False)
+    with capture.turn(Activity().deserialize(FILE_CONSENT_INVOKE)):
+        with capture.upstream("price_and_availability", ["ABC123"]):
+            pass
+    capture.close()
+
+    record = json.loads(path.read_text())
+    assert "https://" not in json.dumps(record["activity"])
+    assert [call["name"] for call in record["calls"]] == ["price_and_availability"]
+    assert capture.stats()["turns"] == 1
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from conversation_state import ConversationState, ConversationStateStore, MemoryStateBackend, SQLiteStateBackend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    backends = []
+
+    def make(ttl=60):
+        if request.param == "memory":
+            backend = MemoryStateBackend(ttl=ttl, maxsize=100)
+        else:
+            backend = SQLiteStateBackend(path=str(tmp_path / "state" / "conversation_state.db"), ttl=ttl)
+        backends.append(backend)
+        return backend
+
+    yield make
+    for backend in backends:
+        backend.close()
+
+
+def test_state_round_trips(make_backend):
+    store = ConversationStateStore(make_backend())
+    state = ConversationState(search_term="usb-c cable", page_number=3, only_available=True, source="ingram")
+
+    async def main():
+        await store.save("conversation-1", state)
+        return await store.get("conversation-1"), await store.get("conversation-2")
+
+    saved, missing = asyncio.run(main())
+    assert saved == state
+    assert missing == ConversationState()
+
+
+def test_later_save_replaces_the_state(make_backend):
+    store = ConversationStateStore(make_backend())
+
+    async def main():
+        await store.save("conversation-1", ConversationState(search_term="laptop"))
+        await store.save("conversation-1", ConversationState(search_term="laptop", page_number=2, source="excel"))
+        return await store.get("conversation-1")
+
+    assert asyncio.run(main()) == ConversationState(search_term="laptop", page_number=2, source="excel")
+
+
+def test_state_expires(make_backend):
+    store = ConversationStateStore(make_backend(ttl=0.05))
+
+    async def main():
+        await store.save("conversation-1", ConversationState(search_term="laptop"))
+        await asyncio.sleep(0.1)
+        return await store.get("conversation-1")
+
+    assert asyncio.run(main()) == ConversationState()
+
+
+def test_sqlite_state_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "conversation_state.db")
+    first = ConversationStateStore(SQLiteStateBackend(path=path, ttl=60))
+    second = ConversationStateStore(SQLiteStateBackend(path=path, ttl=60))
+    state = ConversationState(search_term="monitor", page_number=2)
+
+    async def main():
+        await first.save("conversation-1", state)
+        return await second.get("conversation-1")
+
+    try:
+        assert asyncio.run(main()) == state
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from excel_search import ExcelSearchIndex, VectorizedExcelSearch, apply_search
+
+ENGINES = [ExcelSearchIndex, VectorizedExcelSearch]
+
+
+@pytest.fixture(scope="module")
+def sheet():
+    # Mixed dtypes, as read from the workbook: text, NaN cells, numbers in a text column
+    return pd.DataFrame({
+        "Part Number": ["SKU1", "SKU2", "SKU3", "SKU4", "SKU5", "SKU6", "SKU7"],
+        "Description": [
+            "USB-C Cable 1m", "HDMI cable (2m) black", "Laptop i7 16GB", np.nan,
+            "Dock USB-C 65W", "Toner C.M.Y+K [4 pack]", "cable cable organiser",
+        ],
+        "Category": ["Accessories", "Accessories", "Computers", "Storage", np.nan, "Printing", "Accessories"],
+        "Sub Category": ["Cables", "Cables", "Notebooks", 512, "Docks", np.nan, "Cables"],
+        "Price": [9.99, 14.5, np.nan, 80, 120.0, 35.25, 4],
+    }, index=[10, 11, 12, 13, 14, 15, 16])
+
+
+KEYWORDS = [
+    "cable", "CABLE usb-c", "usb-c cable 1m", "laptop i7", "accessoriescables",
+    "(2m)", "c.m.y+k", "[4", ".", "+", "nan", "512", "zzz-no-match", "", "   ",
+]
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+@pytest.mark.parametrize("keywords", KEYWORDS)
+def test_engines_match_the_same_rows_as_apply_search(sheet, engine_class, keywords):
+    engine = engine_class(sheet)
+    expected = apply_search(sheet, keywords).index.tolist()
+    assert sheet.index[engine.search(keywords)].tolist() == expected
+    # Ranking reorders the same rows
+    assert sorted(sheet.index[engine.rank(keywords)].tolist()) == expected
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+def test_empty_keywords_match_every_row(sheet, engine_class):
+    assert engine_class(sheet).search("").tolist() == list(range(len(sheet)))
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+def test_ranking_is_bm25_with_ties_in_sheet_order(sheet, engine_class):
+    # SKU7 has "cable" three times (organiser row plus the "Cables" sub category);
+    # SKU1 and SKU2 twice, and SKU1's text is shorter
+    assert sheet.loc[sheet.index[engine_class(sheet).rank("cable")], "Part Number"].tolist() == [
+        "SKU7", "SKU1", "SKU2"]
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+def test_ranking_keeps_sheet_order_for_equal_scores(engine_class):
+    df = pd.DataFrame({
+        "Description": ["red cable", "blue cable", "green cable"],
+        "Category": ["x", "x", "x"],
+        "Sub Category": ["y", "y", "y"],
+    })
+    assert engine_class(df).rank("cable").tolist() == [0, 1, 2]
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+def test_empty_sheet(engine_class):
+    df = pd.DataFrame({"Description": [], "Category": [], "Sub Category": []})
+    engine = engine_class(df)
+    assert engine.search("cable").size == 0
+    assert engine.rank("cable").size == 0
+
+
+@pytest.fixture(scope="module")
+def excel_api():
+    from bot import ExcelAPI
+    return ExcelAPI()
+
+
+@pytest.mark.parametrize("engine_class", ENGINES)
+@pytest.mark.parametrize("page_number, expected", [
+    (1, ["SKU7", "SKU1"]),
+    (2, ["SKU2"]),
+    (3, []),
+])
+def test_results_are_paged_in_rank_order(sheet, excel_api, engine_class, page_number, expected):
+    results, total = excel_api.search_products(
+        sheet, "cable", engine=engine_class(sheet), page_number=page_number, page_size=2)
+    assert total == 3
+    assert results["Part Number"].tolist() == expected
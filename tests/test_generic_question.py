@@ -0,0 +1,53 @@
+import asyncio
+
+from botbuilder.schema import ActivityTypes
+
+import bot as bot_module
+
+
+class FakeTurnContext:
+    def __init__(self):
+        self.sent = []
+
+    async def send_activity(self, activity):
+        self.sent.append(activity)
+
+    @property
+    def typing(self):
+        return sum(getattr(activity, "type", None) == ActivityTypes.typing for activity in self.sent)
+
+
+def test_identical_questions_share_one_completion_and_each_caller_sees_typing(monkeypatch):
+    monkeypatch.setattr(bot_module.CONFIG, "TYPING_INTERVAL", 0.01)
+    bot = bot_module.IngramMicroBot()
+    completions = []
+
+    async def complete(system_message, question):
+        completions.append(question)
+        await asyncio.sleep(0.05)
+        return "Wi-Fi 7 is the latest standard."
+
+    monkeypatch.setattr(bot, "_complete", complete)
+    first, second = FakeTurnContext(), FakeTurnContext()
+
+    async def main():
+        answers = await asyncio.gather(
+            bot.handle_generic_question(first, "What is Wi-Fi 7?"),
+            bot.handle_generic_question(second, "what is wi-fi 7"))
+        typing = first.typing, second.typing
+        await asyncio.sleep(0.03)  # Indicators stop once the answer is in
+        assert (first.typing, second.typing) == typing
+        return answers
+
+    answers = asyncio.run(main())
+    assert len(completions) == 1
+    assert answers[0] == answers[1] and answers[0].startswith("Wi-Fi 7 is the latest standard.")
+    assert first.typing >= 2 and second.typing >= 2
+
+
+def test_cached_answer_sends_no_typing(monkeypatch):
+    bot = bot_module.IngramMicroBot()
+    bot.answer_cache.set(bot_module.normalize_question("What is Wi-Fi 7?"), "cached")
+    turn_context = FakeTurnContext()
+    assert asyncio.run(bot.handle_generic_question(turn_context, "What is Wi-Fi 7?")) == "cached"
+    assert turn_context.sent == []
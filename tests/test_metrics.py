@@ -0,0 +1,87 @@
+import pytest
+
+from metrics import Registry, stats_families, track, STAGE_ERRORS, STAGE_IN_FLIGHT, STAGE_LATENCY
+
+
+def parse(text):
+    """{(sample name, labels text): value} for each sample line of the text format."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        sample, value = line.rsplit(" ", 1)
+        name, _, labels = sample.partition("{")
+        samples[(name, labels.rstrip("}"))] = value
+    return samples
+
+
+def test_counter_and_gauge_text_format():
+    registry = Registry()
+    requests = registry.counter("app_requests", "Requests handled.", ["route"])
+    in_flight = registry.gauge("app_in_flight", "Requests in flight.")
+    requests.inc(route="/api/messages")
+    requests.inc(2, route="/api/messages")
+    requests.inc(route='say "hi"\n')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    text = registry.render()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert lines[:2] == ["# HELP app_requests Requests handled.", "# TYPE app_requests counter"]
+    assert 'app_requests_total{route="/api/messages"} 3' in lines
+    assert 'app_requests_total{route="say \\"hi\\"\\n"} 1' in lines
+    assert "# TYPE app_in_flight gauge" in lines
+    assert "app_in_flight 1" in lines
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("app_latency_seconds", "Latency.", ["stage"], buckets=(0.1, 0.5, 1.0))
+    for value in (0.05, 0.1, 0.3, 0.7, 5.0):
+        latency.observe(value, stage="search")
+
+    samples = parse(registry.render())
+    buckets = {le: samples[("app_latency_seconds_bucket", f'stage="search",le="{le}"')]
+               for le in ("0.1", "0.5", "1.0", "+Inf")}
+    assert buckets == {"0.1": "2", "0.5": "3", "1.0": "4", "+Inf": "5"}
+    assert samples[("app_latency_seconds_count", 'stage="search"')] == "5"
+    assert float(samples[("app_latency_seconds_sum", 'stage="search"')]) == pytest.approx(6.15)
+
+
+def test_registering_a_name_twice_returns_the_same_metric():
+    registry = Registry()
+    assert registry.counter("app_requests", "Requests.") is registry.counter("app_requests", "Requests.")
+
+
+def test_collectors_are_read_at_render_time():
+    registry = Registry()
+    stats = {"hits": 1, "misses": 0, "enabled": True, "name": "not a number"}
+    registry.register_collector(lambda: stats_families("app_cache", "cache", {"search": stats}, "Cache"))
+    stats["hits"] = 5
+
+    text = registry.render()
+    assert 'app_cache_hits{cache="search"} 5' in text
+    assert 'app_cache_enabled{cache="search"} 1' in text
+    assert "app_cache_name" not in text
+    assert "# TYPE app_cache_hits gauge" in text
+
+
+def sample(metric, stage, suffix=""):
+    for name, labels, value in metric.collect():
+        if name == metric.name + suffix and labels.get("stage") == stage and "le" not in labels:
+            return value
+    return 0
+
+
+def test_track_records_latency_errors_and_in_flight():
+    with track("test_stage"):
+        assert sample(STAGE_IN_FLIGHT, "test_stage") == 1
+    with pytest.raises(ValueError):
+        with track("test_stage"):
+            raise ValueError("failed")
+
+    assert sample(STAGE_IN_FLIGHT, "test_stage") == 0
+    assert sample(STAGE_LATENCY, "test_stage", "_count") == 2
+    assert sample(STAGE_ERRORS, "test_stage", "_total") == 1
@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from pa_cache import PriceAvailabilityCache
+
+
+class FakeUpstream:
+    """Records each batch it is asked for and answers with one entry per part number."""
+
+    def __init__(self, latency=0.01, error=None, with_part_numbers=True):
+        self.latency = latency
+        self.error = error
+        self.with_part_numbers = with_part_numbers
+        self.batches = []
+
+    async def __call__(self, part_numbers):
+        self.batches.append(list(part_numbers))
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return [SimpleNamespace(ingram_part_number=part_number if self.with_part_numbers else None,
+                                source=part_number)
+                for part_number in part_numbers]
+
+
+def make_cache(fetch, **kwargs):
+    kwargs.setdefault("batch_window", 0.01)
+    return PriceAvailabilityCache(fetch, customer_number="C1", country_code="US", ttl=60, maxsize=100, **kwargs)
+
+
+def test_misses_in_one_window_are_batched():
+    upstream = FakeUpstream()
+    cache = make_cache(upstream, max_batch_size=3)
+
+    async def main():
+        return await asyncio.gather(*(cache.get(part_number) for part_number in "ABCDE"))
+
+    results = asyncio.run(main())
+    assert [info.ingram_part_number for info in results] == list("ABCDE")
+    assert upstream.batches == [["A", "B", "C"], ["D", "E"]]
+    assert cache.stats()["batches"] == 2
+
+
+def test_concurrent_lookups_of_a_part_share_one_fetch():
+    upstream = FakeUpstream(latency=0.05)
+    cache = make_cache(upstream)
+
+    async def main():
+        first = asyncio.ensure_future(cache.get_many(["abc", "DEF"]))
+        await asyncio.sleep(0.02)  # The batch is in flight now
+        second = await cache.get_many(["ABC", "GHI"])
+        return await first, second
+
+    first, second = asyncio.run(main())
+    assert first[0] is second[0]
+    assert upstream.batches == [["ABC", "DEF"], ["GHI"]]
+
+
+def test_hits_are_served_from_the_cache():
+    upstream = FakeUpstream()
+    cache = make_cache(upstream)
+
+    async def main():
+        await cache.get("A")
+        return await cache.get_many(["a", "A"])
+
+    results = asyncio.run(main())
+    assert [info.source for info in results] == ["A", "A"]
+    assert upstream.batches == [["A"]]
+
+
+def test_batch_size_sends_early():
+    upstream = FakeUpstream()
+    # A window this long would make the test slow if the batch waited for it
+    cache = make_cache(upstream, batch_window=5, max_batch_size=50)
+
+    async def main():
+        return await asyncio.wait_for(cache.get_many(["A", "B", "C", "D"], batch_size=2), 1)
+
+    asyncio.run(main())
+    assert upstream.batches == [["A", "B"], ["C", "D"]]
+
+
+def test_entries_without_part_numbers_are_matched_by_position():
+    cache = make_cache(FakeUpstream(with_part_numbers=False))
+    results = asyncio.run(cache.get_many(["A", "B"]))
+    assert [info.source for info in results] == ["A", "B"]
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    upstream = FakeUpstream(error=RuntimeError("upstream down"))
+    cache = make_cache(upstream)
+
+    async def main():
+        results = await asyncio.gather(cache.get("A"), cache.get("B"), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        upstream.error = None
+        return await cache.get("A")
+
+    assert asyncio.run(main()).source == "A"
+    assert upstream.batches == [["A", "B"], ["A"]]
+    assert cache.stats()["in_flight"] == 0
+
+
+def test_unknown_part_numbers_are_none():
+    async def fetch(part_numbers):
+        return []
+
+    assert asyncio.run(make_cache(fetch).get_many(["A"])) == [None]
+
+
+@pytest.mark.parametrize("cancel_after", [0.0, 0.02])
+def test_a_cancelled_waiter_does_not_cancel_the_batch(cancel_after):
+    upstream = FakeUpstream(latency=0.05)
+    cache = make_cache(upstream)
+
+    async def main():
+        cancelled = asyncio.ensure_future(cache.get("A"))
+        other = asyncio.ensure_future(cache.get("A"))
+        await asyncio.sleep(cancel_after)
+        cancelled.cancel()
+        return await other
+
+    assert asyncio.run(main()).source == "A"
+    assert upstream.batches == [["A"]]
@@ -0,0 +1,147 @@
+import asyncio
+import io
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from botbuilder.schema import Activity, Attachment, ConversationAccount
+
+from price_availability import (
+    TEAMS_FILE_DOWNLOAD_INFO, can_send_files, file_consent_card, is_allowed_file_url, parse_part_numbers,
+    part_numbers_attachment, read_part_numbers_file
+)
+
+
+def test_parse_part_numbers():
+    assert parse_part_numbers("abc123, DEF456;ghi789\n\tABC123") == ["ABC123", "DEF456", "GHI789"]
+    assert parse_part_numbers("") == []
+
+
+@pytest.mark.parametrize("content, expected", [
+    # One part number per line, with or without a header
+    (b"Part Number\nABC123\nDEF456\n", ["ABC123", "DEF456"]),
+    (b"ABC123\nDEF456\n", ["ABC123", "DEF456"]),
+    (b"ABC123\n", ["ABC123"]),
+    (b"ABC123\r\n\r\nDEF456", ["ABC123", "DEF456"]),
+    (b"", []),
+    # Several columns: the part number column is found by its header
+    (b"Description,Ingram Part Number,Vendor Part\nDock,A1,V1\nCable,B2,V2\n", ["A1", "B2"]),
+    (b"\xef\xbb\xbfSKU;Qty\nA1;2\nB2;3\n", ["A1", "B2"]),
+    (b"a1\t2\nb2\t3\n", ["A1", "B2"]),
+])
+def test_read_csv(content, expected):
+    assert read_part_numbers_file("parts.csv", content) == expected
+
+
+def test_read_xlsx():
+    buffer = io.BytesIO()
+    pd.DataFrame({"Name": ["Dock", "Cable"], "SKU": ["a1", "b2"]}).to_excel(buffer, index=False)
+    assert read_part_numbers_file("parts.xlsx", buffer.getvalue()) == ["A1", "B2"]
+
+
+HOSTS = ("sharepoint.com",)
+
+
+def download_info(name, url, content_type=TEAMS_FILE_DOWNLOAD_INFO):
+    return Attachment(content_type=content_type, name=name, content={"downloadUrl": url, "fileType": "csv"})
+
+
+@pytest.mark.parametrize("url, allowed", [
+    ("https://contoso.sharepoint.com/_layouts/15/download.aspx?tempauth=x", True),
+    ("https://sharepoint.com/file.csv", True),
+    ("http://contoso.sharepoint.com/file.csv", False),
+    ("https://sharepoint.com.example.net/file.csv", False),
+    ("https://evilsharepoint.com/file.csv", False),
+    ("https://169.254.169.254/latest/meta-data", False),
+    ("file:///etc/passwd", False),
+    ("", False),
+    (None, False),
+])
+def test_is_allowed_file_url(url, allowed):
+    assert is_allowed_file_url(url, HOSTS) is allowed
+
+
+def test_part_numbers_attachment():
+    url = "https://contoso.sharepoint.com/download.aspx?tempauth=x"
+    assert part_numbers_attachment([download_info("parts.csv", url)], HOSTS) == ("parts.csv", url)
+    # Unsupported types, other hosts and plain content URLs are ignored
+    assert part_numbers_attachment([download_info("parts.xls", url)], HOSTS) is None
+    assert part_numbers_attachment([download_info("parts.csv", "http://10.0.0.1/parts.csv")], HOSTS) is None
+    assert part_numbers_attachment(
+        [Attachment(content_type="text/csv", name="parts.csv", content_url="https://contoso.sharepoint.com/p.csv")],
+        HOSTS) is None
+    assert part_numbers_attachment(None, HOSTS) is None
+
+
+def test_can_send_files():
+    personal = Activity(channel_id="msteams", conversation=ConversationAccount(id="c", conversation_type="personal"))
+    group = Activity(channel_id="msteams", conversation=ConversationAccount(id="c", conversation_type="groupChat"))
+    webchat = Activity(channel_id="webchat", conversation=ConversationAccount(id="c"))
+    assert can_send_files(personal)
+    assert not can_send_files(group)
+    assert not can_send_files(webchat)
+
+
+def test_file_consent_card_refers_to_the_stored_file():
+    card = file_consent_card("parts.csv", 1234, "file-1").serialize()
+    assert card["contentType"] == "application/vnd.microsoft.teams.card.file.consent"
+    assert card["content"]["sizeInBytes"] == 1234
+    assert card["content"]["acceptContext"] == {"file_id": "file-1"}
+
+
+class FakeTurnContext:
+    def __init__(self, activity):
+        self.activity = activity
+        self.sent = []
+
+    async def send_activity(self, activity):
+        self.sent.append(activity)
+
+
+def product(part_number, quantity):
+    return SimpleNamespace(
+        ingram_part_number=part_number, vendor_part_number="V" + part_number, description="Product " + part_number,
+        availability=SimpleNamespace(total_availability=quantity),
+        pricing=SimpleNamespace(currency_code="USD", customer_price=10.0, retail_price=12.5),
+    )
+
+
+def test_consent_accept_uploads_the_file_the_card_announced(monkeypatch):
+    import bot as bot_module
+    monkeypatch.setattr(bot_module.CONFIG, "PA_BULK_TABLE_ROWS", 2)
+    bot = bot_module.IngramMicroBot()
+    lookups = []
+
+    async def get_many(part_numbers, batch_size=None):
+        lookups.append(part_numbers)
+        # Stock changes with every lookup, which would change the CSV's length if it were rebuilt
+        return [product(part_number, 10 ** len(lookups)) for part_number in part_numbers]
+
+    monkeypatch.setattr(bot.pa_cache, "get_many", get_many)
+    uploads = []
+
+    async def upload_file(url, content, timeout):
+        uploads.append((url, content))
+
+    monkeypatch.setattr(bot_module, "upload_file", upload_file)
+    activity = Activity(channel_id="msteams", conversation=ConversationAccount(id="c1", conversation_type="personal"))
+    turn_context = FakeTurnContext(activity)
+    upload_info = SimpleNamespace(
+        upload_url="https://contoso-my.sharepoint.com/upload?tempauth=x", name="price_and_availability.csv",
+        content_url="https://contoso-my.sharepoint.com/file.csv", unique_id="u1", file_type="csv")
+
+    async def main():
+        await bot.get_bulk_price_and_availability(turn_context, ["A1", "B2", "C3"])
+        card = turn_context.sent[0].attachments[0].content
+        answer = SimpleNamespace(upload_info=upload_info, context=card.accept_context)
+        await bot.on_teams_file_consent_accept(turn_context, answer)
+        await bot.on_teams_file_consent_accept(turn_context, answer)
+        return card
+
+    card = asyncio.run(main())
+    assert len(lookups) == 1 and len(uploads) == 1
+    assert len(uploads[0][1]) == card.size_in_bytes
+    assert b"A1" in uploads[0][1] and b"C3" in uploads[0][1]
+    assert turn_context.sent[1].attachments[0].content_type == "application/vnd.microsoft.teams.card.file.info"
+    # The file is only kept until it has been uploaded
+    assert "no longer available" in turn_context.sent[2]
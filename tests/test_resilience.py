@@ -0,0 +1,319 @@
+import asyncio
+
+import pytest
+
+from resilience import AdaptiveLimiter, Dependency, Hedge, Overloaded, TokenBucket, retry_after, status_of
+
+
+class UpstreamError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.headers = headers
+
+
+def test_limit_is_halved_on_overload_and_grows_back_on_success():
+    limiter = AdaptiveLimiter(8, name="test")
+
+    async def main():
+        for _ in range(3):
+            await limiter.acquire(1)
+        limiter.release(0.1, overloaded=True)
+        limiter.release(0.1, overloaded=True)  # At most one decrease per second
+        assert limiter.limit == 4
+        limiter.release(0.1)
+        assert limiter.limit == 4.25
+
+    asyncio.run(main())
+
+
+def test_limit_stays_within_bounds():
+    limiter = AdaptiveLimiter(2, min_limit=1)
+    limiter.in_flight = 2
+    limiter.release(0.1)
+    assert limiter.limit == 2
+    limiter.release(0.1, overloaded=True)
+    limiter._last_decrease = 0
+    limiter.in_flight = 1
+    limiter.release(0.1, overloaded=True)
+    assert limiter.limit == 1
+
+
+def test_released_slot_is_handed_to_the_next_waiter():
+    limiter = AdaptiveLimiter(1)
+
+    async def main():
+        await limiter.acquire(1)
+        waiter = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        limiter.release(0.01)
+        await waiter
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_waiter_that_times_out_is_shed_without_taking_a_slot():
+    limiter = AdaptiveLimiter(1)
+
+    async def main():
+        await limiter.acquire(1)
+        with pytest.raises(Overloaded):
+            await limiter.acquire(0.05)
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+        limiter.release(0.01)
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
+
+
+def test_waiter_cancelled_before_the_hand_off_is_skipped():
+    limiter = AdaptiveLimiter(1)
+
+    async def main():
+        await limiter.acquire(1)
+        first = asyncio.ensure_future(limiter.acquire(1))
+        second = asyncio.ensure_future(limiter.acquire(1))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        limiter.release(0.01)
+        await second
+        assert first.cancelled()
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_waiter_cancelled_after_the_hand_off_does_not_leak_the_slot():
+    limiter = AdaptiveLimiter(1)
+
+    async def main():
+        await limiter.acquire(1)
+        first = asyncio.ensure_future(limiter.acquire(1))
+        second = asyncio.ensure_future(limiter.acquire(0.2))
+        await asyncio.sleep(0)
+        limiter.release(0.01)  # Hands the slot to `first`...
+        first.cancel()  # ...which is cancelled before it gets to run
+        results = await asyncio.gather(first, second, return_exceptions=True)
+        # Python 3.11's wait_for can swallow a cancellation that races the
+        # result, so either waiter may end up with the slot, but only one does
+        holders = sum(result is None for result in results)
+        assert holders == 1
+        assert (limiter.in_flight, limiter.waiting) == (1, 0)
+
+    asyncio.run(main())
+
+
+def test_call_is_shed_when_the_expected_wait_exceeds_the_budget():
+    limiter = AdaptiveLimiter(1)
+    limiter.latency = 1.0
+
+    async def main():
+        await limiter.acquire(1)
+        with pytest.raises(Overloaded, match="expected wait"):
+            await limiter.acquire(0.5)
+        assert limiter.waiting == 0
+
+    asyncio.run(main())
+
+
+def test_token_bucket_sheds_calls_over_the_rate():
+    bucket = TokenBucket(rate=1, burst=1)
+
+    async def main():
+        await bucket.acquire(0.1)
+        with pytest.raises(Overloaded, match="rate limit"):
+            await bucket.acquire(0.1)
+        # The shed call's reservation is given back
+        assert bucket.tokens == pytest.approx(0, abs=0.05)
+
+    asyncio.run(main())
+
+
+def test_token_bucket_with_rate_zero_is_disabled():
+    bucket = TokenBucket(rate=0)
+
+    async def main():
+        for _ in range(100):
+            await bucket.acquire(0)
+
+    asyncio.run(main())
+
+
+def test_error_status_and_retry_after():
+    assert status_of(UpstreamError("503")) == 503
+    assert status_of(ValueError()) is None
+    assert retry_after(UpstreamError(429, {"Retry-After": "2"})) == 2
+    assert retry_after(UpstreamError(429, {"Retry-After": "soon"})) is None
+
+
+def make_dependency(**kwargs):
+    kwargs.setdefault("retries", 2)
+    kwargs.setdefault("backoff_base", 0.001)
+    kwargs.setdefault("backoff_cap", 1)
+    kwargs.setdefault("queue_budget", 1)
+    return Dependency("test", max_concurrency=4, **kwargs)
+
+
+class Flaky:
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, value):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return value
+
+
+def test_server_errors_are_retried():
+    dependency = make_dependency()
+    func = Flaky(UpstreamError(503), UpstreamError(500))
+    assert asyncio.run(dependency.call(func, "ok")) == "ok"
+    assert (func.calls, dependency.retried, dependency.overloads) == (3, 2, 1)
+    assert dependency.limiter.in_flight == 0
+    assert dependency.limiter.limit < 4
+
+
+def test_retries_are_limited():
+    dependency = make_dependency(retries=1)
+    func = Flaky(UpstreamError(429), UpstreamError(429), UpstreamError(429))
+    with pytest.raises(UpstreamError):
+        asyncio.run(dependency.call(func, "ok"))
+    assert func.calls == 2
+
+
+@pytest.mark.parametrize("error", [UpstreamError(400), UpstreamError(404), ValueError("bad")])
+def test_client_errors_are_not_retried(error):
+    dependency = make_dependency()
+    func = Flaky(error)
+    with pytest.raises(type(error)):
+        asyncio.run(dependency.call(func, "ok"))
+    assert (func.calls, dependency.retried) == (1, 0)
+    assert dependency.limiter.in_flight == 0
+
+
+def test_retry_after_longer_than_the_cap_is_not_waited_for():
+    dependency = make_dependency()
+    func = Flaky(UpstreamError(429, {"Retry-After": "30"}))
+    with pytest.raises(UpstreamError):
+        asyncio.run(dependency.call(func, "ok"))
+    assert func.calls == 1
+
+
+def test_dependency_sheds_calls_it_cannot_admit_in_time():
+    dependency = Dependency("test", max_concurrency=1, queue_budget=0.05, retries=0)
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def slow():
+            await gate.wait()
+            return "slow"
+
+        first = asyncio.ensure_future(dependency.call(slow))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await dependency.call(slow)
+        gate.set()
+        return await first
+
+    assert asyncio.run(main()) == "slow"
+    assert dependency.stats()["shed"] == 1
+    assert dependency.limiter.in_flight == 0
+
+
+class Attempts:
+    """Each call sleeps for the next (latency, error) outcome, then raises the error if there is one."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        latency, error = self.outcomes[self.started]
+        self.started += 1
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if error is not None:
+            raise error
+        return self.started
+
+
+def make_hedge(samples=10, **kwargs):
+    kwargs.setdefault("quantile", 0.9)
+    kwargs.setdefault("min_delay", 0.02)
+    kwargs.setdefault("max_ratio", 1)
+    hedge = Hedge("test", min_samples=samples, **kwargs)
+    hedge.latencies.extend([0.02] * samples)
+    return hedge
+
+
+def test_nothing_is_hedged_before_enough_latencies_are_known():
+    hedge = Hedge("test", min_delay=0.01, max_ratio=1, min_samples=5)
+    hedge.latencies.extend([0.01] * 4)
+    attempts = Attempts((0.1, None))
+    assert asyncio.run(hedge.call(attempts)) == 1
+    assert (attempts.started, hedge.hedged) == (1, 0)
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled():
+    hedge = make_hedge()
+    attempts = Attempts((1, None), (0.01, None))
+    assert asyncio.run(asyncio.wait_for(hedge.call(attempts), 0.5)) == 2
+    assert (attempts.started, attempts.cancelled) == (2, 1)
+    assert hedge.stats()["hedge_wins"] == 1
+    # The winner's own latency is recorded, not the time since the first attempt
+    assert hedge.latencies[-1] < 0.02
+
+
+def test_fast_call_is_not_hedged():
+    hedge = make_hedge()
+    attempts = Attempts((0.001, None))
+    assert asyncio.run(hedge.call(attempts)) == 1
+    assert (attempts.started, hedge.hedged) == (1, 0)
+
+
+def test_hedge_success_beats_a_failed_first_attempt():
+    hedge = make_hedge()
+    attempts = Attempts((0.05, RuntimeError("first")), (0.1, None))
+    assert asyncio.run(hedge.call(attempts)) == 2
+
+
+def test_error_is_raised_when_both_attempts_fail():
+    hedge = make_hedge()
+    attempts = Attempts((0.05, RuntimeError("first")), (0.01, RuntimeError("hedge")))
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedge.call(attempts))
+    assert attempts.started == 2
+
+
+def test_hedged_share_of_calls_is_capped():
+    hedge = make_hedge(max_ratio=0.5)
+
+    async def main():
+        for _ in range(4):
+            await hedge.call(Attempts((0.05, None), (0.01, None)))
+
+    asyncio.run(main())
+    assert (hedge.calls, hedge.hedged) == (4, 2)
+
+
+def test_cancelling_the_caller_cancels_every_attempt():
+    hedge = make_hedge()
+    attempts = Attempts((1, None), (1, None))
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedge.call(attempts), 0.1)
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert (attempts.started, attempts.cancelled) == (2, 2)
@@ -0,0 +1,45 @@
+import pytest
+
+from router import CommandRouter
+
+
+async def fallback(turn_context, argument):
+    return "fallback"
+
+
+async def handler(turn_context, argument):
+    return "handler"
+
+
+@pytest.fixture
+def router():
+    router = CommandRouter(fallback, fallback_name="generic_question")
+    router.prefix("price and availability for", "price_and_availability", handler)
+    router.exact("price and availability", "price_and_availability", handler)
+    router.prefix("search for available ", "search_available", handler)
+    router.prefix("search for product ", "search_product", handler)
+    router.prefix("search for ", "generic_search", handler)
+    router.exact("next", "next", handler)
+    return router
+
+
+@pytest.mark.parametrize("text, name, argument", [
+    ("next", "next", ""),
+    ("  NEXT ", "next", ""),
+    ("search for product laptop", "search_product", "laptop"),
+    ("Search For Available USB-C Dock", "search_available", "USB-C Dock"),
+    ("search for anything else", "generic_search", "anything else"),
+    # A prefix registered with a trailing space needs an argument
+    ("search for product", "generic_search", "product"),
+    ("search for productivity tips", "generic_search", "productivity tips"),
+    ("price and availability for ABC123", "price_and_availability", "ABC123"),
+    ("price and availability for\nABC123\nDEF456", "price_and_availability", "ABC123\nDEF456"),
+    ("price and availability for", "price_and_availability", ""),
+    ("price and availability", "price_and_availability", ""),
+    ("price and availability forward", "generic_question", "price and availability forward"),
+    ("searching for x", "generic_question", "searching for x"),
+    ("", "generic_question", ""),
+])
+def test_match(router, text, name, argument):
+    matched_name, _, matched_argument = router.match(text)
+    assert (matched_name, matched_argument) == (name, argument)
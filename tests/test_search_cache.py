@@ -0,0 +1,163 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from search_cache import AvailableProductSearch, SearchPage, SearchPageCache
+
+
+class FakeCatalog:
+    """`size` products; product i is in stock when `in_stock(i)` is true.
+
+    Logs "search N" and "price N" events so tests can check the order calls
+    overlap in.
+    """
+
+    def __init__(self, size, in_stock=lambda i: i % 2 == 0, latency=0.01):
+        self.size = size
+        self.in_stock = in_stock
+        self.latency = latency
+        self.events = []
+        self.searched = []
+        self.price_error = None
+
+    async def search(self, page_number, page_size):
+        self.searched.append(page_number)
+        self.events.append(f"search {page_number} start")
+        await asyncio.sleep(self.latency)
+        self.events.append(f"search {page_number} end")
+        start = (page_number - 1) * page_size
+        return [SimpleNamespace(ingram_part_number=f"P{i:03d}") for i in range(start, min(start + page_size, self.size))]
+
+    async def price_and_availability(self, part_numbers, batch_size):
+        assert len(part_numbers) <= batch_size
+        self.events.append(f"price {part_numbers[0]} start")
+        await asyncio.sleep(self.latency)
+        if self.price_error is not None:
+            raise self.price_error
+        return [SimpleNamespace(availability=SimpleNamespace(total_availability=5 if self.in_stock(int(p[1:])) else 0))
+                for p in part_numbers]
+
+
+def make_search(catalog, catalog_page_size=10, batch_size=5, max_catalog_pages=10):
+    return AvailableProductSearch(catalog.search, catalog.price_and_availability,
+                                  catalog_page_size, batch_size, max_catalog_pages)
+
+
+def part_numbers(page):
+    return [product.ingram_part_number for product, _ in page.products]
+
+
+def test_only_in_stock_products_are_returned_in_catalog_order():
+    catalog = FakeCatalog(100)
+    search = make_search(catalog)
+
+    async def main():
+        return await search.page(1, 5), await search.page(2, 5)
+
+    first, second = asyncio.run(main())
+    assert part_numbers(first) == ["P000", "P002", "P004", "P006", "P008"]
+    assert part_numbers(second) == ["P010", "P012", "P014", "P016", "P018"]
+    assert first.found and first.has_more
+
+
+def test_next_catalog_page_is_fetched_while_the_current_one_is_priced():
+    catalog = FakeCatalog(100)
+    search = make_search(catalog)
+    asyncio.run(search.page(1, 5))
+    assert catalog.events.index("search 2 start") < catalog.events.index("price P000 start")
+    assert catalog.events.index("search 2 start") < catalog.events.index("price P005 start")
+
+
+def test_read_ahead_page_is_used_by_the_next_read():
+    catalog = FakeCatalog(100)
+    search = make_search(catalog)
+
+    async def main():
+        await search.page(1, 5)
+        await search.page(2, 5)
+
+    asyncio.run(main())
+    # Result page 2 needs an 11th product to know a page 3 exists
+    assert search.catalog_pages == 3
+    # Each catalog page was fetched once, by the read-ahead; page 4 is the next one
+    assert catalog.searched == [1, 2, 3, 4]
+
+
+def test_pricing_failure_retries_the_same_catalog_page():
+    catalog = FakeCatalog(100)
+    search = make_search(catalog)
+    catalog.price_error = RuntimeError("price and availability down")
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await search.page(1, 5)
+        assert (search.catalog_pages, search.products) == (0, [])
+        catalog.price_error = None
+        return await search.page(1, 5)
+
+    page = asyncio.run(main())
+    assert part_numbers(page)[0] == "P000"
+    assert catalog.searched[0] == 1 and catalog.searched.count(1) == 2
+
+
+def test_short_catalog_page_ends_the_search():
+    catalog = FakeCatalog(13)
+    search = make_search(catalog)
+
+    async def main():
+        return await search.page(1, 5), await search.page(2, 5)
+
+    first, second = asyncio.run(main())
+    assert part_numbers(first) == ["P000", "P002", "P004", "P006", "P008"]
+    assert part_numbers(second) == ["P010", "P012"]
+    assert first.has_more and not second.has_more
+    assert search.exhausted and catalog.searched == [1, 2]
+
+
+def test_empty_catalog_is_not_found():
+    catalog = FakeCatalog(0)
+    page = asyncio.run(make_search(catalog).page(1, 5))
+    assert page == SearchPage(products=[], found=False, has_more=False)
+
+
+def test_empty_page_after_a_full_one_ends_the_search():
+    catalog = FakeCatalog(10)
+    search = make_search(catalog)
+    page = asyncio.run(search.page(1, 5))
+    assert part_numbers(page) == ["P000", "P002", "P004", "P006", "P008"]
+    assert page.found and not page.has_more
+    assert catalog.searched == [1, 2]
+
+
+def test_catalog_pages_read_per_request_are_capped():
+    catalog = FakeCatalog(1000, in_stock=lambda i: i >= 500)
+    search = make_search(catalog, max_catalog_pages=3)
+    page = asyncio.run(search.page(1, 5))
+    assert page.products == []
+    assert page.found and page.has_more
+    assert search.catalog_pages == 3
+
+
+def test_search_pages_are_cached_and_shared():
+    calls = []
+
+    async def fetch(search_term, only_available, page_number):
+        calls.append((search_term, only_available, page_number))
+        await asyncio.sleep(0.01)
+        return SearchPage(products=[page_number], found=True, has_more=True)
+
+    cache = SearchPageCache(fetch, ttl=60, maxsize=10)
+
+    async def main():
+        first, second = await asyncio.gather(cache.get_page("Laptop", False, 1), cache.get_page("laptop ", False, 1))
+        cache.prefetch("laptop", False, 2)
+        cache.prefetch("laptop", False, 2)
+        await asyncio.sleep(0.05)
+        return first, second, await cache.get_page("laptop", False, 2)
+
+    first, second, prefetched = asyncio.run(main())
+    assert first is second
+    assert prefetched.products == [2]
+    assert calls == [("Laptop", False, 1), ("laptop", False, 2)]
+    assert cache.stats()["prefetches"] == 1
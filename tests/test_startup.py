@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from excel_snapshot import ExcelSnapshot
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "pandas", "pyarrow", "openai", "openpyxl")
+
+
+def test_heavy_modules_are_not_imported_with_the_app():
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, app; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"],
+        capture_output=True, text=True, cwd=ROOT, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_snapshot_round_trips(tmp_path):
+    pytest.importorskip("pyarrow")
+    snapshot = ExcelSnapshot(directory=str(tmp_path / "snapshots"))
+    df = pd.DataFrame({"Part Number": ["SKU1", "SKU2"], "Description": ["Cable", None], "Qty": ["5", 7]})
+    assert snapshot.save(df, etag="v1")
+    assert snapshot.load(etag="v2") is None
+
+    loaded = snapshot.load(etag="v1")
+    assert loaded["Part Number"].tolist() == ["SKU1", "SKU2"]
+    # Mixed text and numbers are kept as text
+    assert loaded["Qty"].tolist() == ["5", "7"]
+    assert snapshot.read_metadata()["rows"] == 2
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+from token_manager import SharedTokenStore, TokenManager
+
+
+class FakeTokenEndpoint:
+    def __init__(self, expires_in=3600, latency=0.01):
+        self.expires_in = expires_in
+        self.latency = latency
+        self.error = None
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.error is not None:
+            raise self.error
+        return f"token-{self.calls}", self.expires_in
+
+
+def test_concurrent_callers_share_one_fetch():
+    endpoint = FakeTokenEndpoint()
+    refreshed = []
+    manager = TokenManager(endpoint, refresh_margin=60, on_refresh=refreshed.append)
+
+    async def main():
+        try:
+            return await asyncio.gather(*(manager.get_token() for _ in range(5)))
+        finally:
+            manager.close()
+
+    assert asyncio.run(main()) == ["token-1"] * 5
+    assert endpoint.calls == 1
+    assert refreshed == ["token-1"]
+    assert manager.stats()["coalesced"] == 4
+
+
+def test_token_is_reused_until_the_refresh_margin():
+    endpoint = FakeTokenEndpoint()
+    manager = TokenManager(endpoint, refresh_margin=60)
+
+    async def main():
+        try:
+            first = await manager.get_token()
+            return first, await manager.get_token()
+        finally:
+            manager.close()
+
+    assert asyncio.run(main()) == ("token-1", "token-1")
+    assert endpoint.calls == 1
+
+
+def test_token_is_renewed_in_the_background_before_it_expires():
+    # The margin is capped at half the lifetime, so this refreshes after 0.5s
+    endpoint = FakeTokenEndpoint(expires_in=1)
+    manager = TokenManager(endpoint, refresh_margin=60)
+
+    async def main():
+        try:
+            assert await manager.get_token() == "token-1"
+            await asyncio.sleep(0.6)
+            return manager.access_token
+        finally:
+            manager.close()
+
+    assert asyncio.run(main()) == "token-2"
+    assert manager.stats()["refreshes"] == 2
+
+
+def test_caller_inside_the_margin_gets_the_current_token_without_waiting():
+    endpoint = FakeTokenEndpoint(latency=0.2)
+    manager = TokenManager(endpoint, refresh_margin=60)
+
+    async def main():
+        try:
+            await manager.get_token()
+            manager.refresh_at = time.time() - 1  # Inside the margin, not yet expired
+            start = time.perf_counter()
+            token = await manager.get_token()
+            elapsed = time.perf_counter() - start
+            await manager._refresh_task
+            return token, elapsed, manager.access_token
+        finally:
+            manager.close()
+
+    token, elapsed, renewed = asyncio.run(main())
+    assert (token, renewed) == ("token-1", "token-2")
+    assert elapsed < 0.1
+    assert manager.stats()["background_refreshes"] == 1
+
+
+def test_failed_refresh_raises_and_the_next_call_retries():
+    endpoint = FakeTokenEndpoint()
+    endpoint.error = RuntimeError("token endpoint down")
+    manager = TokenManager(endpoint, refresh_margin=60)
+
+    async def main():
+        try:
+            with pytest.raises(RuntimeError):
+                await manager.get_token()
+            endpoint.error = None
+            return await manager.get_token()
+        finally:
+            manager.close()
+
+    assert asyncio.run(main()) == "token-2"
+    assert manager.stats()["failures"] == 1
+
+
+def test_workers_share_the_token_through_the_store(tmp_path):
+    path = str(tmp_path / "ingram_token.json")
+    endpoint = FakeTokenEndpoint()
+    first = TokenManager(endpoint, refresh_margin=60, store=SharedTokenStore(path))
+    second = TokenManager(endpoint, refresh_margin=60, store=SharedTokenStore(path))
+
+    async def main():
+        try:
+            return await first.get_token(), await second.get_token()
+        finally:
+            first.close()
+            second.close()
+
+    assert asyncio.run(main()) == ("token-1", "token-1")
+    assert endpoint.calls == 1
+    assert second.stats()["shared_reuses"] == 1
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from turn_queue import TurnQueue
+
+
+def recorder(log, name, latency=0.0):
+    async def turn():
+        log.append(f"{name} start")
+        await asyncio.sleep(latency)
+        log.append(f"{name} end")
+    return turn
+
+
+def test_turns_of_one_conversation_run_in_order():
+    queue = TurnQueue(maxsize=10, workers=4)
+    log = []
+
+    async def main():
+        # The search is slow and "next" fast; with free workers "next" would otherwise finish first
+        assert queue.submit(recorder(log, "search", 0.05), key="conversation-1")
+        assert queue.submit(recorder(log, "next"), key="conversation-1")
+        await queue.stop()
+
+    asyncio.run(main())
+    assert log == ["search start", "search end", "next start", "next end"]
+    assert queue.stats()["processed"] == 2
+
+
+def test_conversations_run_side_by_side():
+    queue = TurnQueue(maxsize=10, workers=4)
+    log = []
+
+    async def main():
+        queue.submit(recorder(log, "a", 0.05), key="conversation-1")
+        queue.submit(recorder(log, "b", 0.01), key="conversation-2")
+        queue.submit(recorder(log, "c"))
+        await queue.stop()
+
+    asyncio.run(main())
+    assert log.index("b end") < log.index("a end")
+    assert log.index("c end") < log.index("a end")
+
+
+def test_a_failed_turn_does_not_block_the_conversation():
+    queue = TurnQueue(maxsize=10, workers=2)
+    log = []
+
+    async def fail():
+        raise RuntimeError("turn failed")
+
+    async def main():
+        queue.submit(fail, key="conversation-1")
+        queue.submit(recorder(log, "next"), key="conversation-1")
+        await queue.stop()
+
+    asyncio.run(main())
+    assert log == ["next start", "next end"]
+    assert (queue.failed, queue.processed) == (1, 1)
+
+
+def test_full_queue_rejects_turns():
+    queue = TurnQueue(maxsize=2, workers=1)
+    log = []
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def blocked():
+            await gate.wait()
+
+        assert queue.submit(blocked)
+        await asyncio.sleep(0)  # The worker takes it, freeing its queue slot
+        assert queue.submit(recorder(log, "a"), key="conversation-1")
+        assert queue.submit(recorder(log, "b"), key="conversation-2")
+        assert not queue.submit(recorder(log, "c"))
+        # Turns waiting behind their conversation count against the size too
+        assert not queue.submit(recorder(log, "d"), key="conversation-1")
+        assert queue.stats()["depth"] == 2
+        gate.set()
+        await queue.stop()
+
+    asyncio.run(main())
+    assert queue.rejected == 2
+    assert log == ["a start", "a end", "b start", "b end"]
+
+
+def test_stop_drains_queued_turns():
+    queue = TurnQueue(maxsize=10, workers=2)
+    log = []
+
+    async def main():
+        for i in range(5):
+            queue.submit(recorder(log, f"turn {i}", 0.01), key=f"conversation-{i % 2}")
+        await queue.stop(timeout=1)
+
+    asyncio.run(main())
+    assert sorted(entry for entry in log if entry.endswith("end")) == [f"turn {i} end" for i in range(5)]
+    assert queue.stats()["depth"] == 0 and queue.processed == 5
+
+
+def test_stop_gives_up_after_the_drain_timeout():
+    queue = TurnQueue(maxsize=10, workers=1)
+
+    async def main():
+        async def stuck():
+            await asyncio.sleep(10)
+
+        queue.submit(stuck)
+        await asyncio.wait_for(queue.stop(timeout=0.05), 1)
+
+    asyncio.run(main())
+    assert queue.processed == 0
+
+
+@pytest.fixture
+def apollobot(monkeypatch):
+    import app as apollobot
+
+    async def authenticate(activity, auth_header):
+        return None
+
+    monkeypatch.setattr(apollobot, "authenticate", authenticate)
+    monkeypatch.setattr(apollobot.CONFIG, "ASYNC_TURNS", True)
+    return apollobot
+
+
+def test_messages_endpoint_answers_503_when_the_queue_is_full(apollobot, monkeypatch):
+    queue = TurnQueue(maxsize=1, workers=1)
+    monkeypatch.setattr(apollobot, "TURN_QUEUE", queue)
+    processed = []
+    gate = asyncio.Event()
+
+    async def process_queued_turn(activity, identity):
+        processed.append(activity.text)
+        await gate.wait()
+
+    monkeypatch.setattr(apollobot, "process_queued_turn", process_queued_turn)
+    client = apollobot.app.test_client()
+
+    async def post(text, conversation_id):
+        response = await client.post("/api/messages", json={
+            "type": "message", "text": text, "channelId": "msteams", "serviceUrl": "https://example.invalid/",
+            "conversation": {"id": conversation_id}, "from": {"id": "user"}, "recipient": {"id": "bot"},
+        })
+        return response.status_code, response.headers.get("Retry-After")
+
+    async def main():
+        # The worker is busy with the first turn and the second fills the queue
+        statuses = [await post("search for laptop", "conversation-1"), await post("next", "conversation-1"),
+                    await post("hello", "conversation-2")]
+        gate.set()
+        await queue.stop(timeout=1)
+        return statuses
+
+    assert asyncio.run(main()) == [(202, None), (202, None), (503, "1")]
+    assert processed == ["search for laptop", "next"]
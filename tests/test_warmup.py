@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+from warmup import WarmUp
+
+
+class Step:
+    """A warm-up step that fails its first `failures` attempts."""
+
+    def __init__(self, latency=0.01, failures=0):
+        self.latency = latency
+        self.failures = failures
+        self.attempts = 0
+
+    async def __call__(self):
+        self.attempts += 1
+        await asyncio.sleep(self.latency)
+        if self.attempts <= self.failures:
+            raise RuntimeError("upstream down")
+
+
+def test_ready_once_every_step_succeeded():
+    became_ready = []
+    warmup = WarmUp({"token": Step(), "catalog": Step(latency=0.05)}, timeout=1,
+                    on_ready=lambda: became_ready.append(True))
+
+    async def main():
+        task = warmup.start()
+        await asyncio.sleep(0.03)
+        assert not warmup.ready
+        assert warmup.results["token"]["state"] == "done"
+        await task
+
+    asyncio.run(main())
+    assert warmup.ready and became_ready == [True]
+    assert warmup.status()["steps"]["catalog"]["state"] == "done"
+
+
+def test_failed_step_keeps_the_instance_not_ready_until_a_retry_succeeds():
+    token = Step(failures=2)
+    warmup = WarmUp({"token": token, "catalog": Step()}, timeout=1, retry_interval=0.02)
+
+    async def main():
+        task = warmup.start()
+        await asyncio.sleep(0.015)
+        assert not warmup.ready
+        assert warmup.results["token"]["state"] == "failed"
+        assert "upstream down" in warmup.results["token"]["error"]
+        await task
+        warmup.stop()
+
+    asyncio.run(main())
+    assert warmup.ready
+    assert token.attempts == 3
+    assert warmup.results["token"]["attempts"] == 3
+
+
+def test_run_returns_after_the_timeout_without_becoming_ready():
+    warmup = WarmUp({"token": Step(failures=1000)}, timeout=0.05, retry_interval=0.01)
+
+    async def main():
+        await asyncio.wait_for(warmup.run(), 1)
+        ready = warmup.ready
+        warmup.stop()
+        return ready
+
+    assert asyncio.run(main()) is False
+    assert warmup.status()["ready"] is False
+
+
+@pytest.fixture
+def apollobot(monkeypatch):
+    import app as apollobot
+    monkeypatch.setattr(apollobot.CONFIG, "WARMUP", True)
+    return apollobot
+
+
+def test_ready_endpoint_follows_the_warm_up(apollobot, monkeypatch):
+    token = Step(failures=1)
+    warmup = WarmUp({"token": token}, timeout=1, retry_interval=0.05)
+    monkeypatch.setattr(apollobot, "WARMUP", warmup)
+    client = apollobot.app.test_client()
+
+    async def ready():
+        response = await client.get("/ready")
+        return response.status_code, json.loads(await response.get_data())
+
+    async def main():
+        assert (await ready())[0] == 503
+        warmup.start()
+        await asyncio.sleep(0.02)
+        status, body = await ready()
+        assert status == 503 and body["steps"]["token"]["state"] == "failed"
+        await asyncio.sleep(0.1)
+        status, body = await ready()
+        assert status == 200 and body["ready"]
+        warmup.stop()
+
+    asyncio.run(main())
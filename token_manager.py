@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from config import CONFIG
+from file_lock import FileLock
+from shared_state import ensure_private_directory
+
+logger = logging.getLogger(__name__)
+
+
+class SharedTokenStore:
+    """The current access token in a file, so all workers on a host use one token."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = FileLock(path + ".lock")
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            return data["access_token"], float(data["expires_at"])
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def write(self, access_token, expires_at):
+        directory = os.path.dirname(self.path) or "."
+        ensure_private_directory(directory)
+        # mkstemp creates the file readable by this user only
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": access_token, "expires_at": expires_at}, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class TokenManager:
+    """Caches an OAuth access token and refreshes it once for all callers.
+
+    `fetch` is an async callable returning `(access_token, expires_in)`.
+    Concurrent callers share a single in-flight refresh, and the token is
+    renewed in the background `refresh_margin` seconds before it expires so
+    no request has to wait on the token endpoint. With a SharedTokenStore,
+    the worker that refreshes first writes the token for the others.
+    """
+
+    def __init__(self, fetch, refresh_margin=CONFIG.TOKEN_REFRESH_MARGIN, on_refresh=None, name="ingram",
+                 store=None):
+        self.fetch = fetch
+        self.store = store
+        self.refresh_margin = refresh_margin
+        self.on_refresh = on_refresh
+        self.name = name
+        self.access_token = None
+        self.expires_at = 0
+        self.refresh_at = 0
+        self._refresh_task = None
+        self._timer = None
+        self.metrics = {
+            "refreshes": 0,
+            "failures": 0,
+            "coalesced": 0,
+            "shared_reuses": 0,
+            "background_refreshes": 0,
+            "last_refresh_seconds": None,
+            "max_refresh_seconds": 0.0,
+            "total_refresh_seconds": 0.0,
+            "last_refreshed_at": None,
+        }
+
+    async def get_token(self):
+        now = time.time()
+        if self.access_token and now < self.refresh_at:
+            return self.access_token
+        if self.access_token and now < self.expires_at:
+            # Inside the safety margin: renew without making this caller wait
+            self._start_refresh(background=True)
+            return self.access_token
+        return await self.refresh()
+
+    async def refresh(self):
+        task = self._start_refresh()
+        return await asyncio.shield(task)
+
+    def _start_refresh(self, background=False):
+        if self._refresh_task is not None:
+            self.metrics["coalesced"] += 1
+            return self._refresh_task
+        if background:
+            self.metrics["background_refreshes"] += 1
+        self._refresh_task = asyncio.ensure_future(self._refresh())
+        self._refresh_task.add_done_callback(self._refresh_done)
+        return self._refresh_task
+
+    async def _refresh(self):
+        start = time.perf_counter()
+        try:
+            if self.store is not None:
+                access_token, expires_at = await self._fetch_shared()
+            else:
+                access_token, expires_in = await self.fetch()
+                expires_at = time.time() + int(expires_in)
+        except Exception:
+            self.metrics["failures"] += 1
+            self._schedule_retry()
+            raise
+        elapsed = time.perf_counter() - start
+
+        now = time.time()
+        # Short-lived tokens would otherwise be refreshed on every call
+        margin = min(self.refresh_margin, (expires_at - now) / 2)
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.refresh_at = self.expires_at - margin
+
+        self.metrics["refreshes"] += 1
+        self.metrics["last_refresh_seconds"] = elapsed
+        self.metrics["max_refresh_seconds"] = max(self.metrics["max_refresh_seconds"], elapsed)
+        self.metrics["total_refresh_seconds"] += elapsed
+        self.metrics["last_refreshed_at"] = now
+        logger.debug(f"New {self.name} access token obtained in {elapsed:.3f}s. Expires at {int(self.expires_at)}")
+
+        if self.on_refresh:
+            self.on_refresh(access_token)
+        self._schedule(self.refresh_at - now)
+        return access_token
+
+    async def _fetch_shared(self):
+        async with self.store.lock:
+            # Another worker may have renewed the token while this one waited
+            access_token, expires_at = self.store.read()
+            if (access_token and access_token != self.access_token
+                    and expires_at - time.time() > self.refresh_margin):
+                self.metrics["shared_reuses"] += 1
+                return access_token, expires_at
+
+            access_token, expires_in = await self.fetch()
+            expires_at = time.time() + int(expires_in)
+            self.store.write(access_token, expires_at)
+            return access_token, expires_at
+
+    def _refresh_done(self, task):
+        self._refresh_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to refresh {self.name} access token: {task.exception()}")
+
+    def _schedule(self, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timer = loop.call_later(max(delay, 0), self._start_refresh, True)
+
+    def _schedule_retry(self):
+        # Keep retrying in the background while the current token is still usable
+        remaining = self.expires_at - time.time()
+        if self.access_token and remaining > 0:
+            self._schedule(min(30, remaining / 2))
+
+    def stats(self):
+        stats = dict(self.metrics)
+        stats["expires_in"] = max(self.expires_at - time.time(), 0) if self.access_token else 0
+        stats["refresh_in_flight"] = self._refresh_task is not None
+        return stats
+
+    def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+from config import CONFIG
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "apollobot_turn_queue_wait_seconds", "Time acknowledged turns waited for a worker.")
+
+
+class TurnQueue:
+    """Bounded in-process queue of turns, run by a fixed pool of workers.
+
+    `submit` never waits: when the queue is full the turn is rejected and the
+    caller answers 503, so the channel retries later instead of the backlog
+    growing without bound. The queue and workers are created on first use so
+    they bind to the serving event loop.
+
+    Turns submitted with the same `key` (the conversation id) run one at a
+    time in arrival order: "next" must not page a search that hasn't run
+    yet. A later turn waits behind the conversation's queued or running one,
+    and the worker that finishes a turn goes on with that conversation's
+    next, so waiting turns don't tie up other workers.
+    """
+
+    def __init__(self, maxsize=CONFIG.TURN_QUEUE_SIZE, workers=CONFIG.TURN_QUEUE_WORKERS):
+        self.maxsize = maxsize
+        self.worker_count = workers
+        self._queue = None
+        self._workers = []
+        self._pending = {}  # key -> turns waiting behind that key's queued or running turn
+        self._held = 0
+        self.busy = 0
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.ensure_future(self._work()) for _ in range(self.worker_count)]
+            logger.info(f"Turn queue started with {self.worker_count} workers")
+
+    @property
+    def depth(self):
+        return (self._queue.qsize() if self._queue is not None else 0) + self._held
+
+    def submit(self, turn, key=None):
+        """Queue `turn`, a coroutine function taking no arguments. False if the queue is full.
+
+        Turns with the same non-None `key` run in the order they were submitted.
+        """
+        self.start()
+        # Turns held behind their conversation count too, so the check isn't left to the queue
+        if self.depth >= self.maxsize:
+            self.rejected += 1
+            return False
+        item = (time.perf_counter(), key, turn)
+        if key is not None and key in self._pending:
+            self._pending[key].append(item)
+            self._held += 1
+        else:
+            self._queue.put_nowait(item)
+            if key is not None:
+                self._pending[key] = deque()
+        self.enqueued += 1
+        return True
+
+    async def _work(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                while item is not None:
+                    await self._run(*item)
+                    item = self._next(item[1])
+            finally:
+                self._queue.task_done()
+
+    def _next(self, key):
+        """The key's next waiting turn, or None once it has none left."""
+        if key is None:
+            return None
+        pending = self._pending[key]
+        if not pending:
+            del self._pending[key]
+            return None
+        self._held -= 1
+        return pending.popleft()
+
+    async def _run(self, enqueued_at, key, turn):
+        QUEUE_WAIT.observe(time.perf_counter() - enqueued_at)
+        self.busy += 1
+        try:
+            await turn()
+            self.processed += 1
+        except Exception as e:
+            self.failed += 1
+            logger.error(f"Error processing queued turn: {str(e)}")
+        finally:
+            self.busy -= 1
+
+    async def stop(self, timeout=CONFIG.TURN_QUEUE_DRAIN_TIMEOUT):
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Turn queue not drained at shutdown; {self.depth} turns dropped")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._queue = None
+        self._workers = []
+        self._pending = {}
+        self._held = 0
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "maxsize": self.maxsize,
+            "workers": self.worker_count,
+            "busy": self.busy,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+from config import CONFIG
+from metrics import track
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUp:
+    """Runs the expensive startup steps concurrently and reports readiness.
+
+    `steps` maps a name to a coroutine function taking no arguments. The
+    instance becomes ready once every step has succeeded. A failed step is
+    retried every `retry_interval` seconds in the background, and until it
+    succeeds the instance stays not ready, so the load balancer keeps
+    traffic on warm instances. `run` returns after `timeout` seconds even if
+    steps are still going; they carry on in the background.
+    """
+
+    def __init__(self, steps, timeout, retry_interval=CONFIG.WARMUP_RETRY_INTERVAL, on_ready=None):
+        self.steps = steps
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.on_ready = on_ready
+        self.results = {name: {"state": "pending"} for name in steps}
+        self.started_at = None
+        self.finished_at = None
+        self._task = None
+        self._step_tasks = []
+
+    @property
+    def ready(self):
+        return self.finished_at is not None
+
+    def start(self):
+        """Run in the background; `ready` turns True once every step succeeded."""
+        if self._task is None:
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def stop(self):
+        for task in [self._task, *self._step_tasks]:
+            if task is not None and not task.done():
+                task.cancel()
+
+    async def _step(self, name, step):
+        attempts = 0
+        while True:
+            attempts += 1
+            self.results[name] = {"state": "running", "attempts": attempts}
+            start = time.perf_counter()
+            try:
+                with track(f"warmup_{name}"):
+                    await step()
+                self.results[name] = {"state": "done", "seconds": round(time.perf_counter() - start, 3),
+                                      "attempts": attempts}
+                self._step_done()
+                return
+            except Exception as e:
+                self.results[name] = {"state": "failed", "seconds": round(time.perf_counter() - start, 3),
+                                      "attempts": attempts, "error": str(e)}
+                logger.error(f"Warm-up step {name} failed: {str(e)}; retrying in {self.retry_interval}s")
+            await asyncio.sleep(self.retry_interval)
+
+    def _step_done(self):
+        if self.ready or any(result["state"] != "done" for result in self.results.values()):
+            return
+        self.finished_at = time.time()
+        logger.info(f"Warm-up finished in {self.finished_at - self.started_at:.2f}s: "
+                    + ", ".join(f"{name} {result['seconds']}s" for name, result in self.results.items()))
+        if self.on_ready:
+            self.on_ready()
+
+    async def run(self):
+        """Start the steps and wait for them, at most `timeout` seconds."""
+        self.started_at = time.time()
+        self._step_tasks = [asyncio.ensure_future(self._step(name, step)) for name, step in self.steps.items()]
+        if not self._step_tasks:
+            self._step_done()
+            return
+        await asyncio.wait(self._step_tasks, timeout=self.timeout)
+        for name, result in self.results.items():
+            if result["state"] != "done":
+                # Left going; the instance reports ready once it succeeds
+                logger.warning(f"Warm-up step {name} not done within {self.timeout}s ({result['state']})")
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "seconds": (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+            "steps": self.results,
+        }